@@ -1,23 +1,126 @@
 # api/server/app.py
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any
 
 import os
-import vertexai
-from fastapi import FastAPI, Depends, Query
+import json
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from vertexai.generative_models import GenerativeModel, GenerationConfig
 
 from auth import dev_auth
-from retriever import search, inspect_neighbors
-from planner import pick_model
+import retriever
+from retriever import search, search_many, inspect_neighbors
+import planner
+from planner import pick_model, DOMAIN_REGISTRY
+import limits
+import cache
+import clients
+import packing
+import metrics
+import resilience
+import rerank
+import tiering
+import prompts
+from chunker import count_tokens
 
-# ---- Vertex init (project/region) ----
-vertexai.init(project=os.getenv("GCP_PROJECT", "teja-sunhack"),
-              location=os.getenv("GCP_LOCATION", "us-central1"))
+log = logging.getLogger("org-rag.app")
 
-app = FastAPI(title="org-rag", version="0.1.0")
+# ---- Startup: Vertex configured once, model handles built and warmed ----
+# STARTUP_MODE:
+#   background  serve right away (/health is live), warm up in a task; /ready flips when done
+#   eager       warm up before accepting traffic (slower cold start, no cold first request)
+#   lazy        no warmup; SDK, clients and index are built by the first request that needs them
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background").lower()
+WARMUP_TIMEOUT_S = float(os.getenv("WARMUP_TIMEOUT_S", "10"))
+WARMUP_ATTEMPTS = int(os.getenv("WARMUP_ATTEMPTS", "3"))
+
+async def _warmup(app: FastAPI):
+    t0 = time.perf_counter()
+    for attempt in range(1, WARMUP_ATTEMPTS + 1):
+        try:
+            # The SDK import + vertexai.init is the slow part of a cold start; keep it off the loop
+            await asyncio.to_thread(clients.init)
+            # Answer handles carry their domain's prompt prefix: warm the ones requests will use
+            # (this also starts any context-cache creation before traffic arrives)
+            answer_models = {r["model_id"] for r in DOMAIN_REGISTRY.values()} | {tiering.TIER_BASE_MODEL, tiering.TIER_TOP_MODEL}
+            prefixed = [(f"generate:{m}:{d}",
+                         lambda m=m, d=d: prompts.bind("answer", m, domain=d).model.count_tokens_async("ping"))
+                        for m in sorted(answer_models) for d in DOMAIN_REGISTRY]
+            report = await clients.warmup(
+                generative_ids=[planner.PLANNER_MODEL_ID],
+                embed_ids=[retriever.EMBED_MODEL],
+                extra=[("ann", retriever.warmup)] + prefixed,
+                timeout_s=WARMUP_TIMEOUT_S,
+            )
+            break
+        except Exception as e:
+            log.exception("startup warmup failed (attempt %d/%d)", attempt, WARMUP_ATTEMPTS)
+            report = {"warmup": f"error: {type(e).__name__}: {e}"}
+            if attempt < WARMUP_ATTEMPTS:
+                await asyncio.sleep(2 ** attempt)
+    # Ready even after a partial or failed warmup: requests still build what they need on
+    # demand, and a 503 here would keep a working instance out of rotation until a restart
+    report["failed"] = sorted(k for k, v in report.items() if isinstance(v, str) and v.startswith("error"))
+    report["total"] = round((time.perf_counter() - t0) * 1000, 1)
+    app.state.warmup = report
+    app.state.ready = True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = STARTUP_MODE == "lazy"
+    app.state.warmup = {}
+    task = None
+    lag_monitor = asyncio.create_task(limits.ADMISSION.monitor())
+    if STARTUP_MODE == "eager":
+        await _warmup(app)
+    elif STARTUP_MODE == "background":
+        task = asyncio.create_task(_warmup(app))
+    try:
+        yield
+    finally:
+        lag_monitor.cancel()
+        if task is not None and not task.done():
+            task.cancel()
+
+app = FastAPI(title="org-rag", version="0.1.0", lifespan=lifespan)
+
+# ---- Metrics: GET /metrics (Prometheus text) + optional Server-Timing header on responses ----
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+
+# ---- Semantic answer cache (near-duplicate questions within the same domain/clearance/grounding) ----
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "1") == "1"
+answer_cache = cache.SemanticCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.97")),
+    maxsize=int(os.getenv("ANSWER_CACHE_SIZE", "2048")),
+    ttl_s=float(os.getenv("ANSWER_CACHE_TTL_S", "900")),
+)
+
+# ---- Admission: a saturated worker answers 429 up front instead of queueing more work ----
+ADMIT_PATHS = ("/query",)
+
+class AdmissionMiddleware:
+    # Plain ASGI (not @app.middleware): the slot is held until a streamed response ends
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(ADMIT_PATHS):
+            return await self.app(scope, receive, send)
+        if not limits.ADMISSION.try_enter():
+            resp = JSONResponse(status_code=429, headers={"Retry-After": str(limits.ADMISSION.retry_after_s)},
+                                content={"detail": "Server is at capacity, retry shortly"})
+            return await resp(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limits.ADMISSION.exit()
+
+app.add_middleware(AdmissionMiddleware)
 
 # ---- CORS (so a simple static page can call the API) ----
 app.add_middleware(
@@ -26,45 +129,266 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],  # lets the Console read the per-stage breakdown
 )
 
+# ---- Backpressure: a full dependency queue sheds load instead of stacking latency ----
+@app.exception_handler(limits.Overloaded)
+async def overloaded_handler(request: Request, exc: limits.Overloaded):
+    return JSONResponse(status_code=503, headers={"Retry-After": "1"},
+                        content={"detail": f"Busy ({exc.name}), retry shortly"})
+
+# ---- Resilience: an open breaker fails fast, a blown deadline is a gateway timeout ----
+@app.exception_handler(resilience.CircuitOpen)
+async def circuit_open_handler(request: Request, exc: resilience.CircuitOpen):
+    return JSONResponse(status_code=503, headers={"Retry-After": str(max(1, round(exc.retry_after_s)))},
+                        content={"detail": f"{exc.name} is unavailable, retry shortly"})
+
+@app.exception_handler(resilience.DeadlineExceeded)
+async def deadline_handler(request: Request, exc: resilience.DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": f"{exc.name} timed out"})
+
 class QueryIn(BaseModel):
     query: str
 
+class BatchIn(BaseModel):
+    queries: List[str]
+
+# ---- Request plumbing: stage timings + cancel on client disconnect ----
+class ClientDisconnected(Exception):
+    pass
+
+async def _timed(timings: Dict[str, float], stage: str, aw):
+    t0 = time.perf_counter()
+    try:
+        return await aw
+    finally:
+        timings[f"{stage}_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+async def _wait_disconnect(request: Request, poll_s: float = 0.1):
+    while not await request.is_disconnected():
+        await asyncio.sleep(poll_s)
+
+async def _until_disconnect(request: Request, aw):
+    """Await `aw`, cancelling it (and everything it gathers) if the client goes away first."""
+    work = asyncio.ensure_future(aw)
+    watcher = asyncio.ensure_future(_wait_disconnect(request))
+    try:
+        await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if not work.done():
+        work.cancel()
+        await asyncio.gather(work, return_exceptions=True)
+        raise ClientDisconnected()
+    return work.result()
+
+# ---- Retrieval for the prompt: with RERANK=1, over-fetch and let rerank.py pick fewer, better chunks ----
+RETRIEVE_K = 8
+
+async def _retrieve(q: str, user: Dict[str, Any], timings: Dict[str, float]) -> List[Dict[str, Any]]:
+    if not rerank.RERANK:
+        return await search(q, user["domain"], user["clearance"], k=RETRIEVE_K)
+    candidates = await search(q, user["domain"], user["clearance"], k=rerank.RERANK_FETCH_K)
+    return await _timed(timings, "rerank", retriever.rerank_items(q, candidates, k=RETRIEVE_K))
+
+async def _retrieve_many(qs: List[str], user: Dict[str, Any], timings: Dict[str, float]) -> List[Any]:
+    k = rerank.RERANK_FETCH_K if rerank.RERANK else RETRIEVE_K
+    found = await search_many([(q, user["domain"], user["clearance"]) for q in qs], k=k)
+    if not rerank.RERANK:
+        return found
+
+    async def _one(q: str, chunks):
+        return chunks if isinstance(chunks, Exception) else await retriever.rerank_items(q, chunks, k=RETRIEVE_K)
+    return await _timed(timings, "rerank", asyncio.gather(*(_one(q, c) for q, c in zip(qs, found))))
+
 def build_prompt(chunks: List[Dict[str, Any]], user_domain: str, q: str) -> str:
+    with metrics.STAGE_SECONDS.time("build_prompt"):
+        return _build_prompt(chunks, user_domain, q)
+
+def _build_prompt(chunks: List[Dict[str, Any]], user_domain: str, q: str) -> str:
+    # The per-request suffix only; the domain instructions are the "answer" template's static
+    # prefix, which prompts.bind attaches to the model handle (see _generate).
+    # `chunks` is already packed to the token budget (see _pack); indices match the citations
     if not chunks:
         context = "(no domain-approved documents were retrieved)"
     else:
-        trimmed = []
-        for c in chunks[:6]:
-            t = (c.get("text") or "").strip()
-            if len(t) > 1500:
-                t = t[:1500] + " …"
-            trimmed.append(t)
-        context = "\n\n".join(f"[{i+1}] {t}" for i, t in enumerate(trimmed))
+        context = "\n\n".join(f"[{i+1}] {(c.get('text') or '').strip()}" for i, c in enumerate(chunks))
+    return prompts.suffix("answer", context=context, question=q)
 
-    return f"""You are the {user_domain} domain assistant for an internal org.
-Use ONLY the provided context when possible. If the answer isn't in the context, say you don't have that information.
-Cite sources as [#] where # is the chunk index.
+def _route_params(route: Dict[str, Any]):
+    return (route.get("model_id", "gemini-2.5-pro"),
+            float(route.get("temperature", 0.2)),
+            int(route.get("max_output_tokens", 1536)))
 
-Context:
-{context}
+def _route_out(route: Dict[str, Any]) -> Dict[str, Any]:
+    model_id, temperature, max_tokens = _route_params(route)
+    out = {"model_id": model_id, "temperature": temperature, "max_output_tokens": max_tokens}
+    if route.get("tier"):
+        out["tier"] = route["tier"]  # why this model / budget (tiering.py)
+    if route.get("fallback_from"):
+        out["fallback_from"] = route["fallback_from"]  # planned model's breaker was open
+    return out
 
-User question: {q}
+def _pack(chunks: List[Dict[str, Any]], user_domain: str, q: str,
+          model_id: str, max_tokens: int) -> packing.Packed:
+    fixed = prompts.prefix_tokens("answer", domain=user_domain) + count_tokens(build_prompt([], user_domain, q))
+    return packing.pack(chunks, packing.context_budget(model_id, max_tokens, fixed))
 
-Answer with clear, concise steps and include citations."""
+def _citations(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    citations = []
+    for i, c in enumerate(chunks, start=1):
+        citations.append({
+            "index": i,
+            "doc_id": c.get("doc_id"),
+            "section": c.get("section"),
+            "distance": c.get("distance"),
+            **({"rerank": c["rerank"]} if "rerank" in c else {}),
+        })
+    return citations
+
+def _text_of(resp) -> str:
+    # Streaming chunks (e.g. the final one carrying finish_reason) may have no parts
+    try:
+        return resp.candidates[0].content.parts[0].text or ""
+    except (AttributeError, IndexError, TypeError):
+        return ""
+
+def _record_tokens(model_id: str, user_domain: str, prompt: str, text: str, usage=None):
+    # Vertex reports exact counts in usage_metadata; estimate locally when it's missing
+    # (the static prefix is part of the prompt wherever it was sent from)
+    prompt_tokens = (getattr(usage, "prompt_token_count", 0)
+                     or prompts.prefix_tokens("answer", domain=user_domain) + count_tokens(prompt))
+    output_tokens = getattr(usage, "candidates_token_count", 0) or count_tokens(text)
+    metrics.TOKENS.inc(model_id, "prompt", amount=prompt_tokens)
+    metrics.TOKENS.inc(model_id, "output", amount=output_tokens)
+    cached_tokens = getattr(usage, "cached_content_token_count", 0)
+    if cached_tokens:  # served from a context cache (included in "prompt", billed at the cached rate)
+        metrics.TOKENS.inc(model_id, "cached", amount=cached_tokens)
+    metrics.PROMPT_TOKENS.observe(prompt_tokens, model_id)
+
+async def _generate(model_id: str, user_domain: str, prompt: str, cfg):
+    bound = prompts.bind("answer", model_id, domain=user_domain)
+    contents = bound.contents(prompt)
+
+    async def _call():
+        async with limits.GENERATE:
+            return await bound.model.generate_content_async(contents, generation_config=cfg)
+    # GENERATE_TIMEOUT_MS deadline + per-model breaker (not hedged: generation isn't free to repeat)
+    with metrics.STAGE_SECONDS.time("generate"):
+        resp = await resilience.generate(model_id).call(_call)
+    _record_tokens(model_id, user_domain, prompt, _text_of(resp), getattr(resp, "usage_metadata", None))
+    return resp
+
+def _finish(response: Response, endpoint: str, timings: Dict[str, float], t0: float, cached: bool):
+    timings["total_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    metrics.REQUEST_SECONDS.observe(timings["total_ms"] / 1000, endpoint, "1" if cached else "0")
+    if SERVER_TIMING and response is not None:
+        response.headers["Server-Timing"] = metrics.server_timing(timings)
+
+async def _answer_slot(q: str, user: Dict[str, Any], chunks: List[Dict[str, Any]]):
+    """(partition, query vector) for the answer cache, or None when caching doesn't apply."""
+    if not ANSWER_CACHE or not chunks:
+        return None
+    if all(c.get("distance") is None for c in chunks):
+        # Lexical-only hits: the vector side failed or timed out, don't wait on the embedder again
+        return None
+    try:
+        vec = await retriever.embed_query(q)  # served by the embedding cache: search() just embedded q
+    except Exception as e:
+        # Best-effort: a failing embedder must not fail a request retrieval already answered
+        log.warning("answer cache skipped: query embedding failed (%s)", type(e).__name__)
+        return None
+    part = cache.SemanticCache.partition(user["domain"], user["clearance"],
+                                         [c.get("datapoint_id") for c in chunks])
+    return part, vec
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 @app.get("/health")
 def health():
+    # Liveness only: never touches Vertex, answers as soon as the process is up
     return {"status": "ok"}
 
+@app.get("/ready")
+def ready(request: Request):
+    state = request.app.state
+    if not getattr(state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "warming", "mode": STARTUP_MODE})
+    return {"status": "ready", "mode": STARTUP_MODE, "warmup": getattr(state, "warmup", {})}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def _cache_events():
+    for name, st in (("embed", retriever.embed_cache.stats()), ("answers", answer_cache.stats()),
+                     ("planner", planner._plan_cache.stats())):
+        for result in ("hits", "shared_hits", "misses", "evictions"):
+            if result in st:
+                yield (name, result), st[result]
+
+metrics.CallbackGauge("rag_cache_events", "Cache lookups by outcome (monotonic)", ["cache", "result"], _cache_events)
+metrics.CallbackGauge("rag_cache_hit_ratio", "Cache hit ratio since start", ["cache"], lambda: [
+    (("embed",), retriever.embed_cache.stats()["hit_rate"]),
+    (("answers",), answer_cache.stats()["hit_rate"]),
+    (("planner",), planner._plan_cache.stats()["hit_rate"]),
+])
+metrics.CallbackGauge("rag_planner_decisions", "pick_model outcomes by path (monotonic)", ["source"],
+                      lambda: (((k,), v) for k, v in planner.planner_stats.items()))
+metrics.CallbackGauge("rag_dependency_calls", "Calls in flight / queued per dependency", ["dependency", "state"],
+                      lambda: (((name, k), st[k]) for name, st in limits.stats().items() for k in ("in_flight", "waiting")))
+metrics.CallbackGauge("rag_microbatch_avg_size", "Mean micro-batch size", ["batcher"],
+                      lambda: (((name, ), st["avg_batch"]) for name, st in retriever.batch_stats().items()))
+metrics.CallbackGauge("rag_rerank_events", "Rerank outcomes and candidate / kept chunk counts (monotonic)", ["event"],
+                      lambda: (((k,), v) for k, v in rerank.rerank_stats.items()))
+metrics.CallbackGauge("rag_admission", "Requests in flight / utilization / loop lag for this worker "
+                      "(autoscaling signal)", ["state"], lambda: (
+    ((k,), v) for k, v in limits.ADMISSION.stats().items() if k in ("in_flight", "utilization", "loop_lag_ms", "queue_ratio")))
+metrics.CallbackGauge("rag_admission_rejected", "Requests shed with 429, by reason (monotonic)", ["reason"],
+                      lambda: (((k,), v) for k, v in limits.ADMISSION.rejected.items()))
+metrics.CallbackGauge("rag_tier_decisions", "Model tier decisions by outcome (monotonic)", ["decision"],
+                      lambda: (((k,), v) for k, v in tiering.tier_stats.items()))
+metrics.CallbackGauge("rag_prompt_prefix", "How static prompt prefixes were sent, and context caches "
+                      "created / failed (monotonic)", ["kind"],
+                      lambda: (((k,), v) for k, v in prompts.prompt_stats.items()))
+metrics.CallbackGauge("rag_breaker_open", "1 while a dependency's circuit breaker is open or half-open", ["dependency"],
+                      lambda: (((name,), int(d.breaker.state != resilience.CLOSED))
+                               for name, d in resilience.all_dependencies().items()))
+
 @app.get("/debug/raw_chunks")
-def raw_chunks(q: str = Query(...), k: int = Query(5), user=Depends(dev_auth)):
+async def raw_chunks(q: str = Query(...), k: int = Query(5), user=Depends(dev_auth)):
     # dev_auth keeps this behind your header/API key guard
-    return inspect_neighbors(q, k=k)
+    return await inspect_neighbors(q, k=k)
+
+@app.get("/debug/cache_stats")
+def cache_stats(user=Depends(dev_auth)):
+    return {"embed": retriever.embed_cache.stats(), "answers": answer_cache.stats(),
+            "planner": {**planner.planner_stats, "llm_cache": planner._plan_cache.stats()}}
+
+@app.get("/debug/batch_stats")
+def batch_stats(user=Depends(dev_auth)):
+    # Micro-batcher batch-size histogram + queueing delay, for tuning *_MICROBATCH_WINDOW_MS
+    return retriever.batch_stats()
+
+@app.get("/debug/admission")
+def admission_stats(user=Depends(dev_auth)):
+    # This worker's admission state; in SERVE_MODE=workers each worker answers for itself
+    return {"pid": os.getpid(), **limits.ADMISSION.stats()}
+
+@app.get("/debug/resilience")
+def resilience_stats(user=Depends(dev_auth)):
+    # Deadlines, hedge delay / p95, timeouts, errors and breaker state per dependency
+    return resilience.stats()
+
+@app.post("/debug/cache/invalidate")
+def cache_invalidate(user=Depends(dev_auth)):
+    answer_cache.invalidate()
+    return {"status": "ok"}
 
 @app.post("/query")
-def query(body: QueryIn, user=Depends(dev_auth)):
+async def query(body: QueryIn, request: Request, response: Response, user=Depends(dev_auth)):
     q = body.query.strip()
     if not q:
         return {
@@ -75,40 +399,230 @@ def query(body: QueryIn, user=Depends(dev_auth)):
             "clearance": user["clearance"],
         }
 
-    # 1) Retrieve filtered chunks (domain + clearance enforced inside retriever)
-    chunks = search(q, user["domain"], user["clearance"], k=8)
+    timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    # 1+2) Retrieval (embed + ANN, domain/clearance enforced inside retriever) and the
+    #      planner don't depend on each other, so run them side by side.
+    retrieve = asyncio.ensure_future(_timed(timings, "retrieve", _retrieve(q, user, timings)))
+    plan = asyncio.ensure_future(_timed(timings, "plan", pick_model(user["domain"], q, embed=retriever.embed_query)))
+    try:
+        chunks = await _until_disconnect(request, retrieve)
 
-    # 2) Tiny planner picks model/params
-    route = pick_model(user["domain"], q)
-    model_id = route.get("model_id", "gemini-2.5-pro")
-    temperature = float(route.get("temperature", 0.2))
-    max_tokens = int(route.get("max_output_tokens", 1536))
+        # Near-duplicate of a question already answered from the same chunks for the same scope?
+        slot = await _answer_slot(q, user, chunks)
+        hit = answer_cache.get(*slot, version=retriever.index_version()) if slot else None
+        if hit is not None:
+            _finish(response, "query", timings, t0, cached=True)
+            return {**hit, "domain": user["domain"], "clearance": user["clearance"],
+                    "timings": timings, "cached": True}
 
-    # 3) LLM call
-    prompt = build_prompt(chunks, user["domain"], q)
-    model = GenerativeModel(model_id)
-    cfg = GenerationConfig(temperature=temperature, max_output_tokens=max_tokens)
-    resp = model.generate_content(prompt, generation_config=cfg)
-    text = resp.candidates[0].content.parts[0].text if resp and resp.candidates else "I couldn't generate a response."
+        route = planner.available_route(tiering.choose(await _until_disconnect(request, plan), q, chunks))
+        model_id, temperature, max_tokens = _route_params(route)
+        metrics.ROUTES.inc(model_id, user["domain"])
 
-    # 4) Simple citations
-    citations = []
-    for i, c in enumerate(chunks[:6], start=1):
-        citations.append({
-            "index": i,
-            "doc_id": c.get("doc_id"),
-            "section": c.get("section"),
-            "distance": c.get("distance"),
-        })
+        # 3) LLM call over the context packed for this route's budget
+        packed = _pack(chunks, user["domain"], q, model_id, max_tokens)
+        prompt = build_prompt(packed.chunks, user["domain"], q)
+        cfg = clients.generation_config(temperature, max_tokens)
+        resp = await _until_disconnect(request, _timed(timings, "generate", _generate(model_id, user["domain"], prompt, cfg)))
+    except ClientDisconnected:
+        # Nobody is listening any more; in-flight stages were cancelled above.
+        return Response(status_code=499)
+    finally:
+        plan.cancel()
+    text = _text_of(resp)
+
+    # 4) Citations = exactly the chunks that were sent
+    citations = _citations(packed.chunks)
+    route_out = _route_out(route)
+    if text and slot:
+        answer_cache.set(*slot, {"answer": text, "citations": citations, "route": route_out},
+                         version=retriever.index_version())
+    _finish(response, "query", timings, t0, cached=False)
 
     return {
-        "answer": text,
+        "answer": text or "I couldn't generate a response.",
         "citations": citations,
-        "route": {"model_id": model_id, "temperature": temperature, "max_output_tokens": max_tokens},
+        "route": route_out,
+        "domain": user["domain"],
+        "clearance": user["clearance"],
+        "timings": timings,
+        "context": {"tokens": packed.tokens, "chunks": len(packed.chunks), "dropped": packed.dropped},
+        "cached": False,
+    }
+
+# ---- Batch: eval jobs / bulk FAQ generation, one embedding + one ANN round trip per batch ----
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "64"))
+BATCH_GENERATE_CONCURRENCY = int(os.getenv("BATCH_GENERATE_CONCURRENCY", "8"))
+
+async def _batch_item(index: int, q: str, user: Dict[str, Any], chunks, plan, gen_slots: asyncio.Semaphore):
+    out: Dict[str, Any] = {"index": index, "query": q}
+    if isinstance(chunks, Exception):
+        return {**out, "error": f"Retrieval failed ({type(chunks).__name__})"}
+
+    slot = await _answer_slot(q, user, chunks)
+    hit = answer_cache.get(*slot, version=retriever.index_version()) if slot else None
+    if hit is not None:
+        return {**out, **hit, "cached": True}
+
+    route = planner.available_route(tiering.choose(await plan, q, chunks))
+    model_id, temperature, max_tokens = _route_params(route)
+    metrics.ROUTES.inc(model_id, user["domain"])
+    packed = _pack(chunks, user["domain"], q, model_id, max_tokens)
+    prompt = build_prompt(packed.chunks, user["domain"], q)
+    async with gen_slots:
+        resp = await _generate(model_id, user["domain"], prompt, clients.generation_config(temperature, max_tokens))
+    text = _text_of(resp)
+
+    citations = _citations(packed.chunks)
+    route_out = _route_out(route)
+    if text and slot:
+        answer_cache.set(*slot, {"answer": text, "citations": citations, "route": route_out},
+                         version=retriever.index_version())
+    return {**out, "answer": text or "I couldn't generate a response.", "citations": citations,
+            "route": route_out, "context": {"tokens": packed.tokens, "chunks": len(packed.chunks),
+                                            "dropped": packed.dropped}, "cached": False}
+
+async def _batch_item_safe(index: int, q: str, *args):
+    # One bad item (busy model, bad planner output, ...) never fails the whole batch
+    try:
+        return await _batch_item(index, q, *args)
+    except (limits.Overloaded, resilience.CircuitOpen) as e:
+        return {"index": index, "query": q, "error": f"Busy ({e.name}), retry shortly"}
+    except resilience.DeadlineExceeded as e:
+        return {"index": index, "query": q, "error": f"{e.name} timed out"}
+    except Exception as e:
+        log.exception("batch item %d failed", index)
+        return {"index": index, "query": q, "error": f"{type(e).__name__}"}
+
+@app.post("/query/batch")
+async def query_batch(body: BatchIn, response: Response, user=Depends(dev_auth)):
+    """
+    Many questions for the same user scope. Retrieval is batched (one embedding request,
+    one find_neighbors request for all queries); planning runs alongside it; generation
+    fans out at most BATCH_GENERATE_CONCURRENCY at a time. `results` keeps input order,
+    failed items carry `error` instead of `answer`.
+    """
+    if len(body.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+    timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    qs = [q.strip() for q in body.queries]
+    todo = [i for i, q in enumerate(qs) if q]
+
+    plans = {i: asyncio.ensure_future(pick_model(user["domain"], qs[i], embed=retriever.embed_query)) for i in todo}
+    try:
+        retrieved = await _timed(timings, "retrieve", _retrieve_many([qs[i] for i in todo], user, timings))
+        gen_slots = asyncio.Semaphore(BATCH_GENERATE_CONCURRENCY)
+        answered = await _timed(timings, "answer", asyncio.gather(*(
+            _batch_item_safe(i, qs[i], user, chunks, plans[i], gen_slots) for i, chunks in zip(todo, retrieved))))
+    finally:
+        for p in plans.values():
+            p.cancel()
+
+    results: List[Dict[str, Any]] = [{"index": i, "query": q, "answer": "Please provide a question.",
+                                      "citations": [], "route": {}} for i, q in enumerate(qs)]
+    for item in answered:
+        results[item["index"]] = item
+    _finish(response, "query_batch", timings, t0, cached=False)
+    return {
+        "results": results,
         "domain": user["domain"],
         "clearance": user["clearance"],
+        "timings": timings,
+        "errors": sum(1 for r in results if "error" in r),
     }
 
+@app.post("/query/stream")
+async def query_stream(body: QueryIn, user=Depends(dev_auth)):
+    """
+    Server-Sent Events variant of /query:
+      event: citations  → as soon as retrieval finishes (planner may still be running)
+      event: delta      → {"text": ...} token deltas from the model's streaming API
+      event: done       → route, timings, domain, clearance
+      event: error      → {"detail": ...} if something fails mid-stream
+    """
+    return StreamingResponse(
+        _stream_answer(body.query.strip(), user),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _stream_answer(q: str, user: Dict[str, Any]):
+    timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    meta = {"domain": user["domain"], "clearance": user["clearance"]}
+    if not q:
+        yield _sse("citations", {"citations": []})
+        yield _sse("delta", {"text": "Please provide a question."})
+        yield _sse("done", {"route": {}, "timings": timings, **meta})
+        return
+
+    retrieve = asyncio.ensure_future(_timed(timings, "retrieve", _retrieve(q, user, timings)))
+    plan = asyncio.ensure_future(_timed(timings, "plan", pick_model(user["domain"], q, embed=retriever.embed_query)))
+    try:
+        chunks = await retrieve
+
+        slot = await _answer_slot(q, user, chunks)
+        hit = answer_cache.get(*slot, version=retriever.index_version()) if slot else None
+        if hit is not None:
+            # The cached answer's [n] markers index the citations it was cached with
+            _finish(None, "query_stream", timings, t0, cached=True)
+            yield _sse("citations", {"citations": hit["citations"]})
+            yield _sse("delta", {"text": hit["answer"]})
+            yield _sse("done", {"route": hit["route"], "timings": timings, "cached": True, **meta})
+            return
+
+        route = planner.available_route(tiering.choose(await plan, q, chunks))
+        model_id, temperature, max_tokens = _route_params(route)
+        metrics.ROUTES.inc(model_id, user["domain"])
+        # Citations wait for the route: its budget decides which chunks the prompt holds
+        packed = _pack(chunks, user["domain"], q, model_id, max_tokens)
+        citations = _citations(packed.chunks)
+        yield _sse("citations", {"citations": citations})
+
+        bound = prompts.bind("answer", model_id, domain=user["domain"])
+        cfg = clients.generation_config(temperature, max_tokens)
+        prompt = build_prompt(packed.chunks, user["domain"], q)
+        contents = bound.contents(prompt)
+
+        tg = time.perf_counter()
+        parts: List[str] = []
+        usage = None
+        async with limits.GENERATE:
+            # Same deadline / breaker as _generate; the deadline covers the whole stream
+            stream = resilience.generate(model_id).stream(
+                lambda: bound.model.generate_content_async(contents, generation_config=cfg, stream=True))
+            async for part in stream:
+                usage = getattr(part, "usage_metadata", None) or usage  # final chunk carries the totals
+                delta = _text_of(part)
+                if not delta:
+                    continue
+                if "first_token_ms" not in timings:
+                    timings["first_token_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+                    metrics.STAGE_SECONDS.observe(time.perf_counter() - tg, "generate_first_token")
+                parts.append(delta)
+                yield _sse("delta", {"text": delta})
+        timings["generate_ms"] = round((time.perf_counter() - tg) * 1000, 1)
+        metrics.STAGE_SECONDS.observe(timings["generate_ms"] / 1000, "generate_stream")
+        _record_tokens(model_id, user["domain"], prompt, "".join(parts), usage)
+        _finish(None, "query_stream", timings, t0, cached=False)
+        route_out = _route_out(route)
+        if parts and slot:
+            answer_cache.set(*slot, {"answer": "".join(parts), "citations": citations, "route": route_out},
+                             version=retriever.index_version())
+        yield _sse("done", {"route": route_out, "timings": timings, "cached": False, **meta})
+    except (limits.Overloaded, resilience.CircuitOpen) as e:
+        yield _sse("error", {"detail": f"Busy ({e.name}), retry shortly"})
+    except resilience.DeadlineExceeded as e:
+        yield _sse("error", {"detail": f"{e.name} timed out"})
+    except Exception as e:
+        yield _sse("error", {"detail": f"{type(e).__name__}: {e}"})
+    finally:
+        # Client went away (generator cancelled) or we errored: drop whatever is still running
+        for t in (retrieve, plan):
+            t.cancel()
+
 # Tiny demo page
 @app.get("/", response_class=HTMLResponse)
 def home():
@@ -0,0 +1,252 @@
+# api/server/backends.py
+# Retriever backends: Vertex Matching Engine (default) or the in-process LocalIndex.
+# Both return Neighbor(id, distance, meta) so retriever.search() builds identical items.
+import os
+import json
+import asyncio
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+import cache
+import limits
+import metrics
+import vectors
+from vectors import Vector
+
+log = logging.getLogger("org-rag.backends")
+
+# Datapoint vectors kept for reranking (Vertex backend; the local index has them in memory)
+VECTOR_CACHE_SIZE = int(os.getenv("VECTOR_CACHE_SIZE", "20000"))
+
+
+class Neighbor(NamedTuple):
+    id: Optional[str]
+    distance: float
+    meta: Dict[str, Any]
+
+
+class NeighborQuery(NamedTuple):
+    vec: Sequence[float]
+    neighbor_count: int
+    domain: Optional[str] = None
+    max_clearance: Optional[int] = None
+
+
+class Backend:
+    name = "base"
+
+    async def find_neighbors(self, vec: Sequence[float], neighbor_count: int,
+                             domain: Optional[str] = None, max_clearance: Optional[int] = None) -> List[Neighbor]:
+        """
+        Top `neighbor_count` neighbors. When given, `domain` / `max_clearance` are applied
+        inside the index (only datapoints with that domain and clearance_min <= max_clearance).
+        """
+        raise NotImplementedError
+
+    async def find_neighbors_many(self, queries: List[NeighborQuery]) -> List[List[Neighbor]]:
+        """One neighbor list per query, in order. Backends that take batched requests override this."""
+        return list(await asyncio.gather(*(self.find_neighbors(*q) for q in queries)))
+
+    async def vectors(self, ids: List[str]) -> Dict[str, Vector]:
+        """Stored full-precision vectors by datapoint id (for reranking); ids the backend can't serve are left out."""
+        return {}
+
+    async def warmup(self):
+        pass
+
+    def after_fork(self):
+        """In a freshly forked worker: drop anything bound to the parent's sockets / event loop."""
+        pass
+
+
+# ---------------- Vertex Matching Engine ----------------
+def _neighbor_id(n) -> Optional[str]:
+    # Works across shapes
+    if getattr(n, "id", None): return n.id
+    if getattr(n, "entity_id", None): return n.entity_id
+    dp = getattr(n, "datapoint", None)
+    if dp:
+        if getattr(dp, "datapoint_id", None): return dp.datapoint_id
+        if getattr(dp, "entity_id", None):    return dp.entity_id
+    return None
+
+
+def _meta_from_neighbor(n):
+    dp = getattr(n, "datapoint", None)
+    if not dp:
+        return {}
+
+    # ✅ Prefer restricts (robust)
+    # In python proto, it's 'allow_list' (snake_case)
+    for r in getattr(dp, "restricts", []) or []:
+        ns = getattr(r, "namespace", None)
+        allow = getattr(r, "allow_list", None)
+        if ns == "meta" and allow:
+            try:
+                first = allow[0]
+                if isinstance(first, bytes):
+                    first = first.decode("utf-8", errors="ignore")
+                if isinstance(first, str):
+                    return json.loads(first)
+            except Exception:
+                pass
+
+    # Fallback (often numeric in your env)
+    ct = getattr(dp, "crowding_tag", None)
+    ca = getattr(ct, "crowding_attribute", None) if ct else None
+    if isinstance(ca, str):
+        try:
+            return json.loads(ca)
+        except Exception:
+            pass
+
+    return {}
+
+
+class VertexBackend(Backend):
+    name = "vertex"
+
+    def __init__(self, api_endpoint: str, index_endpoint: str, deployed_index_id: str,
+                 meta_store=None, return_full_datapoint: bool = False):
+        self.api_endpoint = api_endpoint
+        self.index_endpoint = index_endpoint
+        self.deployed_index_id = deployed_index_id
+        self.meta_store = meta_store
+        self.return_full_datapoint = return_full_datapoint
+        self._client = None
+        # Datapoint vectors only change on a re-seed (keys carry the store version), so
+        # after warm-up reranking rarely needs the extra round trip
+        self._vectors = cache.TTLCache("vectors", maxsize=VECTOR_CACHE_SIZE, ttl_s=24 * 3600)
+
+    def _match_client(self):
+        # The async gRPC channel binds to the running event loop, so build it on first use
+        if self._client is None:
+            from google.cloud import aiplatform_v1
+            self._client = aiplatform_v1.MatchServiceAsyncClient(client_options={"api_endpoint": self.api_endpoint})
+        return self._client
+
+    def after_fork(self):
+        self._client = None
+
+    async def warmup(self):
+        # Creating the client opens the gRPC channel; the channel itself connects lazily,
+        # so wait for it to be ready when the transport exposes that
+        client = self._match_client()
+        channel = getattr(getattr(client, "transport", None), "grpc_channel", None)
+        if channel is not None and hasattr(channel, "channel_ready"):
+            await channel.channel_ready()
+
+    async def find_neighbors(self, vec: Sequence[float], neighbor_count: int,
+                             domain: Optional[str] = None, max_clearance: Optional[int] = None) -> List[Neighbor]:
+        return (await self.find_neighbors_many([NeighborQuery(vec, neighbor_count, domain, max_clearance)]))[0]
+
+    @staticmethod
+    def _query(q: NeighborQuery):
+        from google.cloud import aiplatform_v1
+
+        # Filters run inside Matching Engine: token restrict on "domain", numeric restrict on
+        # "clearance_min" (datapoints are upserted with both, see seed_vectors.py)
+        restricts, numeric = [], []
+        if q.domain is not None:
+            restricts.append(aiplatform_v1.IndexDatapoint.Restriction(namespace="domain", allow_list=[q.domain]))
+        if q.max_clearance is not None:
+            numeric.append(aiplatform_v1.IndexDatapoint.NumericRestriction(
+                namespace="clearance_min", value_int=int(q.max_clearance),
+                op=aiplatform_v1.IndexDatapoint.NumericRestriction.Operator.LESS_EQUAL,
+            ))
+        return aiplatform_v1.FindNeighborsRequest.Query(
+            datapoint=aiplatform_v1.IndexDatapoint(feature_vector=list(q.vec), restricts=restricts,
+                                                   numeric_restricts=numeric),
+            neighbor_count=q.neighbor_count,
+        )
+
+    async def find_neighbors_many(self, queries: List[NeighborQuery]) -> List[List[Neighbor]]:
+        from google.cloud import aiplatform_v1
+
+        # With a local metadata store we only need ids back; full datapoints carry the
+        # 768-dim vectors and the JSON restricts, which is most of the response
+        ids_only = (self.meta_store is not None and self.meta_store.version is not None
+                    and not self.return_full_datapoint)
+        # FindNeighbors takes many queries per request: one round trip for the whole batch
+        req = aiplatform_v1.FindNeighborsRequest(
+            index_endpoint=self.index_endpoint,
+            deployed_index_id=self.deployed_index_id,
+            queries=[self._query(q) for q in queries],
+            return_full_datapoint=not ids_only,
+        )
+        async with limits.ANN:
+            resp = await self._match_client().find_neighbors(req)
+        with metrics.STAGE_SECONDS.time("meta_parse"):
+            per_query = [list(nn.neighbors or []) for nn in resp.nearest_neighbors or []]
+            per_query += [[] for _ in range(len(queries) - len(per_query))]
+            ids = [[_neighbor_id(n) for n in neighbors] for neighbors in per_query]
+            metas = self.meta_store.get_many([i for row in ids for i in row]) if ids_only else {}
+            return [[Neighbor(i, n.distance, metas.get(i) or _meta_from_neighbor(n)) for i, n in zip(row, neighbors)]
+                    for row, neighbors in zip(ids, per_query)]
+
+
+    async def vectors(self, ids: List[str]) -> Dict[str, Vector]:
+        from google.cloud import aiplatform_v1
+
+        version = self.meta_store.version if self.meta_store is not None else None
+        out: Dict[str, Vector] = {}
+        missing = []
+        for i in ids:
+            vec = self._vectors.get((version, i))
+            if vec is None:
+                missing.append(i)
+            else:
+                out[i] = vec
+        if missing:
+            req = aiplatform_v1.ReadIndexDatapointsRequest(
+                index_endpoint=self.index_endpoint, deployed_index_id=self.deployed_index_id, ids=missing)
+            async with limits.ANN:
+                resp = await self._match_client().read_index_datapoints(req)
+            for dp in resp.datapoints or []:
+                vec = vectors.pack(dp.feature_vector or [])
+                if vec:
+                    out[dp.datapoint_id] = vec
+                    self._vectors.set((version, dp.datapoint_id), vec)
+        return out
+
+
+# ---------------- In-process index ----------------
+class LocalBackend(Backend):
+    name = "local"
+
+    def __init__(self, path: str, embed_model: Optional[str] = None):
+        from local_index import LocalIndex
+        self.path = path
+        self.index = LocalIndex.load(path, mmap=True)
+        # Vectors from another model live in another space: every score would be noise
+        if embed_model and self.index.embedder and self.index.embedder != embed_model:
+            raise ValueError(f"Local index {path} was embedded with {self.index.embedder!r}, "
+                             f"but queries are embedded with {embed_model!r}; rebuild it or set EMBED_MODEL")
+        if embed_model and not self.index.embedder:
+            log.warning("local index %s does not record its embedding model; assuming %s", path, embed_model)
+
+    async def find_neighbors(self, vec: Sequence[float], neighbor_count: int,
+                             domain: Optional[str] = None, max_clearance: Optional[int] = None) -> List[Neighbor]:
+        # Brute force over a few thousand rows is well under a millisecond; no need to leave the loop
+        hits = self.index.search(vec, neighbor_count, domain=domain, max_clearance=max_clearance)
+        return [Neighbor(i, d, m) for i, d, m in hits]
+
+    async def vectors(self, ids: List[str]) -> Dict[str, Vector]:
+        found, rows = self.index.vectors_for(ids)
+        return dict(zip(found, map(vectors.pack, rows)))
+
+
+def from_env(meta_store=None, embed_model: Optional[str] = None) -> Backend:
+    kind = os.getenv("RETRIEVER_BACKEND", "vertex").lower()
+    if kind == "local":
+        default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_index")
+        return LocalBackend(os.getenv("LOCAL_INDEX_DIR", default_dir), embed_model=embed_model)
+    if kind != "vertex":
+        raise ValueError(f"Unknown RETRIEVER_BACKEND={kind!r} (expected 'vertex' or 'local')")
+    return VertexBackend(
+        api_endpoint=os.getenv("ME_API_HOST", "257828499.us-central1-589329822647.vdb.vertexai.goog"),
+        index_endpoint=os.getenv("ME_INDEX_ENDPOINT", "projects/589329822647/locations/us-central1/indexEndpoints/1398598581740371968"),
+        deployed_index_id=os.getenv("ME_DEPLOYED_INDEX_ID", "sunhack_deploy_1759016114032"),
+        meta_store=meta_store,
+        return_full_datapoint=os.getenv("ME_RETURN_FULL_DATAPOINT", "0") == "1",
+    )
@@ -0,0 +1,135 @@
+# api/server/batcher.py
+# Micro-batching for concurrent single-item calls (query embeddings, ANN lookups).
+#
+# Callers submit one item and await their own result; items that arrive within a short
+# window (or until the batch is full) go out as one batched request. Trades up to
+# `window_ms` of added latency for far fewer round trips under concurrent load.
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class MicroBatcher:
+    """
+    `fn(items) -> results` is called with up to `max_batch` items, results in the same
+    order. A result that is an Exception fails only that caller; if `fn` raises, every
+    caller in the batch gets the error. window_ms <= 0 turns batching off (one call per item).
+    """
+
+    def __init__(self, name: str, fn: Callable[[List[Any]], Awaitable[List[Any]]],
+                 max_batch: int = 32, window_ms: float = 5.0):
+        self.name = name
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.window_s = window_ms / 1000
+        self._pending: List[Tuple[Any, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # In-flight dispatches: the loop only keeps weak references to tasks, and a collected
+        # one would leave every caller in its batch waiting forever
+        self._tasks: Set[asyncio.Task] = set()
+        # metrics
+        self.batches = 0
+        self.items = 0
+        self.full_flushes = 0
+        self.max_seen = 0
+        self._sizes = [0] * len(_SIZE_BUCKETS)
+        self._delays_ms: deque = deque(maxlen=2048)
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_s > 0 and self.max_batch > 1
+
+    async def submit(self, item: Any) -> Any:
+        if not self.enabled:
+            now = time.perf_counter()
+            self._record([now], now)
+            res = (await self.fn([item]))[0]
+            if isinstance(res, Exception):
+                raise res
+            return res
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((item, fut, time.perf_counter()))
+        if len(self._pending) >= self.max_batch:
+            self.full_flushes += 1
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window_s, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future, float]]):
+        # Callers that gave up (request cancelled) don't need a slot in the batch
+        live = [b for b in batch if not b[1].done()]
+        if not live:
+            return
+        self._record([t for _, _, t in live], time.perf_counter())
+        try:
+            results = await self.fn([item for item, _, _ in live])
+        except Exception as e:
+            for _, fut, _ in live:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut, _), res in zip(live, results):
+            if fut.done():
+                continue
+            if isinstance(res, Exception):
+                fut.set_exception(res)
+            else:
+                fut.set_result(res)
+
+    def _record(self, enqueued: List[float], now: float):
+        n = len(enqueued)
+        self.batches += 1
+        self.items += n
+        self.max_seen = max(self.max_seen, n)
+        for i, edge in enumerate(_SIZE_BUCKETS):
+            if n <= edge:
+                self._sizes[i] += 1
+                break
+        else:
+            self._sizes[-1] += 1
+        self._delays_ms.extend((now - t) * 1000 for t in enqueued)
+
+    def stats(self) -> Dict[str, Any]:
+        delays = sorted(self._delays_ms)
+
+        def pct(p: float) -> float:
+            return round(delays[min(len(delays) - 1, int(p * len(delays)))], 2) if delays else 0.0
+
+        return {
+            "enabled": self.enabled,
+            "window_ms": self.window_s * 1000,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_seen": self.max_seen,
+            "full_flushes": self.full_flushes,
+            "batch_sizes": {f"<={edge}": c for edge, c in zip(_SIZE_BUCKETS, self._sizes)},
+            "queue_delay_ms": {"p50": pct(0.5), "p95": pct(0.95), "max": pct(1.0)},
+            "pending": len(self._pending),
+        }
+
+
+def from_env(name: str, fn: Callable[[List[Any]], Awaitable[List[Any]]],
+             max_batch: int = 32, window_ms: float = 5.0) -> MicroBatcher:
+    key = name.upper()
+    return MicroBatcher(
+        name, fn,
+        max_batch=int(os.getenv(f"{key}_MICROBATCH_MAX", max_batch)),
+        window_ms=float(os.getenv(f"{key}_MICROBATCH_WINDOW_MS", window_ms)),
+    )
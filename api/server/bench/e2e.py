@@ -0,0 +1,266 @@
+# api/server/bench/e2e.py
+# Offline end-to-end benchmark: the real FastAPI app over stub Vertex dependencies.
+#
+#   cd api/server && python -m bench.e2e                                  # typical profile, /query
+#   ... --concurrency 1,16,64 --requests 300                              # concurrency sweep
+#   ... --profile slow-ann --endpoint stream                              # other latency shapes / endpoints
+#   ... --backend local --copies 50                                       # in-process index, 50x corpus
+#   ... --json results.json                                               # keep numbers to diff later
+#   ... --url http://127.0.0.1:8099                                       # a running server (bench.serve)
+#
+# Queries come from seed_vectors.DOCS (asked from the chunk's own domain), shuffled with
+# --seed; stub latencies are sampled from the same seed, so two runs of the same commit
+# see the same workload. Reports throughput, latency p50/p95/p99, the per-request stage
+# timings the API returns, and the server-side stage histograms from metrics.py.
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from typing import Any, Dict, List, Tuple
+
+from bench import stubs
+
+HEADERS = {"X-API-Key": "123456789", "X-User-Email": "bench@example.com"}
+
+
+def _pct(xs: List[float], p: float) -> float:
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p * (len(xs) - 1))))]
+
+
+def _setup_env(args, workdir: str) -> int:
+    """Everything the server reads at import time; must run before `import app`."""
+    meta_path = os.path.join(workdir, "seed_meta.json")
+    n = stubs.write_corpus_from_docs(meta_path, copies=args.copies)
+    os.environ.update({
+        "SEED_META_PATH": meta_path,
+        "META_DB_PATH": os.path.join(workdir, "meta.sqlite"),
+        "STARTUP_MODE": "lazy",
+        "ANSWER_CACHE": "1" if args.answer_cache else "0",
+        "RETRIEVER_BACKEND": "local" if args.backend == "local" else "vertex",
+        "LOCAL_INDEX_DIR": os.path.join(workdir, "local_index"),
+    })
+    if args.backend == "local":
+        import numpy as np
+        from local_index import LocalIndex
+        with open(meta_path) as f:
+            metas = json.load(f)
+        ids = list(metas)
+        vecs = np.asarray([stubs._embed(metas[i]["chunk"]) for i in ids], dtype=np.float32)
+        # stubs._embed stands in for the query model, so the index is labelled with it
+        LocalIndex.build(ids, vecs, metas, embedder=os.getenv("EMBED_MODEL", "text-embedding-004")).save(
+            os.environ["LOCAL_INDEX_DIR"])
+    return n
+
+
+def _workload(n: int, seed: int) -> List[Tuple[str, str]]:
+    from seed_vectors import DOCS
+    rng = random.Random(seed)
+    base = []
+    for _, text, domain, *_ in DOCS:
+        words = text.split()
+        # Ask with a prefix of the chunk so retrieval has work to do but usually succeeds
+        base.append((" ".join(words[: max(4, len(words) * 2 // 3)]), domain))
+    return [base[rng.randrange(len(base))] for _ in range(n)]
+
+
+async def _one(client, endpoint: str, q: str, domain: str) -> Tuple[int, Dict[str, float], bool, str]:
+    headers = {**HEADERS, "X-User-Domain": domain, "X-User-Clearance": "3"}
+    if endpoint == "stream":
+        timings, cached, status, model = {}, False, 0, ""
+        async with client.stream("POST", "/query/stream", json={"query": q}, headers=headers) as r:
+            status = r.status_code
+            event = None
+            async for line in r.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[7:]
+                elif line.startswith("data: ") and event == "done":
+                    done = json.loads(line[6:])
+                    timings, cached = done.get("timings", {}), bool(done.get("cached"))
+                    model = done.get("route", {}).get("model_id", "")
+        return status, timings, cached, model
+    if endpoint == "batch":
+        r = await client.post("/query/batch", json={"queries": [q]}, headers=headers)
+        body = r.json() if r.status_code == 200 else {}
+        model = (body.get("results") or [{}])[0].get("route", {}).get("model_id", "")
+        return r.status_code, body.get("timings", {}), False, model
+    r = await client.post("/query", json={"query": q}, headers=headers)
+    body = r.json() if r.status_code == 200 else {}
+    return r.status_code, body.get("timings", {}), bool(body.get("cached")), body.get("route", {}).get("model_id", "")
+
+
+async def drive(app, workload: List[Tuple[str, str]], concurrency: int, endpoint: str,
+                url: str = None) -> Dict[str, Any]:
+    import httpx
+    latencies: List[float] = []
+    stage: Dict[str, List[float]] = {}
+    statuses: Dict[int, int] = {}
+    models: Dict[str, int] = {}
+    cached = 0
+    sem = asyncio.Semaphore(concurrency)
+
+    if url:  # over the network to another process (many workers): no in-process stage histograms
+        transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=concurrency))
+    else:
+        transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url=url or "http://bench", timeout=None) as client:
+        async def run(q: str, domain: str):
+            nonlocal cached
+            async with sem:
+                t0 = time.perf_counter()
+                try:
+                    status, timings, hit, model = await _one(client, endpoint, q, domain)
+                except httpx.TransportError as e:  # over --url: connection refused / reset
+                    status, timings, hit, model = type(e).__name__, {}, False, ""
+                latencies.append((time.perf_counter() - t0) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+                cached += hit
+                if model:
+                    models[model] = models.get(model, 0) + 1
+                for k, v in timings.items():
+                    stage.setdefault(k, []).append(v)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(run(q, d) for q, d in workload))
+        wall = time.perf_counter() - t0
+
+    return {
+        "requests": len(workload),
+        "concurrency": concurrency,
+        "rps": round(len(workload) / wall, 1),
+        "p50_ms": round(_pct(latencies, 0.50), 1),
+        "p95_ms": round(_pct(latencies, 0.95), 1),
+        "p99_ms": round(_pct(latencies, 0.99), 1),
+        "statuses": statuses,
+        "cached": cached,
+        "models": models,
+        "stages_ms": {k: {"p50": round(_pct(v, 0.5), 1), "p95": round(_pct(v, 0.95), 1)}
+                      for k, v in sorted(stage.items())},
+    }
+
+
+def _histogram_snapshot() -> Dict[str, Tuple[List[int], float]]:
+    import metrics
+    h = metrics.STAGE_SECONDS
+    return {lv[0]: (list(c), h._sums[lv]) for lv, c in h._counts.items()}
+
+
+def _server_stages(before, after) -> Dict[str, Dict[str, float]]:
+    """Per-stage count / mean / ~p95 from the metrics histogram delta over one run."""
+    import metrics
+    edges = metrics.STAGE_SECONDS.buckets + (float("inf"),)
+    out = {}
+    for name, (counts, total) in sorted(after.items()):
+        prev_counts, prev_total = before.get(name, ([0] * len(counts), 0.0))
+        delta = [a - b for a, b in zip(counts, prev_counts)]
+        n = sum(delta)
+        if not n:
+            continue
+        # upper edge of the bucket holding the 95th percentile
+        cum, p95 = 0, edges[-2]
+        for edge, c in zip(edges, delta):
+            cum += c
+            if cum >= 0.95 * n:
+                p95 = edge if edge != float("inf") else edges[-2]
+                break
+        out[name] = {"count": n, "mean_ms": round((total - prev_total) / n * 1000, 2), "p95_le_ms": p95 * 1000}
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline end-to-end benchmark over stub Vertex dependencies")
+    ap.add_argument("--requests", type=int, default=300)
+    ap.add_argument("--concurrency", default="32", help="comma separated, e.g. 1,16,64")
+    ap.add_argument("--endpoint", choices=("query", "stream", "batch"), default="query")
+    ap.add_argument("--profile", choices=sorted(stubs.PROFILES), default="typical")
+    ap.add_argument("--backend", choices=("vertex-stub", "local"), default="vertex-stub")
+    ap.add_argument("--copies", type=int, default=1, help="replicate the DOCS corpus N times")
+    ap.add_argument("--answer-cache", action="store_true", help="leave the semantic answer cache on")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--json", dest="json_out", default=None)
+    ap.add_argument("--url", default=None, help="drive a running server (e.g. python -m bench.serve) instead")
+    args = ap.parse_args()
+    if args.url:
+        return _main_remote(args)
+
+    stubs.install(dict(stubs.PROFILES[args.profile]), seed=args.seed)
+    workdir = tempfile.mkdtemp(prefix="org-rag-bench-")
+    corpus = _setup_env(args, workdir)
+
+    import app as server  # after stubs.install() and the env above
+    import planner
+    import retriever
+
+    print(f"profile {args.profile}: {stubs.LATENCY}")
+    print(f"corpus {corpus} chunks, backend {args.backend}, endpoint /{args.endpoint}, "
+          f"answer cache {'on' if args.answer_cache else 'off'}, seed {args.seed}\n")
+
+    async def run_all() -> List[Dict[str, Any]]:
+        # One event loop for every level: limiter semaphores and clients stay bound to it
+        results = []
+        for conc in [int(c) for c in args.concurrency.split(",")]:
+            # Same starting point for every level: cold caches, same latency samples
+            stubs.reseed(args.seed)
+            retriever.embed_cache.clear()
+            planner._plan_cache.clear()
+            server.answer_cache.invalidate()
+            calls_before, tokens_before = dict(stubs.CALLS), dict(stubs.TOKENS)
+            hist_before = _histogram_snapshot()
+            r = await drive(server.app, _workload(args.requests, args.seed), conc, args.endpoint)
+            r["server_stages"] = _server_stages(hist_before, _histogram_snapshot())
+            r["round_trips"] = {k: stubs.CALLS[k] - calls_before.get(k, 0) for k in stubs.CALLS}
+            r["prompt_tokens"] = {k: stubs.TOKENS[k] - tokens_before[k] for k in stubs.TOKENS}
+            results.append(r)
+
+            print(f"concurrency {conc:>4}: {r['rps']:8.1f} req/s   p50 {r['p50_ms']:7.1f} ms   "
+                  f"p95 {r['p95_ms']:7.1f} ms   p99 {r['p99_ms']:7.1f} ms   {r['statuses']}"
+                  f"{'   cached ' + str(r['cached']) if r['cached'] else ''}")
+            print("  per request : " + "  ".join(f"{k[:-3] if k.endswith('_ms') else k} {v['p50']}/{v['p95']}"
+                                                 for k, v in r["stages_ms"].items()) + "   (p50/p95 ms)")
+            print("  server side : " + "  ".join(f"{k} {v['mean_ms']}" for k, v in r["server_stages"].items())
+                  + "   (mean ms)")
+            print("  models      : " + "  ".join(f"{k} {v}" for k, v in sorted(r["models"].items())))
+            print("  round trips : " + "  ".join(f"{k} {v}" for k, v in r["round_trips"].items()))
+            print("  prompt tok. : " + "  ".join(f"{k} {v} ({v / max(1, r['requests']):.0f}/req)"
+                                                 for k, v in r["prompt_tokens"].items()) + "\n")
+        return results
+
+    results = asyncio.run(run_all())
+
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump({"args": vars(args), "latency": {k: repr(v) for k, v in stubs.LATENCY.items()},
+                       "results": results}, f, indent=2)
+
+
+def _main_remote(args):
+    import httpx
+    print(f"server {args.url}, endpoint /{args.endpoint}, seed {args.seed}\n")
+
+    async def run_all() -> List[Dict[str, Any]]:
+        results = []
+        for conc in [int(c) for c in args.concurrency.split(",")]:
+            # The server's embed / planner caches stay warm across levels; only answers are dropped
+            async with httpx.AsyncClient(base_url=args.url) as c:
+                await c.post("/debug/cache/invalidate", headers=HEADERS)
+            r = await drive(None, _workload(args.requests, args.seed), conc, args.endpoint, url=args.url)
+            results.append(r)
+            print(f"concurrency {conc:>4}: {r['rps']:8.1f} req/s   p50 {r['p50_ms']:7.1f} ms   "
+                  f"p95 {r['p95_ms']:7.1f} ms   p99 {r['p99_ms']:7.1f} ms   {r['statuses']}")
+            print("  per request : " + "  ".join(f"{k[:-3] if k.endswith('_ms') else k} {v['p50']}/{v['p95']}"
+                                                 for k, v in r["stages_ms"].items()) + "   (p50/p95 ms)\n")
+        return results
+
+    results = asyncio.run(run_all())
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# api/server/bench/importtime.py
+# Cold-start import profile: what `import app` costs and which packages it pulls in.
+#
+#   cd api/server && python -m bench.importtime                  # median of 5 fresh interpreters
+#   ... --module retriever                                       # profile a different entry module
+#   ... --budget-ms 800                                          # exit 1 if over budget (CI guard)
+#   ... --json importtime.json                                   # keep a record to diff later
+#
+# Each run is a fresh `python -X importtime -c "import <module>"`, so nothing is cached
+# in-process. Self time is summed per top-level package; the heavy SDKs (vertexai,
+# google.cloud, numpy) should not show up at all, they load on first use / during warmup.
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, Tuple
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("vertexai", "google", "grpc", "numpy", "requests")
+
+
+def _parse(stderr: str) -> List[Tuple[str, int, int]]:
+    # "import time:       self [us] |     cumulative | imported package"
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cum_us)))
+    return rows
+
+
+def profile_once(module: str) -> Dict:
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=HERE, capture_output=True, text=True)
+    rows = _parse(proc.stderr)
+    if proc.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{proc.stderr.splitlines()[-1] if proc.stderr else ''}")
+    by_pkg: Dict[str, int] = {}
+    for name, self_us, _ in rows:
+        root = name.split(".")[0]
+        by_pkg[root] = by_pkg.get(root, 0) + self_us
+    total = next((cum for name, _, cum in rows if name == module), sum(by_pkg.values()))
+    return {"total_us": total, "by_package": by_pkg, "modules": len(rows)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Import-time profile of the API entry module")
+    ap.add_argument("--module", default="app")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--budget-ms", type=float, default=None)
+    ap.add_argument("--json", dest="json_out", default=None)
+    args = ap.parse_args()
+
+    runs = [profile_once(args.module) for _ in range(args.runs)]
+    total_ms = statistics.median(r["total_us"] for r in runs) / 1000
+    pkgs = {p: statistics.median(r["by_package"].get(p, 0) for r in runs) / 1000
+            for p in runs[0]["by_package"]}
+    heavy = sorted(p for p in pkgs if p in HEAVY)
+
+    print(f"import {args.module}: {total_ms:.1f} ms median over {args.runs} runs, "
+          f"{runs[0]['modules']} modules")
+    print(f"\n{'package':<28}{'self ms':>10}{'share':>9}")
+    for pkg, ms in sorted(pkgs.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"{pkg:<28}{ms:>10.1f}{ms / max(total_ms, 1e-9):>9.0%}")
+    print(f"\nheavy SDKs loaded at import: {', '.join(heavy) if heavy else 'none'}")
+
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump({"module": args.module, "total_ms": round(total_ms, 1), "heavy": heavy,
+                       "by_package_ms": {p: round(ms, 2) for p, ms in pkgs.items()}}, f, indent=2)
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"\nOVER BUDGET: {total_ms:.1f} ms > {args.budget_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# api/server/bench/load.py
+# Throughput benchmark against local stub backends (no GCP needed; requires httpx).
+#
+#   cd api/server && python -m bench.load --requests 400 --concurrency 200
+#
+# Compares the old pipeline (sync `def` handler doing blocking SDK calls on Starlette's
+# threadpool) with the async /query path, using the same simulated dependency latencies.
+import time
+import asyncio
+import argparse
+import statistics
+from typing import Dict, List
+
+from bench import stubs
+
+stubs.install()
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+HEADERS = {
+    "X-API-Key": "123456789",
+    "X-User-Email": "bench@example.com",
+    "X-User-Domain": "finance",
+    "X-User-Clearance": "2",
+}
+QUERIES = [
+    "What is the hotel cap per night?",
+    "How do I claim travel reimbursement?",
+    "When must corporate card transactions be expensed?",
+    "Do I need a purchase order over $5,000?",
+]
+
+
+def legacy_app() -> FastAPI:
+    """The pre-async request shape: every remote call blocks a worker thread."""
+    legacy = FastAPI()
+    embed_model = stubs.TextEmbeddingModel()
+    client = stubs.MatchServiceClient()
+
+    @legacy.post("/query")
+    def query(body: Dict[str, str]):
+        vec = embed_model.get_embeddings([stubs.TextEmbeddingInput(body["query"], "RETRIEVAL_QUERY")])[0].values
+        client.find_neighbors(stubs.FindNeighborsRequest(queries=[stubs.FindNeighborsRequest.Query(
+            datapoint=stubs.IndexDatapoint(feature_vector=vec), neighbor_count=10)]))
+        planner_cfg = stubs.GenerationConfig(response_mime_type="application/json")
+        stubs.GenerativeModel("gemma-2-2b-it").generate_content(
+            [{"role": "user", "parts": [{"text": "{}"}]}], generation_config=planner_cfg)
+        resp = stubs.GenerativeModel("gemini-2.5-pro").generate_content("prompt")
+        return {"answer": resp.text}
+
+    return legacy
+
+
+async def drive(app, n: int, concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    sem = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one(i: int):
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.post("/query", json={"query": QUERIES[i % len(QUERIES)]}, headers=HEADERS)
+                latencies.append(time.perf_counter() - t0)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n)))
+        wall = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "rps": n / wall,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+        "statuses": statuses,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Sync vs async /query throughput on stub backends")
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--concurrency", type=int, default=200)
+    args = ap.parse_args()
+
+    import app as server  # after stubs.install()
+
+    print(f"stub latencies (s): {stubs.LATENCY}")
+    print(f"{args.requests} requests @ concurrency {args.concurrency}\n")
+    for name, target in (("sync/threadpool", legacy_app()), ("async", server.app)):
+        r = asyncio.run(drive(target, args.requests, args.concurrency))
+        print(f"{name:16s} {r['rps']:8.1f} req/s   p50 {r['p50_ms']:7.0f} ms   "
+              f"p95 {r['p95_ms']:7.0f} ms   {r['statuses']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# api/server/bench/planner_eval.py
+# Offline agreement between the local fast-path router and the LLM planner.
+#
+#   cd api/server && python -m bench.planner_eval             # live Vertex planner
+#   cd api/server && python -m bench.planner_eval --stub      # stub SDK (harness smoke test)
+#   ... --queries my_queries.jsonl                            # {"query": ..., "domain_hint": ...} per line
+#
+# Without --queries, every seed_vectors.DOCS chunk is asked once with its own domain as
+# the hint and once with a mismatched hint. Reports how often the fast path would answer
+# on its own at each confidence threshold, and how often it agrees with the LLM there.
+import sys
+import json
+import asyncio
+import argparse
+from typing import Dict, List
+
+
+def _default_queries() -> List[Dict[str, str]]:
+    from seed_vectors import DOCS
+    from planner import DOMAIN_REGISTRY
+    out = []
+    for i, (_, text, domain, *_rest) in enumerate(DOCS):
+        out.append({"query": text, "domain_hint": domain})
+        # any registered domain but the chunk's own (DOCS may hold domains the registry lacks)
+        others = [d for d in DOMAIN_REGISTRY if d != domain]
+        out.append({"query": text, "domain_hint": others[i % len(others)]})
+    return out
+
+
+async def evaluate(queries: List[Dict[str, str]], use_embed: bool, concurrency: int):
+    import planner
+    embed = None
+    if use_embed:
+        import retriever
+        embed = retriever.embed_query
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(item):
+        async with sem:
+            fast, conf = await planner.fast_route(item["domain_hint"], item["query"], embed)
+            try:
+                llm = await planner._llm_route(item["domain_hint"], item["query"])
+                llm_domain = llm["domain"]
+            except Exception as e:
+                llm_domain = f"error:{type(e).__name__}"
+            return {**item, "fast": fast.domain, "confidence": conf, "llm": llm_domain}
+
+    return await asyncio.gather(*(one(q) for q in queries))
+
+
+def report(rows, thresholds=(0.5, 0.6, 0.7, 0.75, 0.8, 0.9, 0.95)):
+    n = len(rows)
+    agree = sum(r["fast"] == r["llm"] for r in rows)
+    print(f"{n} queries; overall agreement fast vs LLM: {agree / n:.1%}\n")
+    print(f"{'threshold':>9}  {'fast-path share':>15}  {'agreement on fast path':>22}")
+    for t in thresholds:
+        fast = [r for r in rows if r["confidence"] >= t]
+        ok = sum(r["fast"] == r["llm"] for r in fast)
+        share = len(fast) / n
+        acc = ok / len(fast) if fast else float("nan")
+        print(f"{t:>9.2f}  {share:>15.1%}  {acc:>22.1%}")
+    misses = [r for r in rows if r["fast"] != r["llm"]][:10]
+    if misses:
+        print("\nsample disagreements:")
+        for r in misses:
+            print(f"  [{r['domain_hint']}] {r['query'][:70]!r}: fast={r['fast']} ({r['confidence']:.2f}) llm={r['llm']}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fast-path router vs LLM planner agreement")
+    ap.add_argument("--queries", help="jsonl with query/domain_hint per line")
+    ap.add_argument("--stub", action="store_true", help="use the stub SDK instead of Vertex")
+    ap.add_argument("--no-embed", action="store_true", help="keywords only (no embedding tie-break)")
+    ap.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+
+    if args.stub:
+        from bench import stubs
+        stubs.install({k: 0.0 for k in stubs.LATENCY})
+
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [json.loads(l) for l in f if l.strip()]
+    else:
+        queries = _default_queries()
+    rows = asyncio.run(evaluate(queries, not args.no_embed, args.concurrency))
+    report(rows)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+# api/server/bench/serve.py
+# The real app under gunicorn (SERVE_MODE=workers, gunicorn.conf.py) over stub Vertex
+# dependencies, for driving with `bench.e2e --url` from another shell / process.
+#
+#   cd api/server && python -m bench.serve --workers 4 --port 8099            # multi-worker
+#   ... --workers 1                                                           # baseline
+#   python -m bench.e2e --url http://127.0.0.1:8099 --concurrency 16,64,256   # load it
+#
+# Same corpus / env setup as bench.e2e; every worker installs the stubs with the same
+# profile and seed. Extra env (ADMIT_*, PRELOAD=0, ...) passes through to the server.
+import os
+import sys
+import argparse
+import tempfile
+
+from bench import stubs
+
+
+def __getattr__(name):
+    # gunicorn loads "bench.serve:app": install the stubs before the app is imported
+    if name == "app":
+        stubs.install(dict(stubs.PROFILES[os.getenv("BENCH_PROFILE", "typical")]),
+                      seed=int(os.getenv("BENCH_SEED", "7")))
+        from app import app
+        return app
+    raise AttributeError(name)
+
+
+def main():
+    from bench.e2e import _setup_env
+    ap = argparse.ArgumentParser(description="Serve the app over stub dependencies with gunicorn")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--profile", choices=sorted(stubs.PROFILES), default="typical")
+    ap.add_argument("--backend", choices=("vertex-stub", "local"), default="vertex-stub")
+    ap.add_argument("--copies", type=int, default=1, help="replicate the DOCS corpus N times")
+    ap.add_argument("--answer-cache", action="store_true", help="leave the semantic answer cache on")
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="org-rag-serve-")
+    corpus = _setup_env(args, workdir)
+    os.environ.update({
+        "BENCH_PROFILE": args.profile,
+        "BENCH_SEED": str(args.seed),
+        "PORT": str(args.port),
+        "WEB_CONCURRENCY": str(args.workers),
+        # Fresh shared caches per run, next to the corpus
+        "EMBED_CACHE_SHARED": os.getenv("EMBED_CACHE_SHARED", os.path.join(workdir, "embed-cache.sqlite")),
+        "PLANNER_CACHE_SHARED": os.getenv("PLANNER_CACHE_SHARED", os.path.join(workdir, "planner-cache.sqlite")),
+    })
+    print(f"corpus {corpus} chunks, backend {args.backend}, profile {args.profile}, "
+          f"{args.workers} workers on :{args.port}", flush=True)
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(here)
+    os.execvp(sys.executable, [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "bench.serve:app"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+# api/server/bench/stubs.py
+# Local stand-ins for the Vertex SDK surface the server touches, so the API can be
+# driven without GCP. Call install() BEFORE importing app / retriever / planner.
+#
+# Latencies are either fixed seconds or a Dist (lognormal from median + p99) sampled
+# from a seeded RNG, so a run is reproducible. The corpus is whatever SEED_META_PATH
+# points at (seed_meta.json by default), the same file the server's metadata store reads.
+import os
+import sys
+import json
+import math
+import time
+import types
+import random
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+
+class Dist:
+    """Lognormal latency with the given median and p99 (seconds); p99 == median is fixed."""
+
+    def __init__(self, median: float, p99: Optional[float] = None):
+        self.median = median
+        self.p99 = p99 if p99 is not None else median
+        self.sigma = math.log(self.p99 / self.median) / 2.326 if self.median > 0 and self.p99 > self.median else 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.sigma == 0.0:
+            return self.median
+        return self.median * math.exp(rng.gauss(0.0, self.sigma))
+
+    def __repr__(self):
+        return f"Dist(median={self.median}, p99={self.p99})"
+
+
+# Simulated round-trip per dependency: seconds or a Dist
+LATENCY: Dict[str, Union[float, Dist]] = {"embed": 0.03, "ann": 0.02, "planner": 0.15, "generate": 0.8}
+
+# Generation latency multiplier per model (pro is the slow tier); unknown models use 1.0
+MODEL_LATENCY = {"gemini-2.5-pro": 2.0}
+
+# Prefill: seconds per prompt token before the first output token (x MODEL_LATENCY).
+# Tokens served from a context cache cost CACHED_PREFILL of that.
+PREFILL_S_PER_TOKEN = float(os.getenv("BENCH_PREFILL_MS_PER_1K", "150")) / 1000 / 1000
+CACHED_PREFILL = 0.1
+
+# Named latency profiles for the benchmark harness (bench/e2e.py --profile)
+PROFILES: Dict[str, Dict[str, Union[float, Dist]]] = {
+    "fixed": dict(LATENCY),
+    "typical": {"embed": Dist(0.03, 0.12), "ann": Dist(0.02, 0.09), "planner": Dist(0.15, 0.6),
+                "generate": Dist(0.8, 3.0)},
+    "slow-ann": {"embed": Dist(0.03, 0.12), "ann": Dist(0.4, 2.5), "planner": Dist(0.15, 0.6),
+                 "generate": Dist(0.8, 3.0)},
+    "fast-gen": {"embed": Dist(0.03, 0.12), "ann": Dist(0.02, 0.09), "planner": Dist(0.15, 0.6),
+                 "generate": Dist(0.2, 0.6)},
+}
+
+_rng = random.Random(0)
+
+
+def reseed(seed: int):
+    _rng.seed(seed)
+
+
+def delay(kind: str, scale: float = 1.0) -> float:
+    v = LATENCY[kind]
+    return (v.sample(_rng) if isinstance(v, Dist) else float(v)) * scale
+
+
+DIM = 64
+# Round trips made per dependency (batching shows up here), and items carried by them
+CALLS: Dict[str, int] = {"embed": 0, "embed_items": 0, "ann": 0, "ann_queries": 0, "read_datapoints": 0,
+                         "context_caches": 0}
+# Prompt tokens the generator received (planner included), and how many came from a context cache
+TOKENS: Dict[str, int] = {"prompt": 0, "cached": 0}
+
+SEED_META = Path(__file__).resolve().parent.parent / "seed_meta.json"
+
+
+def _embed(text: str) -> List[float]:
+    # Deterministic hashed bag-of-words, L2 normalized
+    v = [0.0] * DIM
+    for tok in text.lower().split():
+        h = int(hashlib.md5(tok.encode()).hexdigest(), 16)
+        v[h % DIM] += 1.0 if (h >> 8) & 1 else -1.0
+    n = math.sqrt(sum(x * x for x in v)) or 1.0
+    return [x / n for x in v]
+
+
+def _load_corpus() -> Dict[str, Dict[str, Any]]:
+    with open(os.getenv("SEED_META_PATH", str(SEED_META))) as f:
+        return json.load(f)
+
+
+def write_corpus_from_docs(path: str, copies: int = 1) -> int:
+    """
+    seed_vectors.DOCS -> metadata JSON at `path` (point SEED_META_PATH at it before importing
+    the server). copies > 1 appends renamed duplicates to grow the corpus for scale runs.
+    """
+    import ingest
+    from seed_vectors import DOCS
+    metas: Dict[str, Dict[str, Any]] = {}
+    for n in range(copies):
+        for c in ingest.chunks_from_rows(DOCS):
+            metas[c.id if n == 0 else f"{c.id}~{n}"] = c.meta
+    with open(path, "w") as f:
+        json.dump(metas, f)
+    return len(metas)
+
+
+# ---------------- vertexai.language_models ----------------
+class TextEmbeddingInput:
+    def __init__(self, text: str, task_type: str = None):
+        self.text = text
+        self.task_type = task_type
+
+
+class _Embedding:
+    def __init__(self, values):
+        self.values = values
+
+
+class TextEmbeddingModel:
+    @classmethod
+    def from_pretrained(cls, name: str):
+        return cls()
+
+    def get_embeddings(self, inputs):
+        CALLS["embed"] += 1
+        CALLS["embed_items"] += len(inputs)
+        time.sleep(delay("embed"))
+        return [_Embedding(_embed(getattr(i, "text", i))) for i in inputs]
+
+    async def get_embeddings_async(self, inputs):
+        CALLS["embed"] += 1
+        CALLS["embed_items"] += len(inputs)
+        await asyncio.sleep(delay("embed"))
+        return [_Embedding(_embed(getattr(i, "text", i))) for i in inputs]
+
+
+# ---------------- vertexai.generative_models ----------------
+class GenerationConfig:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+
+def _tokens(contents) -> int:
+    # ~1.3 tokens per word, like chunker.count_tokens' fallback
+    if not contents:
+        return 0
+    if isinstance(contents, str):
+        text = contents
+    else:
+        text = " ".join(p.get("text", "") for c in contents for p in c.get("parts", ()))
+    return int(len(text.split()) * 1.3)
+
+
+class _Response:
+    def __init__(self, text: str, usage=None):
+        part = types.SimpleNamespace(text=text)
+        self.text = text
+        self.candidates = [types.SimpleNamespace(content=types.SimpleNamespace(parts=[part]))]
+        self.usage_metadata = usage
+
+
+class CachedContent:
+    """vertexai.preview.caching.CachedContent: the system instruction, held "server-side"."""
+
+    def __init__(self, model_name: str, system_instruction: str, ttl=None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.ttl = ttl
+        self.name = f"cachedContents/{hashlib.sha1(system_instruction.encode()).hexdigest()[:12]}"
+
+    @classmethod
+    def create(cls, model_name: str, system_instruction: str = None, ttl=None, **kwargs):
+        time.sleep(delay("generate", 0.2))
+        CALLS["context_caches"] += 1
+        return cls(model_name, system_instruction or "", ttl)
+
+
+class GenerativeModel:
+    def __init__(self, model_name: str, system_instruction: str = None, **kwargs):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.cached_content: Optional[CachedContent] = None
+
+    @classmethod
+    def from_cached_content(cls, cached_content: CachedContent):
+        model = cls(cached_content.model_name)
+        model.cached_content = cached_content
+        return model
+
+    def _is_planner(self, generation_config) -> bool:
+        cfg = getattr(generation_config, "kwargs", {}) or {}
+        return cfg.get("response_mime_type") == "application/json"
+
+    def _answer(self, contents, generation_config) -> str:
+        if self._is_planner(generation_config):
+            hint = "general"
+            try:
+                hint = json.loads(contents[0]["parts"][-1]["text"]).get("domain_hint") or hint
+            except Exception:
+                pass
+            return json.dumps({"domain": hint, "rationale": "stub planner"})
+        return "Per policy, see the cited sections [1]. Submit receipts within 15 days [2]."
+
+    def _usage(self, contents, text: str):
+        cached = _tokens(self.cached_content.system_instruction) if self.cached_content else 0
+        prompt = _tokens(self.system_instruction) + _tokens(contents) + cached
+        TOKENS["prompt"] += prompt
+        TOKENS["cached"] += cached
+        return types.SimpleNamespace(prompt_token_count=prompt, cached_content_token_count=cached,
+                                     candidates_token_count=_tokens(text))
+
+    def _prefill(self, usage) -> float:
+        fresh = usage.prompt_token_count - usage.cached_content_token_count
+        tokens = fresh + CACHED_PREFILL * usage.cached_content_token_count
+        return tokens * PREFILL_S_PER_TOKEN * MODEL_LATENCY.get(self.model_name, 1.0)
+
+    def _latency(self, generation_config) -> float:
+        if self._is_planner(generation_config):
+            return delay("planner")
+        return delay("generate", MODEL_LATENCY.get(self.model_name, 1.0))
+
+    async def count_tokens_async(self, contents):
+        await asyncio.sleep(delay("generate", 0.05))
+        return types.SimpleNamespace(total_tokens=len(str(contents).split()))
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        text = self._answer(contents, generation_config)
+        usage = self._usage(contents, text)
+        time.sleep(self._prefill(usage) + self._latency(generation_config))
+        return _Response(text, usage)
+
+    async def generate_content_async(self, contents, generation_config=None, stream=False):
+        text = self._answer(contents, generation_config)
+        usage = self._usage(contents, text)
+        prefill, total = self._prefill(usage), self._latency(generation_config)
+        if not stream:
+            await asyncio.sleep(prefill + total)
+            return _Response(text, usage)
+
+        words = text.split(" ")
+
+        async def _chunks():
+            # first token after prefill + ~20% of the budget, the rest spread evenly;
+            # the final chunk carries the usage totals, as Vertex's does
+            await asyncio.sleep(prefill + total * 0.2)
+            for i, w in enumerate(words):
+                yield _Response(w if i == 0 else " " + w, usage if i == len(words) - 1 else None)
+                await asyncio.sleep(total * 0.8 / len(words))
+        return _chunks()
+
+
+# ---------------- google.cloud.aiplatform_v1 ----------------
+class _Msg:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class IndexDatapoint(_Msg):
+    class Restriction(_Msg):
+        pass
+
+    class NumericRestriction(_Msg):
+        class Operator:
+            LESS = "LESS"
+            LESS_EQUAL = "LESS_EQUAL"
+            EQUAL = "EQUAL"
+            GREATER_EQUAL = "GREATER_EQUAL"
+            GREATER = "GREATER"
+
+
+class FindNeighborsRequest(_Msg):
+    class Query(_Msg):
+        pass
+
+
+class ReadIndexDatapointsRequest(_Msg):
+    pass
+
+
+class _Index:
+    def __init__(self):
+        self.rows = []
+        for dp_id, meta in _load_corpus().items():
+            self.rows.append((dp_id, meta, _embed(meta.get("chunk", ""))))
+
+    @staticmethod
+    def _allowed(dp, meta) -> bool:
+        # Mirrors Matching Engine: token restricts on "domain", numeric restricts on "clearance_min"
+        for r in getattr(dp, "restricts", None) or []:
+            if r.namespace == "domain" and meta.get("domain") not in r.allow_list:
+                return False
+        ops = {"LESS": "__lt__", "LESS_EQUAL": "__le__", "EQUAL": "__eq__",
+               "GREATER_EQUAL": "__ge__", "GREATER": "__gt__"}
+        for r in getattr(dp, "numeric_restricts", None) or []:
+            if r.namespace == "clearance_min":
+                if not getattr(int(meta.get("clearance_min", 0)), ops[r.op])(r.value_int):
+                    return False
+        return True
+
+    def neighbors(self, q, full: bool = True) -> List[Any]:
+        vec = q.datapoint.feature_vector
+        scored = sorted(
+            ((sum(a * b for a, b in zip(vec, v)), dp_id, meta) for dp_id, meta, v in self.rows
+             if self._allowed(q.datapoint, meta)),
+            key=lambda t: t[0], reverse=True,
+        )[: q.neighbor_count]
+        out = []
+        for dist, dp_id, meta in scored:
+            if not full:
+                dp = types.SimpleNamespace(datapoint_id=dp_id)
+                out.append(types.SimpleNamespace(id=dp_id, distance=dist, datapoint=dp))
+                continue
+            blob = json.dumps(meta)
+            dp = types.SimpleNamespace(
+                datapoint_id=dp_id,
+                restricts=[types.SimpleNamespace(namespace="meta", allow_list=[blob])],
+                crowding_tag=types.SimpleNamespace(crowding_attribute=blob),
+            )
+            out.append(types.SimpleNamespace(id=dp_id, distance=dist, datapoint=dp))
+        return out
+
+    def read(self, req):
+        CALLS["read_datapoints"] += 1
+        vecs = {dp_id: v for dp_id, _, v in self.rows}
+        return types.SimpleNamespace(datapoints=[
+            types.SimpleNamespace(datapoint_id=i, feature_vector=vecs[i]) for i in req.ids if i in vecs])
+
+    def respond(self, req):
+        CALLS["ann"] += 1
+        CALLS["ann_queries"] += len(req.queries)
+        return types.SimpleNamespace(nearest_neighbors=[
+            types.SimpleNamespace(neighbors=self.neighbors(q, getattr(req, "return_full_datapoint", False)))
+            for q in req.queries
+        ])
+
+
+_INDEX = None
+
+
+def _index() -> _Index:
+    global _INDEX
+    if _INDEX is None:
+        _INDEX = _Index()
+    return _INDEX
+
+
+class MatchServiceClient:
+    def __init__(self, client_options=None, **kwargs):
+        pass
+
+    def find_neighbors(self, req):
+        time.sleep(delay("ann"))
+        return _index().respond(req)
+
+
+    def read_index_datapoints(self, req):
+        time.sleep(delay("ann"))
+        return _index().read(req)
+
+
+class MatchServiceAsyncClient(MatchServiceClient):
+    async def find_neighbors(self, req):
+        await asyncio.sleep(delay("ann"))
+        return _index().respond(req)
+
+    async def read_index_datapoints(self, req):
+        await asyncio.sleep(delay("ann"))
+        return _index().read(req)
+
+
+def install(latency: Dict[str, Union[float, Dist]] = None, seed: Optional[int] = None):
+    """Register the stand-ins under the real module names."""
+    if latency:
+        LATENCY.update(latency)
+    if seed is not None:
+        reseed(seed)
+
+    vertexai = types.ModuleType("vertexai")
+    vertexai.init = lambda **kwargs: None
+
+    gm = types.ModuleType("vertexai.generative_models")
+    gm.GenerativeModel = GenerativeModel
+    gm.GenerationConfig = GenerationConfig
+
+    lm = types.ModuleType("vertexai.language_models")
+    lm.TextEmbeddingModel = TextEmbeddingModel
+    lm.TextEmbeddingInput = TextEmbeddingInput
+
+    preview = types.ModuleType("vertexai.preview")
+    caching = types.ModuleType("vertexai.preview.caching")
+    caching.CachedContent = CachedContent
+    preview.caching = caching
+    preview.generative_models = gm
+
+    vertexai.generative_models = gm
+    vertexai.language_models = lm
+    vertexai.preview = preview
+
+    google = sys.modules.get("google") or types.ModuleType("google")
+    cloud = types.ModuleType("google.cloud")
+    ap = types.ModuleType("google.cloud.aiplatform_v1")
+    ap.IndexDatapoint = IndexDatapoint
+    ap.FindNeighborsRequest = FindNeighborsRequest
+    ap.ReadIndexDatapointsRequest = ReadIndexDatapointsRequest
+    ap.MatchServiceClient = MatchServiceClient
+    ap.MatchServiceAsyncClient = MatchServiceAsyncClient
+    google.cloud = cloud
+    cloud.aiplatform_v1 = ap
+
+    sys.modules.update({
+        "vertexai": vertexai,
+        "vertexai.generative_models": gm,
+        "vertexai.language_models": lm,
+        "vertexai.preview": preview,
+        "vertexai.preview.caching": caching,
+        "vertexai.preview.generative_models": gm,
+        "google": google,
+        "google.cloud": cloud,
+        "google.cloud.aiplatform_v1": ap,
+    })
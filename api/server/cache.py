@@ -0,0 +1,289 @@
+# api/server/cache.py
+# Small in-process caches (LRU + TTL) with an optional shared backend.
+import os
+import json
+import time
+import sqlite3
+import weakref
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+_MISSING = object()
+
+
+def normalize_query(text: str) -> str:
+    # "  Travel   Reimbursement?" and "travel reimbursement?" share a cache slot
+    return " ".join((text or "").lower().split())
+
+
+class SqliteBackend:
+    """
+    Shared key/value store with expiry. A SQLite file is the local stand-in for
+    Redis/Memorystore: every replica or worker on the host that opens the same
+    path shares hits.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connect()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v BLOB, expires REAL)")
+        _backends.add(self)
+
+    def _connect(self):
+        # Also called in a forked worker: connections must not be shared across fork()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5.0)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute("SELECT v, expires FROM kv WHERE k = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def set(self, key: str, value: bytes, ttl_s: float):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO kv (k, v, expires) VALUES (?, ?, ?)",
+                             (key, value, time.time() + ttl_s))
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM kv")
+
+
+_backends: "weakref.WeakSet[SqliteBackend]" = weakref.WeakSet()
+
+
+def _after_fork():
+    for b in list(_backends):
+        b._connect()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def shared_backend(path: Optional[str]) -> Optional[SqliteBackend]:
+    return SqliteBackend(path) if path else None
+
+
+class TTLCache:
+    """
+    Bounded LRU where every entry also expires after `ttl_s`.
+    With a shared backend, local misses fall through to it and sets write through.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl_s: float = 3600.0,
+                 shared: Optional[SqliteBackend] = None,
+                 dumps: Callable[[Any], bytes] = lambda v: json.dumps(v).encode(),
+                 loads: Callable[[bytes], Any] = json.loads):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.shared = shared
+        self._dumps = dumps
+        self._loads = loads
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _local_get(self, key: Hashable) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def _local_set(self, key: Hashable, value: Any):
+        self._data[key] = (value, time.monotonic() + self.ttl_s)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._local_get(key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+        if self.shared is not None:
+            blob = self.shared.get(str(key))
+            if blob is not None:
+                value = self._loads(blob)
+                self._local_set(key, value)
+                self.shared_hits += 1
+                return value
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any):
+        self._local_set(key, value)
+        if self.shared is not None:
+            self.shared.set(str(key), self._dumps(value), self.ttl_s)
+
+    def clear(self):
+        self._data.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _unit(vec):
+    """float32 NumPy copy of `vec` scaled to unit length (zero vectors stay zero)."""
+    import numpy as np
+    v = np.array(vec, dtype=np.float32)
+    n = float(np.linalg.norm(v))
+    return v / n if n else v
+
+
+class _Rows:
+    """
+    One answer-cache partition: its cached query vectors, unit-normalized, as rows of a
+    float32 matrix, so a lookup is one matrix-vector product (BLAS / SIMD) instead of a
+    Python dot product per entry. Grows by doubling; removal moves the last row into the gap.
+    """
+
+    __slots__ = ("mat", "expires", "ids", "pos")
+
+    def __init__(self, dim: int):
+        import numpy as np
+        self.mat = np.empty((4, dim), dtype=np.float32)
+        self.expires = np.empty(4, dtype=np.float64)
+        self.ids: List[int] = []
+        self.pos: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, entry_id: int, unit, expires: float):
+        import numpy as np
+        n = len(self.ids)
+        if n == len(self.mat):
+            self.mat = np.concatenate([self.mat, np.empty_like(self.mat)])
+            self.expires = np.concatenate([self.expires, np.empty_like(self.expires)])
+        self.mat[n] = unit
+        self.expires[n] = expires
+        self.ids.append(entry_id)
+        self.pos[entry_id] = n
+
+    def remove(self, entry_id: int):
+        i, last = self.pos.pop(entry_id), len(self.ids) - 1
+        if i != last:
+            moved = self.ids[last]
+            self.mat[i], self.expires[i], self.ids[i] = self.mat[last], self.expires[last], moved
+            self.pos[moved] = i
+        self.ids.pop()
+
+
+class SemanticCache:
+    """
+    Answer cache for near-duplicate questions. Entries are partitioned by
+    (domain, clearance, retrieved chunk ids) so an answer is only ever reused for
+    a caller with the exact same access scope and grounding; within a partition a
+    hit needs cosine(query, cached query) >= threshold. Everything is dropped when
+    the index version changes (re-seed).
+    """
+
+    def __init__(self, threshold: float = 0.97, maxsize: int = 2048, ttl_s: float = 900.0):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.version: Any = None
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # id -> (partition, payload)
+        self._partitions: Dict[tuple, _Rows] = {}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def partition(domain: str, clearance: int, chunk_ids) -> tuple:
+        return (domain, int(clearance), tuple(sorted(str(c) for c in chunk_ids)))
+
+    def _check_version(self, version: Any):
+        if version != self.version:
+            if self._entries:
+                self.invalidate()
+            self.version = version
+
+    def _drop(self, entry_id: int):
+        part = self._entries.pop(entry_id)[0]
+        rows = self._partitions.get(part)
+        if rows is not None:
+            rows.remove(entry_id)
+            if not rows:
+                del self._partitions[part]
+
+    def get(self, partition: tuple, vec, version: Any = None) -> Optional[Dict[str, Any]]:
+        self._check_version(version)
+        rows = self._partitions.get(partition)
+        if rows is not None:
+            now = time.monotonic()
+            for i in sorted((rows.expires[:len(rows)] < now).nonzero()[0], reverse=True):
+                self._drop(rows.ids[i])
+            if rows:
+                # Every cached query in the partition scored at once (cosine: rows are unit length)
+                sims = rows.mat[:len(rows)] @ _unit(vec)
+                best = int(sims.argmax())
+                if sims[best] >= self.threshold:
+                    entry_id = rows.ids[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return self._entries[entry_id][1]
+        self.misses += 1
+        return None
+
+    def set(self, partition: tuple, vec, payload: Dict[str, Any], version: Any = None):
+        self._check_version(version)
+        entry_id = self._next_id
+        self._next_id += 1
+        unit = _unit(vec)
+        self._entries[entry_id] = (partition, payload)
+        rows = self._partitions.get(partition)
+        if rows is None:
+            rows = self._partitions[partition] = _Rows(len(unit))
+        rows.add(entry_id, unit, time.monotonic() + self.ttl_s)
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self):
+        self._entries.clear()
+        self._partitions.clear()
+        self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,188 @@
+# api/server/chunker.py
+# Token-budgeted, overlap-aware chunking of markdown / PDF-extracted text.
+#
+# Everything is a generator over lines: a document is never fully resident, only the
+# chunk being assembled. Each chunk carries the heading it sits under as `section`.
+import re
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+# Rough subword estimate that tracks Gemini/text-embedding tokenizers closely enough for
+# budgeting: one token per short word or punctuation mark, long words every ~4 chars.
+_PIECE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    n = 0
+    for piece in _PIECE.findall(text or ""):
+        n += 1 + (len(piece) - 1) // 6 if len(piece) > 6 else 1
+    return n
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Longest word-boundary prefix of `text` within max_tokens."""
+    out, used = [], 0
+    for word in text.split():
+        t = count_tokens(word)
+        if used + t > max_tokens:
+            break
+        out.append(word)
+        used += t
+    return " ".join(out)
+
+
+class TextChunk(NamedTuple):
+    index: int
+    section: str
+    text: str
+    tokens: int
+
+
+_MD_HEADING = re.compile(r"^\s{0,3}(#{1,6})\s+(.+?)\s*#*\s*$")
+# PDF extraction loses markup; numbered ("3.2 Travel Expenses") or ALL-CAPS short lines are headings
+_NUM_HEADING = re.compile(r"^\s*(\d+(?:\.\d+)*)\.?\s+([A-Z][^.!?]{0,78})$")
+_SENTENCE = re.compile(r"(?<=[.!?;])\s+")
+
+
+def _heading(line: str) -> Optional[str]:
+    m = _MD_HEADING.match(line)
+    if m:
+        return m.group(2).strip()
+    m = _NUM_HEADING.match(line)
+    if m:
+        return f"{m.group(1)} {m.group(2).strip()}"
+    s = line.strip()
+    if 3 <= len(s) <= 60 and s.isupper() and not s.endswith((".", ":")):
+        return s.title()
+    return None
+
+
+def _paragraphs(lines: Iterable[str]) -> Iterator[tuple]:
+    """Yield ("heading", text) / ("para", text) from a line stream."""
+    buf: List[str] = []
+    for raw in lines:
+        line = raw.replace("\f", " ").rstrip("\n")
+        if not line.strip():
+            if buf:
+                yield "para", " ".join(buf)
+                buf = []
+            continue
+        h = _heading(line)
+        if h is not None:
+            if buf:
+                yield "para", " ".join(buf)
+                buf = []
+            yield "heading", h
+            continue
+        # PDF extractors hyphenate line breaks ("reimburse-\nment")
+        if buf and buf[-1].endswith("-") and line[:1].islower():
+            buf[-1] = buf[-1][:-1] + line.strip()
+        else:
+            buf.append(line.strip())
+    if buf:
+        yield "para", " ".join(buf)
+
+
+def _units(text: str, max_tokens: int) -> Iterator[str]:
+    """Split an oversized paragraph into sentences, and oversized sentences into word runs."""
+    if count_tokens(text) <= max_tokens:
+        yield text
+        return
+    for sent in _SENTENCE.split(text):
+        if count_tokens(sent) <= max_tokens:
+            yield sent
+            continue
+        words, used = [], 0
+        for w in sent.split():
+            t = count_tokens(w)
+            if words and used + t > max_tokens:
+                yield " ".join(words)
+                words, used = [], 0
+            words.append(w)
+            used += t
+        if words:
+            yield " ".join(words)
+
+
+def chunk_lines(lines: Iterable[str], max_tokens: int = 400, overlap_tokens: int = 60,
+                min_tokens: int = 8) -> Iterator[TextChunk]:
+    """
+    Pack paragraphs (split further when needed) into chunks of at most `max_tokens`.
+    Consecutive chunks share up to `overlap_tokens` of trailing text; a new heading starts
+    a new chunk. A section (or a section's remainder) under `min_tokens` is carried forward
+    instead of emitted on its own: the next section's text follows it in the same chunk,
+    behind that section's heading, and the chunk keeps the section it starts in. Only the
+    document's last chunk may be shorter than `min_tokens`. No text is dropped or reordered.
+    """
+    section = ""
+    buf: List[tuple] = []  # (paragraph number, section, unit text)
+    buf_tokens = 0
+    fresh = 0  # tokens in buf that did not come from the previous chunk's overlap
+    fresh_at = 0  # buf[fresh_at:] are those units
+    index = 0
+
+    def render() -> str:
+        # sentences of one paragraph stay on one line; paragraphs are blank-line separated
+        out, last = [], None
+        for para, _, unit in buf:
+            out.append(unit if last is None else (" " if para == last else "\n\n") + unit)
+            last = para
+        return "".join(out)
+
+    def emit() -> TextChunk:
+        return TextChunk(index, buf[fresh_at][1], render(), buf_tokens)
+
+    def tail() -> List[tuple]:
+        out, used = [], 0
+        for item in reversed(buf):
+            t = count_tokens(item[2])
+            if used + t > overlap_tokens:
+                break
+            out.insert(0, item)
+            used += t
+        return out
+
+    for para, (kind, text) in enumerate(_paragraphs(lines)):
+        if kind == "heading":
+            if fresh >= min_tokens:
+                yield emit()
+                index += 1
+                buf = []
+            else:
+                # Too short to stand alone: carried into the next section's first chunk, with
+                # this heading where the new section's text starts (the overlap went out already)
+                buf = buf[fresh_at:]
+                if buf:
+                    buf.append((para, text, text))
+            buf_tokens = fresh = sum(count_tokens(u) for _, _, u in buf)
+            section, fresh_at = text, 0
+            continue
+        for unit in _units(text, max_tokens):
+            t = count_tokens(unit)
+            if buf and buf_tokens + t > max_tokens and 0 < fresh < min_tokens:
+                # Too short to go out on its own: top it up with the unit's first words
+                words = unit.split()
+                head = truncate_tokens(unit, max_tokens - buf_tokens)
+                if head:
+                    h = count_tokens(head)
+                    buf.append((para, section, head))
+                    buf_tokens += h
+                    fresh += h
+                    unit = " ".join(words[len(head.split()):])
+                    t -= h
+                    if not unit:
+                        continue
+            if buf and buf_tokens + t > max_tokens:
+                if fresh:
+                    yield emit()
+                    index += 1
+                buf = tail() if overlap_tokens else []
+                buf_tokens = sum(count_tokens(u) for _, _, u in buf)
+                if buf_tokens + t > max_tokens:
+                    buf, buf_tokens = [], 0
+                fresh, fresh_at = 0, len(buf)
+            buf.append((para, section, unit))
+            buf_tokens += t
+            fresh += t
+    # Last chunk: short or not, nothing follows to carry it into
+    if fresh:
+        yield emit()
@@ -0,0 +1,138 @@
+# api/server/clients.py
+# One place that configures Vertex and hands out warm, reused model handles.
+#
+# Handles are keyed by model id (and system instruction); GenerationConfig objects by
+# their parameters. Nothing is constructed per request. Context-cache handles are built
+# here too but kept (and expired) by prompts.py.
+#
+# The Vertex SDK is imported on first use, not at module import: it is the bulk of the
+# process's import time, and /health should answer before anyone has paid for it.
+# Handles own gRPC channels, which must not cross a fork: a forked worker (SERVE_MODE=workers)
+# starts with none and builds its own.
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+log = logging.getLogger("org-rag.clients")
+
+PROJECT = os.getenv("GCP_PROJECT", "teja-sunhack")
+LOCATION = os.getenv("GCP_LOCATION", "us-central1")
+
+_initialized = False
+_models: Dict[Tuple[str, Optional[str]], Any] = {}
+_configs: Dict[Tuple, Any] = {}
+_embedders: Dict[str, Any] = {}
+
+
+def init():
+    """vertexai.init exactly once per process, with the same project/region everywhere."""
+    global _initialized
+    if not _initialized:
+        import vertexai
+        vertexai.init(project=PROJECT, location=LOCATION)
+        _initialized = True
+
+
+def generative_model(model_id: str, system_instruction: Optional[str] = None):
+    """vertexai.generative_models.GenerativeModel, built once per (model, system instruction)."""
+    key = (model_id, system_instruction)
+    model = _models.get(key)
+    if model is None:
+        init()
+        from vertexai.generative_models import GenerativeModel
+        kwargs = {"system_instruction": system_instruction} if system_instruction else {}
+        model = _models[key] = GenerativeModel(model_id, **kwargs)
+    return model
+
+
+def cached_content_model(model_id: str, system_instruction: str, ttl_s: float):
+    """
+    GenerativeModel over a provider-side CachedContent holding `system_instruction`: requests
+    send only their own contents, the cached tokens are neither re-sent nor re-processed.
+    Blocking (one create RPC); prompts.py calls it off the event loop and owns the expiry.
+    """
+    init()
+    import datetime
+    from vertexai.preview import caching
+    from vertexai.preview.generative_models import GenerativeModel
+    cached = caching.CachedContent.create(
+        model_name=model_id,
+        system_instruction=system_instruction,
+        ttl=datetime.timedelta(seconds=ttl_s),
+    )
+    return GenerativeModel.from_cached_content(cached_content=cached)
+
+
+def generation_config(temperature: float, max_output_tokens: int,
+                      response_mime_type: Optional[str] = None):
+    key = (float(temperature), int(max_output_tokens), response_mime_type)
+    cfg = _configs.get(key)
+    if cfg is None:
+        from vertexai.generative_models import GenerationConfig
+        kwargs: Dict[str, Any] = {"temperature": key[0], "max_output_tokens": key[1]}
+        if response_mime_type:
+            kwargs["response_mime_type"] = response_mime_type
+        cfg = _configs[key] = GenerationConfig(**kwargs)
+    return cfg
+
+
+def embedding_model(model_id: str):
+    """vertexai.language_models.TextEmbeddingModel, loaded once per model id."""
+    model = _embedders.get(model_id)
+    if model is None:
+        init()
+        from vertexai.language_models import TextEmbeddingModel
+        model = _embedders[model_id] = TextEmbeddingModel.from_pretrained(model_id)
+    return model
+
+
+def preimport():
+    """Import the SDK modules without creating any client (pre-fork master: workers inherit the imports)."""
+    import vertexai  # noqa: F401
+    import vertexai.generative_models  # noqa: F401
+    import vertexai.language_models  # noqa: F401
+    from google.cloud import aiplatform_v1  # noqa: F401
+
+
+def reset():
+    """Drop every handle (and with it its channel); the next call builds fresh ones."""
+    _models.clear()
+    _embedders.clear()
+
+
+os.register_at_fork(after_in_child=reset)
+
+
+async def warmup(generative_ids: Iterable[str] = (), embed_ids: Iterable[str] = (),
+                 extra: Iterable = (), timeout_s: float = 10.0) -> Dict[str, Any]:
+    """
+    Build handles and push one cheap call through each so channel setup / auth happens
+    before the first user request: count_tokens for generative models (not billed),
+    a one-word embedding for embedders, plus any `extra` (name, zero-arg async callable)
+    jobs (e.g. the ANN client). Each job builds its handle inside its own guard, so one
+    bad model id only fails that job. Failures are logged and reported as "error: <type>"
+    (jobs cut off by `timeout_s` included), never raised.
+    """
+    report: Dict[str, Any] = {}
+
+    async def timed(name: str, make: Callable[[], Awaitable]):
+        t0 = time.perf_counter()
+        try:
+            await make()
+            report[name] = round((time.perf_counter() - t0) * 1000, 1)
+        except Exception as e:
+            log.warning("warmup %s failed: %s", name, e)
+            report[name] = f"error: {type(e).__name__}"
+
+    jobs = [(f"generate:{m}", lambda m=m: generative_model(m).count_tokens_async("ping")) for m in set(generative_ids)]
+    jobs += [(f"embed:{m}", lambda m=m: embedding_model(m).get_embeddings_async(["ping"])) for m in set(embed_ids)]
+    jobs += list(extra)
+    try:
+        await asyncio.wait_for(asyncio.gather(*(timed(name, make) for name, make in jobs)), timeout_s)
+    except asyncio.TimeoutError:
+        log.warning("warmup timed out after %.1fs", timeout_s)
+        for name, _ in jobs:
+            report.setdefault(name, "error: TimeoutError")
+    return report
@@ -0,0 +1,51 @@
+# api/server/gunicorn.conf.py
+# SERVE_MODE=workers: one gunicorn master, WEB_CONCURRENCY uvicorn workers (see Dockerfile).
+#
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# With PRELOAD=1 the master imports the app and builds everything that is safe to share
+# before forking: metadata store, BM25 index, the memory-mapped local index, NumPy and the
+# Vertex SDK imports. Workers start with that already in place and share the pages
+# copy-on-write. Anything that holds a socket or a SQLite connection is re-created in each
+# worker by the os.register_at_fork hooks in clients / retriever / cache / meta_store.
+# gRPC channels and model handles are still created lazily, per worker, by its own warmup.
+import os
+import gc
+import time
+import tempfile
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "0")) or multiprocessing.cpu_count()
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("PRELOAD", "1") == "1"
+# Longer than the generation deadline (GENERATE_TIMEOUT_MS, 30 s) so gunicorn never kills a live request
+timeout = int(os.getenv("WORKER_TIMEOUT_S", "120"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT_S", "30"))
+keepalive = int(os.getenv("KEEPALIVE_S", "5"))
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+# Caches every worker on the host shares: SQLite files on tmpfs (/dev/shm is shared memory).
+# Set before the app is imported; an explicit value (e.g. a path on a volume) wins.
+_SHM = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+os.environ.setdefault("EMBED_CACHE_SHARED", os.path.join(_SHM, "org-rag-embed.sqlite"))
+os.environ.setdefault("PLANNER_CACHE_SHARED", os.path.join(_SHM, "org-rag-planner.sqlite"))
+
+
+def when_ready(server):
+    # Runs in the master after the app import, before the first fork
+    if not preload_app:
+        return
+    import clients
+    import retriever
+    t0 = time.perf_counter()
+    try:
+        clients.preimport()
+    except ImportError as e:  # SDK missing: workers import it on demand, as in single mode
+        server.log.warning("preload: Vertex SDK not imported (%s)", e)
+    retriever.preload()
+    # Long-lived objects built above stay out of the workers' GC passes, which would
+    # otherwise touch (and un-share) their pages
+    gc.freeze()
+    server.log.info("preloaded shared state in %.0f ms", (time.perf_counter() - t0) * 1000)
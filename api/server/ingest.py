@@ -0,0 +1,472 @@
+# api/server/ingest.py
+# Batched, parallel, incremental ingestion: documents dir → chunks → embeddings → index upserts.
+#
+#   python ingest.py ./docs                          # Vertex embeddings + Vector Search upserts
+#   python ingest.py ./docs --backend local          # Vertex embeddings + LocalIndex
+#   python ingest.py ./docs --backend local --embedder hash   # no GCP at all (tests; not servable)
+#
+# Documents are .md/.txt files. Domain comes from front matter (`domain: finance`) or the
+# parent directory name; `clearance_min` from front matter or --clearance. Content hashes of
+# every chunk are kept in a state file, so a re-run only embeds/upserts what changed and
+# removes chunks that disappeared. The state records which sink and embedder it describes
+# (one file per backend by default); against any other target every chunk counts as changed.
+# Chunks stream from the reader into embed batches, so a run never holds the corpus. Progress
+# is checkpointed every `sink.checkpoint_s` seconds and when a run fails, so an interrupted
+# run resumes where it stopped.
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import chunker
+import vectors
+from vectors import Vector
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PROJECT = os.getenv("GCP_PROJECT", "teja-sunhack")
+LOCATION = os.getenv("GCP_LOCATION", "us-central1")
+INDEX_ID = os.getenv("ME_INDEX_ID", "3872376598934061056")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-004")
+
+# text-embedding-004 accepts up to 250 inputs and ~20k tokens per request
+EMBED_MAX_BATCH = 250
+EMBED_MAX_BATCH_TOKENS = 20000
+
+
+class Chunk(NamedTuple):
+    id: str
+    text: str
+    meta: Dict[str, Any]  # doc_id, section, chunk, domain, clearance_min
+
+
+def content_hash(chunk: Chunk) -> str:
+    # Metadata is part of the hash: moving a chunk to another domain/clearance must re-upsert it
+    payload = json.dumps({"text": chunk.text, "meta": chunk.meta}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# ---------------- reading + chunking ----------------
+def _front_matter(f) -> Dict[str, str]:
+    """Consume a leading `---` ... `---` block from an open file, if there is one."""
+    first = f.readline()
+    if first.strip() != "---":
+        f.seek(0)
+        return {}
+    fm = {}
+    for line in f:
+        if line.strip() == "---":
+            break
+        if ":" in line:
+            k, v = line.split(":", 1)
+            fm[k.strip()] = v.strip()
+    return fm
+
+
+def _slug(s: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", s.lower()).strip("-")
+
+
+def read_documents(root: str, default_domain: Optional[str], default_clearance: int,
+                   max_tokens: int = 400, overlap_tokens: int = 60) -> Iterator[Chunk]:
+    for dirpath, _, files in os.walk(root):
+        for name in sorted(files):
+            if not name.endswith((".md", ".txt")):
+                continue
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, root)
+            parent = os.path.basename(os.path.dirname(path)) if os.path.dirname(rel) else None
+            with open(path, encoding="utf-8", errors="replace") as f:
+                fm = _front_matter(f)
+                domain = (fm.get("domain") or default_domain or parent or "general").lower()
+                clearance = int(fm.get("clearance_min") or default_clearance)
+                doc_id = fm.get("doc_id") or name
+                # the file is streamed line by line through the chunker
+                for c in chunker.chunk_lines(f, max_tokens=max_tokens, overlap_tokens=overlap_tokens):
+                    meta = {"doc_id": doc_id, "section": c.section, "chunk": c.text,
+                            "domain": domain, "clearance_min": clearance}
+                    yield Chunk(f"{_slug(rel)}-{c.index}", c.text, meta)
+
+
+def chunks_from_rows(rows: Iterable[tuple]) -> Iterator[Chunk]:
+    """seed_vectors.DOCS-style rows: (id, text, domain, clearance_min, doc_id, section)."""
+    for did, text, domain, cmin, doc_id, section in rows:
+        meta = {"doc_id": doc_id, "section": section, "chunk": text, "domain": domain, "clearance_min": cmin}
+        yield Chunk(did, text, meta)
+
+
+# ---------------- retry ----------------
+class RetryableError(Exception):
+    pass
+
+
+# Statuses worth another try; google.api_core errors raised by the SDK carry theirs as `.code`
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def _retryable(e: BaseException) -> bool:
+    """Rate limits, server errors, timeouts and dropped connections; anything else is permanent."""
+    if isinstance(e, (RetryableError, TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    if getattr(e, "code", None) in RETRY_STATUS:
+        return True
+    try:
+        import requests
+    except ImportError:
+        return False
+    return isinstance(e, (requests.ConnectionError, requests.Timeout))
+
+
+async def with_retry(fn: Callable, *, attempts: int = 5, base_delay: float = 0.5, what: str = "call"):
+    for attempt in range(1, attempts + 1):
+        try:
+            return await fn()
+        except Exception as e:
+            # A 4xx (bad payload, permissions, missing index) fails the same way every time
+            if attempt == attempts or not _retryable(e):
+                raise
+            delay = base_delay * (2 ** (attempt - 1)) * (0.5 + random.random())
+            print(f"  {what} failed ({type(e).__name__}: {e}); retry {attempt}/{attempts - 1} in {delay:.1f}s",
+                  file=sys.stderr)
+            await asyncio.sleep(delay)
+
+
+# ---------------- embedders ----------------
+class VertexEmbedder:
+    max_batch = EMBED_MAX_BATCH
+
+    def __init__(self, model_id: str = EMBED_MODEL):
+        import clients
+        self.id = model_id
+        from vertexai.language_models import TextEmbeddingInput
+        self._model = clients.embedding_model(model_id)
+        self._input = TextEmbeddingInput
+
+    async def embed(self, texts: List[str]) -> List[Vector]:
+        res = await self._model.get_embeddings_async([self._input(t, "RETRIEVAL_DOCUMENT") for t in texts])
+        return [vectors.pack(r.values) for r in res]
+
+
+class HashEmbedder:
+    """Deterministic offline stand-in: hashed bag of words, L2 normalized."""
+    max_batch = EMBED_MAX_BATCH
+
+    def __init__(self, dim: int = 768):
+        self.dim = dim
+        self.id = f"hash-{dim}"
+
+    async def embed(self, texts: List[str]) -> List[Vector]:
+        out = []
+        for t in texts:
+            v = [0.0] * self.dim
+            for tok in re.findall(r"\w+", t.lower()):
+                h = int(hashlib.md5(tok.encode()).hexdigest(), 16)
+                v[h % self.dim] += 1.0 if (h >> 8) & 1 else -1.0
+            n = sum(x * x for x in v) ** 0.5 or 1.0
+            out.append(vectors.pack(x / n for x in v))
+        return out
+
+
+def make_embedder(kind: str):
+    if kind == "hash":
+        return HashEmbedder()
+    return VertexEmbedder()
+
+
+# ---------------- index sinks ----------------
+def _datapoint(chunk: Chunk, vec: Vector) -> Dict[str, Any]:
+    meta_json = json.dumps(chunk.meta)
+    return {
+        "datapointId": chunk.id,
+        "featureVector": vectors.to_json(vec),  # float32 precision, not 17-digit float reprs
+        "crowdingTag": {"crowdingAttribute": meta_json},
+        "restricts": [
+            {"namespace": "meta", "allowList": [meta_json]},
+            {"namespace": "domain", "allowList": [chunk.meta["domain"]]},
+        ],
+        "numericRestricts": [{"namespace": "clearance_min", "valueInt": int(chunk.meta["clearance_min"])}],
+    }
+
+
+class VertexIndexSink:
+    max_batch = 500
+    checkpoint_s = 30.0  # how often the pipeline persists progress (None: only at the end)
+
+    def __init__(self, index_id: str = INDEX_ID):
+        import google.auth
+        self._creds, _ = google.auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+        self._base = f"https://{LOCATION}-aiplatform.googleapis.com/v1/projects/{PROJECT}/locations/{LOCATION}/indexes/{index_id}"
+        self.id = f"vertex:{PROJECT}/{LOCATION}/{index_id}"
+
+    def _post(self, verb: str, body: Dict[str, Any]):
+        import requests
+        from google.auth.transport.requests import Request
+        if not self._creds.valid:
+            self._creds.refresh(Request())
+        r = requests.post(f"{self._base}:{verb}", timeout=120, data=json.dumps(body),
+                          headers={"Authorization": f"Bearer {self._creds.token}", "Content-Type": "application/json"})
+        if r.status_code == 429 or r.status_code >= 500:
+            raise RetryableError(f"{verb}: {r.status_code} {r.text[:200]}")
+        if r.status_code >= 300:
+            raise RuntimeError(f"{verb} failed: {r.status_code} {r.text}")
+
+    async def upsert(self, items: List[tuple]):
+        await asyncio.to_thread(self._post, "upsertDatapoints", {"datapoints": [_datapoint(c, v) for c, v in items]})
+
+    async def remove(self, ids: List[str]):
+        await asyncio.to_thread(self._post, "removeDatapoints", {"datapointIds": ids})
+
+    async def commit(self):
+        pass  # every upsert / remove is durable once it returns
+
+
+class LocalIndexSink:
+    """
+    Writes into a LocalIndex directory (RETRIEVER_BACKEND=local). Upserts and removals are
+    buffered in memory and commit() builds and saves the index once: rebuilding it (k-means
+    included, for IVF) per batch made a large ingest quadratic.
+    """
+    max_batch = 500
+    checkpoint_s = None  # a commit is a full build: once, at the end of the run
+
+    def __init__(self, path: str, embedder: str, dtype: Optional[str] = None, quant: Optional[str] = None):
+        self.path = path
+        self.id = f"local:{os.path.abspath(path)}"
+        self.embedder = embedder  # recorded in the index; the server refuses any other query model
+        self.dtype = dtype  # vectors.npy as float32 / float16 (default LOCAL_INDEX_DTYPE)
+        self.quant = quant  # "int8" also writes quantized codes (default LOCAL_INDEX_QUANT)
+        self._rows: Optional[Dict[str, tuple]] = None  # datapoint id -> (vector, meta)
+        self._dirty = False
+
+    def _load(self) -> Dict[str, tuple]:
+        if self._rows is None:
+            from local_index import LocalIndex
+            self._rows = {}
+            if os.path.exists(os.path.join(self.path, "ids.json")):
+                idx = LocalIndex.load(self.path, mmap=False)
+                if idx.embedder != self.embedder:
+                    # Rows from another model can't share the index; this run rewrites it
+                    print(f"  {self.path} holds {idx.embedder} vectors, not {self.embedder}; starting it over",
+                          file=sys.stderr)
+                    self._dirty = True
+                    return self._rows
+                for n, dp_id in enumerate(idx.ids):
+                    self._rows[dp_id] = (idx.vectors[n], idx.metas.get(dp_id, {}))
+        return self._rows
+
+    async def upsert(self, items: List[tuple]):
+        rows = self._load()
+        for chunk, vec in items:
+            rows[chunk.id] = (vec, chunk.meta)
+        self._dirty = True
+
+    async def remove(self, ids: List[str]):
+        rows = self._load()
+        for dp_id in ids:
+            rows.pop(dp_id, None)
+        self._dirty = True
+
+    async def commit(self):
+        if not self._dirty:
+            return
+        import numpy as np
+        import local_index
+        rows = self._load()
+        if not rows:
+            import shutil
+            shutil.rmtree(self.path, ignore_errors=True)
+        else:
+            ids = list(rows)
+            vecs = np.stack([np.asarray(rows[i][0], dtype=np.float32) for i in ids])
+            index = local_index.LocalIndex.build(ids, vecs, {i: rows[i][1] for i in ids},
+                                                 quant=self.quant or local_index.LOCAL_INDEX_QUANT,
+                                                 embedder=self.embedder)
+            index.save(self.path, dtype=self.dtype or local_index.LOCAL_INDEX_DTYPE)
+        self._dirty = False
+
+
+# ---------------- pipeline ----------------
+def _write_json(path: str, data: Any):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _load_json(path: str, default: Any) -> Any:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def _embed_batches(chunks: Iterable[Chunk], max_batch: int) -> Iterator[List[Chunk]]:
+    # Respect both the per-request input count and the per-request token budget (~4 chars/token)
+    batch, tokens = [], 0
+    for c in chunks:
+        t = len(c.text) // 4 + 1
+        if batch and (len(batch) >= max_batch or tokens + t > EMBED_MAX_BATCH_TOKENS):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(c)
+        tokens += t
+    if batch:
+        yield batch
+
+
+async def ingest(chunks: Iterable[Chunk], embedder, sink, *, state_path: str, meta_path: str,
+                 concurrency: int = 4, upsert_batch: Optional[int] = None, prune: bool = False,
+                 dry_run: bool = False) -> Dict[str, int]:
+    target = {"sink": sink.id, "embedder": embedder.id}
+    state = _load_json(state_path, {"target": target, "chunks": {}})
+    if state.get("target") != target:
+        # Hashes recorded for another index (or another vector space) say nothing about this one
+        print(f"  {state_path} describes {state.get('target')}, not {target}; treating every chunk as changed",
+              file=sys.stderr)
+        state = {"target": target, "chunks": {}}
+    done: Dict[str, str] = state["chunks"]
+    metas: Dict[str, Any] = _load_json(meta_path, {})
+    stats = {"chunks": 0, "changed": 0, "unchanged": 0, "removed": 0}
+    seen = set()
+
+    def changed() -> Iterator[Chunk]:
+        for c in chunks:
+            seen.add(c.id)
+            stats["chunks"] += 1
+            if done.get(c.id) == content_hash(c):
+                stats["unchanged"] += 1
+            else:
+                stats["changed"] += 1
+                yield c
+
+    def record(items: Iterable[tuple] = (), removed: Iterable[str] = ()):
+        for c, _ in items:
+            done[c.id] = content_hash(c)
+            metas[c.id] = c.meta
+        for i in removed:
+            done.pop(i, None)
+            metas.pop(i, None)
+
+    last_checkpoint = time.monotonic()
+    checkpoint_lock = asyncio.Lock()
+
+    async def checkpoint(force: bool = False):
+        nonlocal last_checkpoint
+        async with checkpoint_lock:
+            if not force and (sink.checkpoint_s is None
+                              or time.monotonic() - last_checkpoint < sink.checkpoint_s):
+                return
+            # Snapshot first: anything recorded while the sink commits is not covered by it
+            snapshot = {"target": target, "chunks": dict(done)}, dict(metas)
+            await sink.commit()
+            _write_json(meta_path, snapshot[1])
+            _write_json(state_path, snapshot[0])
+            last_checkpoint = time.monotonic()
+
+    if dry_run:
+        for _ in changed():
+            pass
+        stats["removed"] = len(set(done) - seen) if prune else 0
+        return stats
+
+    sem = asyncio.Semaphore(concurrency)
+    upsert_batch = upsert_batch or sink.max_batch
+    pending: List[tuple] = []
+    lock = asyncio.Lock()
+
+    async def flush(items: List[tuple]):
+        await with_retry(lambda: sink.upsert(items), what=f"upsert of {len(items)}")
+        record(items)
+        print(f"  upserted {len(items)} (total done {len(done)})")
+        await checkpoint()
+
+    async def embed_one(batch: List[Chunk]):
+        async with sem:
+            vecs = await with_retry(lambda: embedder.embed([c.text for c in batch]), what=f"embed of {len(batch)}")
+        ready = []
+        async with lock:
+            pending.extend(zip(batch, vecs))
+            while len(pending) >= upsert_batch:
+                ready.append(pending[:upsert_batch])
+                del pending[:upsert_batch]
+        for items in ready:
+            async with sem:
+                await flush(items)
+
+    # At most `concurrency` batches embedding and as many queued behind them: the reader
+    # stays just ahead of the embedder instead of materializing every changed chunk
+    running = set()
+    try:
+        for batch in _embed_batches(changed(), embedder.max_batch):
+            if len(running) >= 2 * concurrency:
+                finished, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    task.result()  # re-raise the first failure
+            running.add(asyncio.ensure_future(embed_one(batch)))
+        await asyncio.gather(*running)
+        if pending:
+            await flush(list(pending))
+        stale = sorted(set(done) - seen) if prune else []
+        stats["removed"] = len(stale)
+        for i in range(0, len(stale), upsert_batch):
+            part = stale[i:i + upsert_batch]
+            await with_retry(lambda: sink.remove(part), what=f"remove of {len(part)}")
+            record(removed=part)
+    except Exception:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        await checkpoint(force=True)  # keep what was upserted: a re-run resumes from here
+        raise
+    if stats["changed"] or stats["removed"]:
+        await checkpoint(force=True)
+    return stats
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Chunk, embed and upsert a directory of documents")
+    ap.add_argument("docs", help="directory of .md/.txt documents")
+    ap.add_argument("--domain", help="default domain (else front matter, else parent directory)")
+    ap.add_argument("--clearance", type=int, default=1, help="default clearance_min")
+    ap.add_argument("--backend", choices=("vertex", "local"), default="vertex")
+    ap.add_argument("--embedder", choices=("vertex", "hash"), default="vertex",
+                    help="hash: offline stand-in for tests; the server won't serve a hash-embedded index")
+    ap.add_argument("--local-index", default=os.getenv("LOCAL_INDEX_DIR", os.path.join(HERE, "local_index")))
+    ap.add_argument("--vector-dtype", choices=("float32", "float16"), default=None,
+                    help="local index vector storage (default LOCAL_INDEX_DTYPE / VECTOR_DTYPE)")
+    ap.add_argument("--quant", choices=("none", "int8"), default=None,
+                    help="also store int8 codes for the local index scan (default LOCAL_INDEX_QUANT)")
+    ap.add_argument("--meta-out", default=os.getenv("SEED_META_PATH", os.path.join(HERE, "seed_meta.json")))
+    ap.add_argument("--state", default=None, help="resume state file (default .ingest_state.<backend>.json)")
+    ap.add_argument("--concurrency", type=int, default=4, help="parallel embed/upsert requests")
+    ap.add_argument("--upsert-batch", type=int, default=None)
+    ap.add_argument("--max-tokens", type=int, default=400, help="chunk size budget")
+    ap.add_argument("--overlap-tokens", type=int, default=60, help="overlap between consecutive chunks")
+    ap.add_argument("--prune", action="store_true", help="remove datapoints whose chunks no longer exist")
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+
+    embedder = make_embedder(args.embedder)
+    if args.backend == "local":
+        sink = LocalIndexSink(args.local_index, embedder.id, dtype=args.vector_dtype, quant=args.quant)
+    else:
+        sink = VertexIndexSink()
+
+    t0 = time.perf_counter()
+    chunks = read_documents(args.docs, args.domain, args.clearance, args.max_tokens, args.overlap_tokens)
+    state_path = args.state or os.path.join(HERE, f".ingest_state.{args.backend}.json")
+    stats = asyncio.run(ingest(chunks, embedder, sink, state_path=state_path, meta_path=args.meta_out,
+                               concurrency=args.concurrency, upsert_batch=args.upsert_batch,
+                               prune=args.prune, dry_run=args.dry_run))
+    print(f"{stats} in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
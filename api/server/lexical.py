@@ -0,0 +1,198 @@
+# api/server/lexical.py
+# In-process BM25 over the same chunk metadata the vector index is seeded with.
+#
+# Dense embeddings blur exact policy tokens ("I-9", "SEV-1", "PO-Thresholds", "$5,000");
+# this side catches them. Postings are flat arrays (doc ordinal + term frequency per
+# term), documents are appended and tombstoned, so a re-seed only touches changed chunks.
+import re
+import math
+import threading
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Keep codes and amounts whole ("sev-1", "po-thresholds", "5000") and also index their
+# parts, so "SEV 1" still lands near "SEV-1"
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_/.][a-z0-9]+)*")
+_AMOUNT = re.compile(r"(?<=\d),(?=\d{3})")
+_STOP = frozenset("""a an and are as at be by for from has have how i if in is it its of on or our
+that the their this to was we what when where which who why will with you your do does can""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    out: List[str] = []
+    for tok in _TOKEN.findall(_AMOUNT.sub("", (text or "").lower())):
+        tok = tok.rstrip(".")
+        if not tok or tok in _STOP:
+            continue
+        out.append(tok)
+        parts = re.split(r"[-_/.]", tok)
+        if len(parts) > 1:
+            out.extend(p for p in parts if p and p not in _STOP)
+    return out
+
+
+class LexicalIndex:
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1, self.b = k1, b
+        self.version: Optional[float] = None
+        # term -> term ordinal; per term: doc ordinals + tfs (parallel, append-only, ascending)
+        self._terms: Dict[str, int] = {}
+        self._post_docs: List[array] = []
+        self._post_tfs: List[array] = []
+        self._df = array("I")
+        # per doc ordinal
+        self._ids: List[str] = []
+        self._len = array("I")
+        self._clearance = array("B")
+        self._domain = array("H")
+        self._alive = bytearray()
+        self._doc_terms: List[array] = []
+        self._sig: List[int] = []
+        self._ord: Dict[str, int] = {}
+        self._domains: Dict[str, int] = {}
+        self._live = 0
+        self._total_len = 0
+        self._lock = threading.Lock()
+
+    # ---- updates ----
+    def _domain_code(self, domain: Optional[str]) -> int:
+        return self._domains.setdefault(domain or "", len(self._domains))
+
+    def _remove(self, ord_: int):
+        if not self._alive[ord_]:
+            return
+        self._alive[ord_] = 0
+        for t in self._doc_terms[ord_]:
+            self._df[t] -= 1
+        self._doc_terms[ord_] = array("I")
+        self._live -= 1
+        self._total_len -= self._len[ord_]
+
+    def upsert(self, dp_id: str, text: str, domain: Optional[str], clearance_min: int):
+        sig = hash((text, domain, int(clearance_min or 0)))
+        with self._lock:
+            old = self._ord.get(dp_id)
+            if old is not None:
+                if self._alive[old] and self._sig[old] == sig:
+                    return
+                self._remove(old)
+            toks = tokenize(text)
+            tf: Dict[int, int] = {}
+            for tok in toks:
+                t = self._terms.get(tok)
+                if t is None:
+                    t = self._terms[tok] = len(self._post_docs)
+                    self._post_docs.append(array("I"))
+                    self._post_tfs.append(array("H"))
+                    self._df.append(0)
+                tf[t] = tf.get(t, 0) + 1
+            ord_ = len(self._ids)
+            for t, n in tf.items():
+                self._post_docs[t].append(ord_)
+                self._post_tfs[t].append(min(n, 0xFFFF))
+                self._df[t] += 1
+            self._ids.append(dp_id)
+            self._len.append(len(toks))
+            self._clearance.append(max(0, min(int(clearance_min or 0), 255)))
+            self._domain.append(self._domain_code(domain))
+            self._alive.append(1)
+            self._doc_terms.append(array("I", tf.keys()))
+            self._sig.append(sig)
+            self._ord[dp_id] = ord_
+            self._live += 1
+            self._total_len += len(toks)
+
+    def remove(self, dp_id: str):
+        with self._lock:
+            ord_ = self._ord.pop(dp_id, None)
+            if ord_ is not None:
+                self._remove(ord_)
+
+    def sync(self, items: Iterable[Tuple[str, Dict[str, Any]]], version: Optional[float] = None):
+        """Bring the index in line with a full (id, meta) listing: upsert changed, drop missing."""
+        seen = set()
+        for dp_id, m in items:
+            seen.add(dp_id)
+            # Section titles carry a lot of the exact terms ("PO-Thresholds"), so index them too
+            text = f"{m.get('section') or ''}\n{m.get('chunk') or ''}"
+            self.upsert(dp_id, text, m.get("domain"), m.get("clearance_min") or 0)
+        for dp_id in [i for i in self._ord if i not in seen]:
+            self.remove(dp_id)
+        if len(self._ids) > 2 * max(self._live, 64):
+            self.compact()
+        self.version = version
+
+    def compact(self):
+        """Rewrite postings without tombstoned docs (re-seeds that replace most chunks)."""
+        with self._lock:
+            keep = [o for o in range(len(self._ids)) if self._alive[o]]
+            remap = {o: i for i, o in enumerate(keep)}
+            post_docs, post_tfs = [], []
+            for docs, tfs in zip(self._post_docs, self._post_tfs):
+                nd, nt = array("I"), array("H")
+                for d, n in zip(docs, tfs):
+                    i = remap.get(d)
+                    if i is not None:
+                        nd.append(i)
+                        nt.append(n)
+                post_docs.append(nd)
+                post_tfs.append(nt)
+            self._post_docs, self._post_tfs = post_docs, post_tfs
+            self._ids = [self._ids[o] for o in keep]
+            self._len = array("I", (self._len[o] for o in keep))
+            self._clearance = array("B", (self._clearance[o] for o in keep))
+            self._domain = array("H", (self._domain[o] for o in keep))
+            self._doc_terms = [self._doc_terms[o] for o in keep]
+            self._sig = [self._sig[o] for o in keep]
+            self._alive = bytearray(b"\x01" * len(keep))
+            self._ord = {dp_id: i for i, dp_id in enumerate(self._ids)}
+
+    # ---- query ----
+    def search(self, query: str, k: int = 8, domain: Optional[str] = None,
+               max_clearance: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Top-k (datapoint id, bm25 score), filtered to domain / clearance_min <= max_clearance."""
+        terms = {t for t in (self._terms.get(tok) for tok in tokenize(query)) if t is not None}
+        if not terms or not self._live:
+            return []
+        dom = self._domains.get(domain or "") if domain is not None else None
+        if domain is not None and dom is None:
+            return []
+        with self._lock:
+            n, avg = self._live, self._total_len / self._live
+            k1, b = self.k1, self.b
+            scores: Dict[int, float] = {}
+            for t in terms:
+                df = self._df[t]
+                if not df:
+                    continue
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for d, tf in zip(self._post_docs[t], self._post_tfs[t]):
+                    if not self._alive[d]:
+                        continue
+                    if dom is not None and self._domain[d] != dom:
+                        continue
+                    if max_clearance is not None and self._clearance[d] > max_clearance:
+                        continue
+                    norm = tf + k1 * (1 - b + b * self._len[d] / avg)
+                    scores[d] = scores.get(d, 0.0) + idf * tf * (k1 + 1) / norm
+            top = sorted(scores.items(), key=lambda kv: -kv[1])[:k]
+            return [(self._ids[d], s) for d, s in top]
+
+    def __len__(self):
+        return self._live
+
+    def stats(self) -> Dict[str, Any]:
+        return {"docs": self._live, "tombstones": len(self._ids) - self._live, "terms": len(self._terms),
+                "postings": sum(len(p) for p in self._post_docs), "version": self.version}
+
+
+def rrf(rankings: Iterable[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Reciprocal rank fusion: sum of 1 / (k + rank) over every list an id appears in."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, dp_id in enumerate(ranking, start=1):
+            scores[dp_id] = scores.get(dp_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda kv: -kv[1])
@@ -0,0 +1,136 @@
+# api/server/limits.py
+# Per-dependency concurrency caps with bounded waiting (backpressure), and a
+# request-level admission controller in front of the whole pipeline.
+import os
+import time
+import asyncio
+
+
+class Overloaded(Exception):
+    """Raised when a dependency's wait queue is full; the API maps it to 503."""
+
+    def __init__(self, name: str):
+        super().__init__(f"{name} is overloaded")
+        self.name = name
+
+
+class Limiter:
+    """
+    At most `concurrency` calls in flight; up to `max_waiting` more may queue.
+    Anything beyond that fails fast with Overloaded instead of piling up latency.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_waiting: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self.in_flight = 0
+        self.waiting = 0
+        self._sem = asyncio.Semaphore(concurrency)
+
+    async def __aenter__(self):
+        if self._sem.locked() and self.waiting >= self.max_waiting:
+            raise Overloaded(self.name)
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._sem.release()
+        return False
+
+    def stats(self):
+        return {"in_flight": self.in_flight, "waiting": self.waiting,
+                "concurrency": self.concurrency, "max_waiting": self.max_waiting}
+
+
+def _from_env(name: str, concurrency: int, max_waiting: int) -> Limiter:
+    key = name.upper()
+    return Limiter(
+        name,
+        int(os.getenv(f"{key}_CONCURRENCY", concurrency)),
+        int(os.getenv(f"{key}_MAX_WAITING", max_waiting)),
+    )
+
+
+# ---- One limiter per remote dependency (env overridable, e.g. GENERATE_CONCURRENCY=300) ----
+EMBED = _from_env("embed", 64, 512)
+ANN = _from_env("ann", 64, 512)
+PLANNER = _from_env("planner", 128, 512)
+GENERATE = _from_env("generate", 256, 512)
+
+ALL = (EMBED, ANN, PLANNER, GENERATE)
+
+
+def stats():
+    return {l.name: l.stats() for l in ALL}
+
+
+# ---- Admission: shed new requests (429) before latency collapses ----
+class AdmissionController:
+    """
+    Per-process gate checked once per request, before any work is done. A request is
+    turned away when this worker already runs `max_in_flight` requests, when the event
+    loop lags more than `max_lag_ms` (CPU-bound: every extra request only adds latency),
+    or when a dependency queue is over `max_queue_ratio` of its max_waiting (it would
+    end as a 503 half-way through, after paying for embed + ANN). Rejections are cheap
+    429s with Retry-After, so clients / the load balancer back off or go elsewhere.
+    """
+
+    def __init__(self, max_in_flight: int, max_lag_ms: float, max_queue_ratio: float, retry_after_s: int = 1):
+        self.max_in_flight = max_in_flight
+        self.max_lag_ms = max_lag_ms
+        self.max_queue_ratio = max_queue_ratio
+        self.retry_after_s = retry_after_s
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected: dict = {"in_flight": 0, "loop_lag": 0, "queue": 0}
+        self.lag_ms = 0.0  # EWMA of event-loop lag, sampled by monitor()
+
+    def _queue_ratio(self) -> float:
+        return max((l.waiting / l.max_waiting for l in ALL if l.max_waiting), default=0.0)
+
+    def try_enter(self) -> bool:
+        reason = None
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            reason = "in_flight"
+        elif self.max_lag_ms and self.lag_ms > self.max_lag_ms:
+            reason = "loop_lag"
+        elif self.max_queue_ratio and self._queue_ratio() > self.max_queue_ratio:
+            reason = "queue"
+        if reason is not None:
+            self.rejected[reason] += 1
+            return False
+        self.in_flight += 1
+        self.admitted += 1
+        return True
+
+    def exit(self):
+        self.in_flight -= 1
+
+    async def monitor(self, interval_s: float = 0.05, alpha: float = 0.3):
+        """Run as a task: how late does a sleep(interval) wake up? That's the loop's queueing delay."""
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(interval_s)
+            lag = max(0.0, (time.perf_counter() - t0 - interval_s) * 1000)
+            self.lag_ms = (1 - alpha) * self.lag_ms + alpha * lag
+
+    def stats(self):
+        return {"in_flight": self.in_flight, "max_in_flight": self.max_in_flight,
+                "utilization": round(self.in_flight / self.max_in_flight, 3) if self.max_in_flight else 0.0,
+                "loop_lag_ms": round(self.lag_ms, 2), "queue_ratio": round(self._queue_ratio(), 3),
+                "admitted": self.admitted, "rejected": dict(self.rejected)}
+
+
+# Per worker; ADMIT_MAX_INFLIGHT=0 / ADMIT_MAX_LAG_MS=0 / ADMIT_MAX_QUEUE=0 turn a check off
+ADMISSION = AdmissionController(
+    max_in_flight=int(os.getenv("ADMIT_MAX_INFLIGHT", "256")),
+    max_lag_ms=float(os.getenv("ADMIT_MAX_LAG_MS", "100")),
+    max_queue_ratio=float(os.getenv("ADMIT_MAX_QUEUE", "0.5")),
+)
@@ -0,0 +1,253 @@
+# api/server/local_index.py
+# In-process vector index: exact NumPy search for small corpora, IVF for large ones.
+#
+# On disk (LOCAL_INDEX_DIR):
+#   ids.json        datapoint ids, row-aligned with vectors.npy
+#   vectors.npy     float32 (or float16, LOCAL_INDEX_DTYPE) [N, D], L2-normalized (memory-mapped on load)
+#   meta.json       {datapoint_id: {doc_id, section, chunk, domain, clearance_min}}
+#   centroids.npy   IVF only: float32 [nlist, D]
+#   offsets.npy     IVF only: int64 [nlist + 1]; list l owns rows offsets[l]:offsets[l+1]
+#   codes.npy       int8 only: int8 [N, D] quantized rows, scales.npy float32 [N]
+#   info.json       {"embedder": model id}: the vector space; backends.py refuses a mismatch
+#
+# With LOCAL_INDEX_QUANT=int8 the scan runs over the int8 codes (1/4 of float32 RAM) and
+# only the best n x LOCAL_INDEX_RESCORE rows are re-scored from the memory-mapped vectors.
+#
+# Build from the current seed metadata (embeds with text-embedding-004):
+#   python local_index.py build --meta seed_meta.json --out local_index
+import os
+import json
+import argparse
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import vectors as vec_codec
+
+IVF_MIN_ROWS = int(os.getenv("LOCAL_INDEX_IVF_MIN_ROWS", "20000"))
+LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", vec_codec.VECTOR_DTYPE)  # float32 | float16 on disk
+LOCAL_INDEX_QUANT = os.getenv("LOCAL_INDEX_QUANT", "none")                  # none | int8
+RESCORE_OVERSAMPLE = int(os.getenv("LOCAL_INDEX_RESCORE", "4"))
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    m = np.asarray(m, dtype=np.float32)
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+def _kmeans(x: np.ndarray, k: int, iters: int = 10, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Spherical k-means (dot-product assignment). Returns (centroids, assignment)."""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    assign = np.zeros(len(x), dtype=np.int64)
+    for _ in range(iters):
+        assign = np.argmax(x @ centroids.T, axis=1)
+        for c in range(k):
+            members = x[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                centroids[c] = x[rng.integers(len(x))]
+        centroids = _normalize(centroids)
+    return centroids, assign
+
+
+class LocalIndex:
+    """
+    Scores are dot products of normalized vectors (same as a Vertex index built with
+    DOT_PRODUCT_DISTANCE): higher is closer.
+    """
+
+    def __init__(self, ids: List[str], vectors: np.ndarray, metas: Dict[str, Dict[str, Any]],
+                 centroids: Optional[np.ndarray] = None, offsets: Optional[np.ndarray] = None,
+                 codes: Optional[np.ndarray] = None, scales: Optional[np.ndarray] = None,
+                 quant: str = LOCAL_INDEX_QUANT, embedder: Optional[str] = None):
+        self.ids = ids
+        self.embedder = embedder  # model that produced the vectors (None: built before it was recorded)
+        self.vectors = vectors
+        self.metas = metas
+        self.centroids = centroids
+        self.offsets = offsets
+        if quant == "int8" and codes is None and len(ids):
+            codes, scales = vec_codec.quantize_int8(vectors)
+        self.codes = codes
+        self.scales = scales
+        # Lists probed per IVF query; default scans ~1/8 of the lists
+        nlist = len(centroids) if centroids is not None else 0
+        self.nprobe = int(os.getenv("LOCAL_INDEX_NPROBE", "0")) or max(8, nlist // 8)
+        self._rows = {dp_id: n for n, dp_id in enumerate(ids)}
+        self._index_filters()
+
+    def _index_filters(self):
+        # Per-row filter columns so domain/clearance restricts are a vectorized mask
+        domains = [str(self.metas.get(i, {}).get("domain") or "") for i in self.ids]
+        self._domain_names = sorted(set(domains))
+        code = {d: c for c, d in enumerate(self._domain_names)}
+        self._domain = np.fromiter((code[d] for d in domains), dtype=np.int32, count=len(domains))
+        clearance = []
+        for i in self.ids:
+            try:
+                clearance.append(int(self.metas.get(i, {}).get("clearance_min") or 0))
+            except (TypeError, ValueError):
+                clearance.append(0)
+        self._clearance = np.asarray(clearance, dtype=np.int32)
+
+    @property
+    def kind(self) -> str:
+        return "ivf" if self.centroids is not None else "exact"
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ---- build / persist ----
+    @classmethod
+    def build(cls, ids: List[str], vectors, metas: Dict[str, Dict[str, Any]],
+              kind: str = "auto", nlist: Optional[int] = None, quant: str = LOCAL_INDEX_QUANT,
+              embedder: Optional[str] = None) -> "LocalIndex":
+        x = _normalize(vectors)
+        if kind == "auto":
+            kind = "ivf" if len(ids) >= IVF_MIN_ROWS else "exact"
+        if kind == "exact":
+            return cls(list(ids), x, metas, quant=quant, embedder=embedder)
+
+        nlist = nlist or max(1, int(np.sqrt(len(ids))))
+        centroids, assign = _kmeans(x, nlist)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls([ids[i] for i in order], x[order], metas, centroids, offsets, quant=quant, embedder=embedder)
+
+    def save(self, path: str, dtype: str = LOCAL_INDEX_DTYPE):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), np.ascontiguousarray(self.vectors, dtype=np.dtype(dtype)))
+        with open(os.path.join(path, "ids.json"), "w") as f:
+            json.dump(self.ids, f)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(self.metas, f)
+        with open(os.path.join(path, "info.json"), "w") as f:
+            json.dump({"embedder": self.embedder}, f)
+        for name in ("centroids", "offsets", "codes", "scales"):
+            p = os.path.join(path, f"{name}.npy")
+            arr = getattr(self, name)
+            if arr is not None:
+                np.save(p, arr)
+            elif os.path.exists(p):
+                os.remove(p)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "LocalIndex":
+        mode = "r" if mmap else None
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mode)
+        with open(os.path.join(path, "ids.json")) as f:
+            ids = json.load(f)
+        with open(os.path.join(path, "meta.json")) as f:
+            metas = json.load(f)
+        info = {}
+        if os.path.exists(os.path.join(path, "info.json")):
+            with open(os.path.join(path, "info.json")) as f:
+                info = json.load(f)
+        centroids = offsets = codes = scales = None
+        if os.path.exists(os.path.join(path, "centroids.npy")):
+            centroids = np.load(os.path.join(path, "centroids.npy"))
+            offsets = np.load(os.path.join(path, "offsets.npy"))
+        if LOCAL_INDEX_QUANT == "int8" and os.path.exists(os.path.join(path, "codes.npy")):
+            codes = np.load(os.path.join(path, "codes.npy"), mmap_mode=mode)  # page cache shared by workers
+            scales = np.load(os.path.join(path, "scales.npy"))
+        return cls(ids, vectors, metas, centroids, offsets, codes, scales, embedder=info.get("embedder"))
+
+    # ---- query ----
+    def _mask(self, domain: Optional[str], max_clearance: Optional[int]) -> Optional[np.ndarray]:
+        if domain is None and max_clearance is None:
+            return None
+        mask = np.ones(len(self.ids), dtype=bool)
+        if domain is not None:
+            if domain not in self._domain_names:
+                return np.zeros(len(self.ids), dtype=bool)
+            mask &= self._domain == self._domain_names.index(domain)
+        if max_clearance is not None:
+            mask &= self._clearance <= int(max_clearance)
+        return mask
+
+    def _candidates(self, q: np.ndarray, n: int, mask: Optional[np.ndarray]) -> np.ndarray:
+        if self.centroids is None:
+            rows = np.arange(len(self.ids))
+            return rows if mask is None else rows[mask]
+        # IVF: probe the closest lists; when the filter is selective keep widening the probe
+        # until n authorized rows are in hand (or every list has been visited)
+        order = np.argsort(-(self.centroids @ q))
+        nprobe = self.nprobe
+        while True:
+            rows = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in order[:nprobe]])
+            if mask is not None:
+                rows = rows[mask[rows]]
+            if len(rows) >= n or nprobe >= len(order):
+                return rows
+            nprobe *= 2
+
+    def search(self, vec, n: int, domain: Optional[str] = None,
+               max_clearance: Optional[int] = None) -> List[Tuple[str, float, Dict[str, Any]]]:
+        q = _normalize(vec)
+        mask = self._mask(domain, max_clearance)
+        rows = self._candidates(q, n, mask)
+        if len(rows) == 0:
+            return []
+        full = self.centroids is None and mask is None
+        if self.codes is None:
+            scores = (self.vectors if full else self.vectors[rows]) @ q
+        else:
+            # int8 pass over every candidate, exact re-scoring of a short list
+            coarse = vec_codec.int8_scores(q, self.codes, self.scales, None if full else rows)
+            m = min(len(coarse), n * RESCORE_OVERSAMPLE)
+            rows = rows[np.argpartition(-coarse, m - 1)[:m]]
+            scores = np.asarray(self.vectors[rows], dtype=np.float32) @ q
+        n = min(n, len(scores))
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+        out = []
+        for i in top:
+            dp_id = self.ids[int(rows[i])]
+            out.append((dp_id, float(scores[i]), self.metas.get(dp_id, {})))
+        return out
+
+
+    def vectors_for(self, ids: List[str]) -> Tuple[List[str], np.ndarray]:
+        """Stored vectors for the ids that are in the index: (found ids, float32 [len(found), D])."""
+        found = [i for i in ids if i in self._rows]
+        return found, np.asarray(self.vectors[[self._rows[i] for i in found]], dtype=np.float32)
+
+
+def _embed_documents(model_id: str, texts: List[str], batch: int = 100) -> np.ndarray:
+    import clients
+    from vertexai.language_models import TextEmbeddingInput
+
+    model = clients.embedding_model(model_id)
+    out = []
+    for i in range(0, len(texts), batch):
+        res = model.get_embeddings([TextEmbeddingInput(t, "RETRIEVAL_DOCUMENT") for t in texts[i:i + batch]])
+        out.extend(r.values for r in res)
+    return np.asarray(out, dtype=np.float32)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build the local vector index")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--meta", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "seed_meta.json"))
+    b.add_argument("--out", default=os.getenv("LOCAL_INDEX_DIR", "local_index"))
+    b.add_argument("--kind", choices=("auto", "exact", "ivf"), default="auto")
+    args = ap.parse_args()
+
+    with open(args.meta) as f:
+        metas = json.load(f)
+    ids = list(metas)
+    model_id = os.getenv("EMBED_MODEL", "text-embedding-004")
+    vectors = _embed_documents(model_id, [metas[i].get("chunk", "") for i in ids])
+    index = LocalIndex.build(ids, vectors, metas, kind=args.kind, embedder=model_id)
+    index.save(args.out)
+    print(f"Wrote {index.kind} index with {len(index)} vectors to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
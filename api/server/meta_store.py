@@ -0,0 +1,137 @@
+# api/server/meta_store.py
+# datapoint_id -> chunk metadata, served from SQLite instead of parsed out of every neighbor.
+#
+# seed_meta.json (written by seed_vectors.py) stays the source of truth. It is compiled once
+# into a SQLite file; when the JSON changes (re-seed) the file is rebuilt and swapped in
+# atomically, so several workers can share one db.
+import os
+import json
+import time
+import sqlite3
+import weakref
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+_COLS = ("doc_id", "section", "chunk", "domain", "clearance_min")
+
+
+# Open stores, so a forked worker can re-open its own connection (see _after_fork)
+_stores: "weakref.WeakSet[MetaStore]" = weakref.WeakSet()
+
+
+class MetaStore:
+    def __init__(self, json_path: str, db_path: str, reload_every_s: float = 5.0):
+        self.json_path = json_path
+        self.db_path = db_path
+        self.reload_every_s = reload_every_s
+        self.version: Optional[float] = None
+        self.reloads = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self.maybe_reload(force=True)
+        _stores.add(self)
+
+    def _reopen(self):
+        # SQLite connections must not be used across fork(); the file itself is shared
+        self._lock = threading.Lock()
+        if self._db is not None:
+            self._db = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+
+    # ---- build / reload ----
+    def _source_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.json_path)
+        except OSError:
+            return None
+
+    @staticmethod
+    def _db_version(path: str) -> Optional[float]:
+        if not os.path.exists(path):
+            return None
+        try:
+            with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as db:
+                row = db.execute("SELECT value FROM info WHERE key = 'source_mtime'").fetchone()
+            return float(row[0]) if row else None
+        except sqlite3.Error:
+            return None
+
+    def _build(self, mtime: float):
+        with open(self.json_path) as f:
+            raw = json.load(f)
+        tmp = f"{self.db_path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        db = sqlite3.connect(tmp)
+        db.execute("CREATE TABLE meta (id TEXT PRIMARY KEY, doc_id TEXT, section TEXT, chunk TEXT, "
+                   "domain TEXT, clearance_min INTEGER)")
+        db.execute("CREATE INDEX meta_scope ON meta (domain, clearance_min)")
+        db.execute("CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT)")
+        db.executemany(
+            "INSERT INTO meta VALUES (?, ?, ?, ?, ?, ?)",
+            ((dp_id, m.get("doc_id"), m.get("section"), m.get("chunk"), m.get("domain"),
+              int(m.get("clearance_min") or 0)) for dp_id, m in raw.items()),
+        )
+        db.execute("INSERT INTO info VALUES ('source_mtime', ?)", (repr(mtime),))
+        db.commit()
+        db.close()
+        os.replace(tmp, self.db_path)
+
+    def maybe_reload(self, force: bool = False) -> bool:
+        """Re-open (rebuilding if needed) when seed_meta.json changed. Cheap: stat at most every few seconds."""
+        now = time.monotonic()
+        if not force and now - self._checked < self.reload_every_s:
+            return False
+        self._checked = now
+        mtime = self._source_mtime()
+        if mtime is None or (mtime == self.version and not force):
+            return False
+        with self._lock:
+            if self._db_version(self.db_path) != mtime:
+                self._build(mtime)
+            old, self._db = self._db, sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True,
+                                                       check_same_thread=False)
+            self.version = mtime
+            self.reloads += 1
+        if old is not None:
+            old.close()
+        return True
+
+    # ---- lookups ----
+    @staticmethod
+    def _row_to_meta(row) -> Dict[str, Any]:
+        return dict(zip(_COLS, row))
+
+    def get_many(self, ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        ids = [i for i in ids if i]
+        if not ids or self._db is None:
+            return {}
+        self.maybe_reload()
+        marks = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._db.execute(f"SELECT id, {', '.join(_COLS)} FROM meta WHERE id IN ({marks})", ids).fetchall()
+        return {r[0]: self._row_to_meta(r[1:]) for r in rows}
+
+    def get(self, dp_id: str) -> Optional[Dict[str, Any]]:
+        return self.get_many([dp_id]).get(dp_id)
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        if self._db is None:
+            return iter(())
+        with self._lock:
+            rows: List[tuple] = self._db.execute(f"SELECT id, {', '.join(_COLS)} FROM meta").fetchall()
+        return ((r[0], self._row_to_meta(r[1:])) for r in rows)
+
+    def __len__(self):
+        if self._db is None:
+            return 0
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM meta").fetchone()[0]
+
+
+def _after_fork():
+    for store in list(_stores):
+        store._reopen()
+
+
+os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,121 @@
+# api/server/metrics.py
+# Minimal in-process metrics, rendered in the Prometheus text format on GET /metrics.
+#
+# No client library: a handful of counters/histograms updated on the hot path (a dict
+# lookup + bisect per observation) and callback gauges that read the existing cache /
+# limiter / batcher stats at scrape time.
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Seconds; covers a cache hit (~0.1 ms) up to a long pro generation
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+_REGISTRY: List = []
+_lock = threading.Lock()
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        _REGISTRY.append(self)
+
+    def inc(self, *labelvalues, amount: float = 1.0):
+        with _lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for lv, v in sorted(self._values.items()):
+            out.append(f"{self.name}{_fmt_labels(self.labelnames, lv)} {v:g}")
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labelvalues -> [per-bucket counts..., +Inf count], sum
+        self._counts: Dict[Tuple, List[int]] = {}
+        self._sums: Dict[Tuple, float] = {}
+        _REGISTRY.append(self)
+
+    def observe(self, value: float, *labelvalues):
+        i = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            counts = self._counts.get(labelvalues)
+            if counts is None:
+                counts = self._counts[labelvalues] = [0] * (len(self.buckets) + 1)
+                self._sums[labelvalues] = 0.0
+            counts[i] += 1
+            self._sums[labelvalues] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        # Only completed calls are observed; errors and cancellations would skew the stage
+        t0 = time.perf_counter()
+        yield
+        self.observe(time.perf_counter() - t0, *labelvalues)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for lv, counts in sorted(self._counts.items()):
+            cum = 0
+            for edge, c in zip(self.buckets + (float("inf"),), counts):
+                cum += c
+                le = 'le="+Inf"' if edge == float("inf") else f'le="{edge:g}"'
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, lv, le)} {cum}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labelnames, lv)} {self._sums[lv]:.6f}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labelnames, lv)} {cum}")
+        return out
+
+
+class CallbackGauge:
+    """Values read at scrape time: fn() -> iterable of (labelvalues tuple, value)."""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str], fn: Callable[[], Iterable[Tuple[Tuple, float]]]):
+        self.name, self.help, self.labelnames, self.fn = name, help, tuple(labelnames), fn
+        _REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            for lv, v in self.fn():
+                out.append(f"{self.name}{_fmt_labels(self.labelnames, lv)} {float(v):g}")
+        except Exception as e:  # a broken collector must not take /metrics down
+            out.append(f"# collector error: {type(e).__name__}")
+        return out
+
+
+def render() -> str:
+    return "\n".join(line for m in _REGISTRY for line in m.render()) + "\n"
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """{"retrieve_ms": 12.3, ...} -> 'retrieve;dur=12.3, ...' for the Server-Timing header."""
+    return ", ".join(f"{k[:-3] if k.endswith('_ms') else k};dur={v}" for k, v in timings.items())
+
+
+# ---- Hot-path instruments (shared by app, retriever, backends, planner) ----
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Latency of one pipeline stage", ["stage"])
+REQUEST_SECONDS = Histogram("rag_request_seconds", "End-to-end request latency", ["endpoint", "cached"])
+TOKENS = Counter("rag_tokens_total", "Tokens sent to / received from the generator", ["model", "kind"])
+PROMPT_TOKENS = Histogram("rag_prompt_tokens", "Prompt size per generate call", ["model"], buckets=TOKEN_BUCKETS)
+ROUTES = Counter("rag_route_total", "Generation requests per chosen model", ["model", "domain"])
+RESILIENCE = Counter("rag_resilience_events_total", "Timeouts, errors, hedges and short circuits per dependency",
+                     ["dependency", "event"])
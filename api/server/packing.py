@@ -0,0 +1,114 @@
+# api/server/packing.py
+# Token-budgeted context packing for the generation prompt.
+import os
+import re
+from typing import Any, Dict, List, NamedTuple
+
+from chunker import count_tokens, truncate_tokens
+
+# Input context windows (tokens); unknown models get a conservative default
+MODEL_CONTEXT_WINDOW = {
+    "gemini-2.5-pro": 1_048_576,
+    "gemini-2.5-flash": 1_048_576,
+    "gemini-2.5-flash-lite": 1_048_576,
+    "gemma-2-2b-it": 8_192,
+}
+DEFAULT_CONTEXT_WINDOW = 32_768
+
+# Context gets at most CONTEXT_RATIO x the route's max_output_tokens, and never more than CONTEXT_MAX_TOKENS
+CONTEXT_RATIO = float(os.getenv("CONTEXT_RATIO", "2.0"))
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "4096"))
+CONTEXT_MAX_CHUNKS = int(os.getenv("CONTEXT_MAX_CHUNKS", "6"))
+DEDUPE_JACCARD = float(os.getenv("CONTEXT_DEDUPE_JACCARD", "0.85"))
+
+
+class Packed(NamedTuple):
+    chunks: List[Dict[str, Any]]  # what goes into the prompt, in citation order ([1], [2], ...)
+    tokens: int
+    dropped: int  # retrieved chunks left out (duplicates, over budget or past the cap)
+
+
+def context_budget(model_id: str, max_output_tokens: int, fixed_tokens: int) -> int:
+    window = MODEL_CONTEXT_WINDOW.get(model_id, DEFAULT_CONTEXT_WINDOW)
+    room = window - max_output_tokens - fixed_tokens
+    return max(0, min(room, int(CONTEXT_RATIO * max_output_tokens), CONTEXT_MAX_TOKENS))
+
+
+def _shingles(text: str) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < 3:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def dedupe(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop near-identical chunks (overlapping windows, re-seeded copies); the better-ranked one wins."""
+    kept, kept_sh = [], []
+    for c in chunks:
+        sh = _shingles(c.get("text") or "")
+        if any(len(sh & k) / (len(sh | k) or 1) >= DEDUPE_JACCARD for k in kept_sh):
+            continue
+        kept.append(c)
+        kept_sh.append(sh)
+    return kept
+
+
+# Relevance fields in order of preference: rerank score, fused RRF score, ANN similarity
+SCORE_FIELDS = ("rerank", "rrf", "distance")
+
+
+def relevance(chunks: List[Dict[str, Any]]) -> List[float]:
+    """
+    Per-chunk value in (0, 1]: the most refined score every chunk carries, min-max scaled
+    over the list (higher is better), else 1 / (rank + 1) when some chunk has no score
+    (e.g. lexical-only hits without an ANN distance).
+    """
+    for field in SCORE_FIELDS:
+        scores = [c.get(field) for c in chunks]
+        if scores and all(isinstance(x, (int, float)) for x in scores):
+            lo, hi = min(scores), max(scores)
+            if hi == lo:
+                return [1.0] * len(chunks)
+            return [0.1 + 0.9 * (x - lo) / (hi - lo) for x in scores]
+    return [1.0 / (rank + 1) for rank in range(len(chunks))]
+
+
+def _fill(order: List[int], tokens: List[int], budget: int, slots: int) -> List[int]:
+    picked, used = [], 0
+    for i in order:
+        if len(picked) >= slots:
+            break
+        if used + tokens[i] <= budget:
+            picked.append(i)
+            used += tokens[i]
+    return picked
+
+
+def pack(chunks: List[Dict[str, Any]], budget_tokens: int, max_chunks: int = CONTEXT_MAX_CHUNKS) -> Packed:
+    """
+    Greedy knapsack over relevance() and token cost. The top-ranked chunk is always in,
+    trimmed to fit if needed. The rest of the budget goes to the better (by total
+    relevance) of two greedy fills: by relevance, and by relevance per token. The first
+    wins when the chunk cap binds, the second when the token budget does. Packed chunks
+    keep retrieval order, so [1] is still the best neighbor.
+    """
+    unique = dedupe(chunks)
+    if not unique or budget_tokens <= 0 or max_chunks <= 0:
+        return Packed([], 0, len(chunks))
+    texts = [(c.get("text") or "").strip() for c in unique]
+    tokens = [count_tokens(t) for t in texts]
+    value = relevance(unique)
+
+    # The best neighbor is never traded for shorter ones
+    if tokens[0] > budget_tokens:
+        texts[0] = (truncate_tokens(texts[0], budget_tokens - 1) + " …").strip()  # the mark costs a token
+        tokens[0] = count_tokens(texts[0])
+    room, slots = budget_tokens - tokens[0], max_chunks - 1
+    rest = range(1, len(unique))
+    by_value = _fill(sorted(rest, key=lambda i: -value[i]), tokens, room, slots)
+    by_density = _fill(sorted(rest, key=lambda i: -value[i] / max(1, tokens[i])), tokens, room, slots)
+    best = max(by_value, by_density, key=lambda picked: sum(value[i] for i in picked))
+
+    picked = [0] + sorted(best)
+    out = [{**unique[i], "text": texts[i]} for i in picked]
+    return Packed(out, sum(tokens[i] for i in picked), len(chunks) - len(out))
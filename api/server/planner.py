@@ -1,12 +1,17 @@
 # api/server/planner_slm.py
+import os
+import re
 import json
-from typing import Dict, Any
-import vertexai
-from vertexai.generative_models import GenerativeModel, GenerationConfig
+import math
+from typing import Dict, Any, Awaitable, Callable, Optional, Sequence, Tuple
 from pydantic import BaseModel, Field, ValidationError
 
-# Init Vertex (same project/region you use elsewhere)
-vertexai.init(project="teja-sunhack", location="us-central1")
+import limits
+import cache
+import clients
+import metrics
+import prompts
+import resilience
 
 # Use a small/cheap planner model
 #PLANNER_MODEL_ID = "gemini-2.5-flash"
@@ -29,73 +34,204 @@ class Route(BaseModel):
     max_output_tokens: int = 1024
     rationale: str = Field(..., description="1-2 sentence reason for this routing decision")
 
-_SYS = """You are a tiny routing planner.
-Decide which domain and target model should answer the user's question.
-
-Rules:
-- Output ONLY JSON (no prose).
-- If the domain_hint is present, prefer it unless the question clearly belongs elsewhere.
-- Map to these domains: finance, hr, legal, engineering, general.
-- Choose the least expensive model that can answer safely; escalate to 'gemini-2.5-pro' only for finance/legal/complex analytical queries.
-- Keep rationale short (<= 2 sentences).
-"""
-
 # In new Vertex SDKs you can force JSON by setting response_mime_type='application/json'
-def _llm_plan(query: str, domain_hint: str) -> Dict[str, Any]:
-    model = GenerativeModel(PLANNER_MODEL_ID)
-    plan_prompt = {
-        "query": query.strip(),
-        "domain_hint": (domain_hint or "").lower(),
-        "domains_available": list(DOMAIN_REGISTRY.keys()),
-        "registry_defaults": DOMAIN_REGISTRY,
-    }
-    cfg = GenerationConfig(temperature=0.1, max_output_tokens=256, response_mime_type="application/json")
-    resp = model.generate_content(
-        [{"role": "user", "parts": [{"text": _SYS}, {"text": json.dumps(plan_prompt)}]}],
-        generation_config=cfg,
-    )
+async def _llm_plan(query: str, domain_hint: str) -> Dict[str, Any]:
+    # Instructions + domain table are the template's static prefix (rendered once, sent as a
+    # system instruction where the model takes one); only the query and hint vary per call
+    bound = prompts.bind("planner", PLANNER_MODEL_ID, domains=", ".join(DOMAIN_REGISTRY),
+                         registry=prompts.registry_key(DOMAIN_REGISTRY))
+    contents = bound.contents(prompts.suffix("planner", request=prompts.request_json(
+        query=query.strip(), domain_hint=(domain_hint or "").lower())))
+    cfg = clients.generation_config(0.1, 256, response_mime_type="application/json")
+
+    async def _call():
+        async with limits.PLANNER:
+            return await bound.model.generate_content_async(contents, generation_config=cfg)
+    # PLANNER_TIMEOUT_MS bounds the wait; while its breaker is open this raises at once
+    # and pick_model answers from _fallback_route instead
+    with metrics.STAGE_SECONDS.time("planner_llm"):
+        resp = await resilience.PLANNER.call(_call)
     # Pull raw text (should be JSON)
     text = resp.candidates[0].content.parts[0].text if resp and resp.candidates else "{}"
     return json.loads(text)
 
+# Keyword cues per domain (also the deterministic fallback's heuristic)
+DOMAIN_KEYWORDS = {
+    "finance": ("invoice", "budget", "expense", "reimbursement", "p&l", "financial"),
+    "hr": ("benefits", "leave", "vacation", "hiring", "offer", "onboarding", "i-9"),
+    "legal": ("contract", "nda", "compliance", "policy exception", "regulation", "gdpr"),
+    "engineering": ("api", "deploy", "kubernetes", "service", "error", "stacktrace"),
+}
+
 def _fallback_route(domain_hint: str, query: str) -> Route:
     dh = (domain_hint or "general").lower()
     if dh not in DOMAIN_REGISTRY:
         # tiny heuristic if hint is missing/unknown
-        if any(k in query.lower() for k in ("invoice", "budget", "expense", "reimbursement", "p&l", "financial")):
-            dh = "finance"
-        elif any(k in query.lower() for k in ("benefits", "leave", "vacation", "hiring", "offer", "onboarding", "i-9")):
-            dh = "hr"
-        elif any(k in query.lower() for k in ("contract", "nda", "compliance", "policy exception", "regulation", "gdpr")):
-            dh = "legal"
-        elif any(k in query.lower() for k in ("api", "deploy", "kubernetes", "service", "error", "stacktrace")):
-            dh = "engineering"
-        else:
-            dh = "general"
+        ql = query.lower()
+        dh = next((d for d, kws in DOMAIN_KEYWORDS.items() if any(k in ql for k in kws)), "general")
     base = DOMAIN_REGISTRY[dh].copy()
     return Route(domain=dh, rationale="Fallback deterministic routing.", **base)
 
-def pick_model(domain_hint: str, query: str) -> Dict[str, Any]:
+# ---- Degraded generation: cheaper registry model while a model's breaker is open ----
+FALLBACK_MODEL_ID = os.getenv("FALLBACK_MODEL_ID", DOMAIN_REGISTRY["general"]["model_id"])
+
+def available_route(route: Dict[str, Any]) -> Dict[str, Any]:
+    """`route` as-is, or moved to FALLBACK_MODEL_ID (marked `fallback_from`) if its model is failing fast."""
+    model_id = route.get("model_id")
+    if (model_id == FALLBACK_MODEL_ID or resilience.generate(model_id).available()
+            or not resilience.generate(FALLBACK_MODEL_ID).available()):
+        return route
+    return {**route, "model_id": FALLBACK_MODEL_ID, "fallback_from": model_id,
+            "rationale": f"{route.get('rationale', '')} Degraded: {model_id} unavailable.".strip()}
+
+# ---- Fast path: local classifier, LLM planner only when it isn't sure ----
+PLANNER_CONFIDENCE = float(os.getenv("PLANNER_CONFIDENCE", "0.75"))
+PLANNER_CACHE_SIZE = int(os.getenv("PLANNER_CACHE_SIZE", "2048"))
+PLANNER_CACHE_TTL_S = float(os.getenv("PLANNER_CACHE_TTL_S", "3600"))
+PLANNER_CACHE_SHARED = os.getenv("PLANNER_CACHE_SHARED", "")  # sqlite path shared by workers / replicas
+
+# Extra cues on top of DOMAIN_KEYWORDS (matched as whole words, see _cue_pattern)
+_FAST_CUES = {
+    "finance": ("travel", "hotel", "airfare", "per-diem", "mileage", "receipt", "corporate card", "purchase order",
+                "procurement", "capex", "stipend", "vendor", "cost center", "quote", "spend"),
+    "hr": ("parental", "sick", "holiday", "performance review", "training", "harassment", "equity", "payroll",
+           "remote work", "exit interview", "accommodation", "new hire", "contractor"),
+    "legal": ("msa", "liability", "indemnif", "privacy", "terms", "litigation"),
+    "engineering": ("pull request", "incident", "sev-1", "slo", "schema", "migration", "secrets", "container",
+                    "feature flag", "openapi", "on-call", "rollback", "cve", "logging", "healthz", "backup"),
+}
+# Short domain descriptions; cosine to the query embedding breaks keyword ties
+_PROTOTYPES = {
+    "finance": "finance policy: expenses, travel reimbursement, hotels, airfare, corporate cards, purchase orders, procurement, budgets",
+    "hr": "human resources policy: benefits, vacation and leave, hiring, onboarding, payroll, performance reviews, training",
+    "legal": "legal policy: contracts, NDAs, compliance, regulation, GDPR, privacy, policy exceptions",
+    "engineering": "engineering standards: deploys, services, APIs, incidents, on-call, security, databases, infrastructure",
+    "general": "general company information and questions",
+}
+# The caller's own domain, per the planner rules. Kept under one keyword on purpose: a hint
+# with no cue behind it scores 1/(1 + 4e^-1.5) ~= 0.53 < PLANNER_CONFIDENCE, so it goes to
+# the embedding tie-break (and the LLM planner if still unsure) instead of routing on its own.
+# One cue in the hinted domain is enough (0.96); one cue elsewhere against the hint is not (0.73).
+HINT_PRIOR = 0.5
+EMBED_WEIGHT = 4.0      # cosine gaps are small, so scale them into keyword units
+SOFTMAX_TEMP = 3.0
+
+# Cues that also match longer words (indemnify / indemnification, deployment / deploying)
+_STEMS = {"indemnif", "deploy"}
+_STEM_TAIL, _PLURAL = r"\w*", r"(?:e?s)?"
+
+def _cue_pattern(k: str) -> "re.Pattern":
+    # Word boundaries on both ends, so "api" doesn't match "apiary" nor "offer" "offering";
+    # plurals still count
+    return re.compile(r"(?<!\w)" + re.escape(k) + (_STEM_TAIL if k in _STEMS else _PLURAL) + r"(?!\w)")
+
+# (domain, cue, pattern); the plain substring test in _keyword_scores skips most regex calls
+_CUES = [(d, k, _cue_pattern(k)) for d in DOMAIN_REGISTRY for k in DOMAIN_KEYWORDS.get(d, ()) + _FAST_CUES.get(d, ())]
+
+_plan_cache = cache.TTLCache("planner", maxsize=PLANNER_CACHE_SIZE, ttl_s=PLANNER_CACHE_TTL_S,
+                             shared=cache.shared_backend(PLANNER_CACHE_SHARED))
+_proto_vecs: Dict[str, Sequence[float]] = {}
+_proto_mat = None  # unit-length prototype embeddings as one float32 matrix, rows in _PROTOTYPES order
+planner_stats = {"fast": 0, "llm": 0, "llm_cached": 0, "fallback": 0}
+
+def _keyword_scores(query: str) -> Dict[str, float]:
+    # One point per distinct cue present
+    ql = " ".join(query.lower().split())
+    scores = {d: 0.0 for d in DOMAIN_REGISTRY}
+    for d, k, pattern in _CUES:
+        if k in ql and pattern.search(ql):
+            scores[d] += 1.0
+    return scores
+
+def _prototype_cosines(qvec: Sequence[float]) -> Dict[str, float]:
+    # Every domain in one matrix-vector product rather than a Python dot product per prototype
+    import numpy as np
+    global _proto_mat
+    if _proto_mat is None:
+        m = np.asarray([_proto_vecs[d] for d in _PROTOTYPES], dtype=np.float32)
+        _proto_mat = m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+    q = np.asarray(qvec, dtype=np.float32)
+    sims = _proto_mat @ q / (float(np.linalg.norm(q)) or 1.0)
+    return dict(zip(_PROTOTYPES, sims.tolist()))
+
+def _confidence(scores: Dict[str, float]) -> Tuple[str, float]:
+    top = max(scores, key=scores.get)
+    z = sum(math.exp(SOFTMAX_TEMP * (v - scores[top])) for v in scores.values())
+    return top, 1.0 / z
+
+async def fast_route(domain_hint: str, query: str,
+                     embed: Optional[Callable[[str], Awaitable[Sequence[float]]]] = None) -> Tuple[Route, float]:
+    """
+    Local routing in microseconds: keyword cues + a prior on the caller's domain, and,
+    only when those leave a tie, cosine to per-domain prototypes using the query embedding
+    (`embed` is retriever.embed_query, so this normally hits its cache / in-flight call).
+    Returns (route, confidence in [0, 1]).
+    """
+    hint = (domain_hint or "").lower()
+    scores = _keyword_scores(query)
+    if hint in scores:
+        scores[hint] += HINT_PRIOR
+    domain, conf = _confidence(scores)
+
+    if conf < PLANNER_CONFIDENCE and embed is not None:
+        try:
+            qvec = await embed(query)
+            for d, text in _PROTOTYPES.items():
+                if d not in _proto_vecs:
+                    _proto_vecs[d] = await embed(text)
+            cosines = _prototype_cosines(qvec)
+            for d in scores:
+                scores[d] += EMBED_WEIGHT * cosines.get(d, 0.0)
+            domain, conf = _confidence(scores)
+        except Exception:
+            pass  # keywords alone; low confidence escalates to the LLM planner
+
+    base = DOMAIN_REGISTRY[domain].copy()
+    return Route(domain=domain, rationale=f"Fast path (confidence {conf:.2f}).", **base), conf
+
+async def _llm_route(domain_hint: str, query: str) -> Dict[str, Any]:
+    key = f"{(domain_hint or '').lower()}|{cache.normalize_query(query)}"
+    cached = _plan_cache.get(key)
+    if cached is not None:
+        planner_stats["llm_cached"] += 1
+        return cached
+    raw = await _llm_plan(query, domain_hint)
+    # Normalize with registry defaults and validate
+    dh = (raw.get("domain") or domain_hint or "general").lower()
+    if dh not in DOMAIN_REGISTRY:
+        dh = "general"
+    base = DOMAIN_REGISTRY[dh].copy()
+    route = Route(
+        domain=dh,
+        model_id=raw.get("model_id", base["model_id"]),
+        temperature=float(raw.get("temperature", base["temperature"])),
+        max_output_tokens=int(raw.get("max_output_tokens", base["max_output_tokens"])),
+        rationale=raw.get("rationale", "Planner routed using query semantics."),
+    ).model_dump()
+    _plan_cache.set(key, route)
+    planner_stats["llm"] += 1
+    return route
+
+async def pick_model(domain_hint: str, query: str,
+                     embed: Optional[Callable[[str], Awaitable[Sequence[float]]]] = None) -> Dict[str, Any]:
     """
-    LLM-driven planner that returns a dict:
+    Planner that returns a dict:
       { model_id, temperature, max_output_tokens, domain, rationale }
+    Confident local routing answers directly; otherwise the LLM planner decides (results cached).
     Robust to planner failures (validates JSON, falls back deterministically).
     """
-    try:
-        raw = _llm_plan(query, domain_hint)
-        # Normalize with registry defaults and validate
-        dh = (raw.get("domain") or domain_hint or "general").lower()
-        if dh not in DOMAIN_REGISTRY:
-            dh = "general"
-        base = DOMAIN_REGISTRY[dh].copy()
-        route = Route(
-            domain=dh,
-            model_id=raw.get("model_id", base["model_id"]),
-            temperature=float(raw.get("temperature", base["temperature"])),
-            max_output_tokens=int(raw.get("max_output_tokens", base["max_output_tokens"])),
-            rationale=raw.get("rationale", "Planner routed using query semantics."),
-        )
+    with metrics.STAGE_SECONDS.time("pick_model"):
+        return await _pick_model(domain_hint, query, embed)
+
+async def _pick_model(domain_hint: str, query: str,
+                      embed: Optional[Callable[[str], Awaitable[Sequence[float]]]] = None) -> Dict[str, Any]:
+    route, conf = await fast_route(domain_hint, query, embed)
+    if conf >= PLANNER_CONFIDENCE:
+        planner_stats["fast"] += 1
         return route.model_dump()
+    try:
+        return await _llm_route(domain_hint, query)
     except (ValidationError, Exception):
         # Any parse or call error → deterministic fallback
+        planner_stats["fallback"] += 1
         return _fallback_route(domain_hint, query).model_dump()
@@ -0,0 +1,204 @@
+# api/server/prompts.py
+# Prompt templates, split into a static prefix and a dynamic suffix.
+#
+# The prefix is everything that only changes with the domain (instructions, citation rules,
+# the planner's domain table, optional per-domain guidelines). The suffix is the per-request
+# part (retrieved context, the question). Prefixes are rendered and token-counted once per
+# process, and sent out of band when the model allows it:
+#   cached_content      prefix >= CONTEXT_CACHE_MIN_TOKENS: a provider-side CachedContent,
+#                       created in the background on first use; its tokens aren't re-processed
+#   system_instruction  Gemini models: a handle per (model, prefix) from clients.py; a
+#                       stable leading block is also what provider-side implicit caching reuses
+#   inline              other models (e.g. the Gemma planner): the memoized prefix as the
+#                       first part of the request
+import os
+import json
+import time
+import asyncio
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import clients
+from chunker import count_tokens
+
+log = logging.getLogger("org-rag.prompts")
+
+# Optional <dir>/<domain>.md appended to that domain's answer prefix (style guides, glossaries)
+PROMPT_GUIDELINES_DIR = os.getenv("PROMPT_GUIDELINES_DIR", "")
+CONTEXT_CACHE = os.getenv("CONTEXT_CACHE", "1") == "1"
+# Providers refuse caches below a model-specific minimum; small prefixes use system_instruction
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "2048"))
+CONTEXT_CACHE_TTL_S = float(os.getenv("CONTEXT_CACHE_TTL_S", "3600"))
+
+
+class Template(NamedTuple):
+    name: str
+    prefix: str  # str.format fields: static (per domain / registry) only
+    suffix: str  # str.format fields: per request
+
+
+_TEMPLATES: Dict[str, Template] = {}
+
+
+def register(t: Template) -> Template:
+    _TEMPLATES[t.name] = t
+    _render_prefix.cache_clear()
+    return t
+
+
+def _guidelines(domain: str) -> str:
+    if not PROMPT_GUIDELINES_DIR:
+        return ""
+    path = os.path.join(PROMPT_GUIDELINES_DIR, f"{domain}.md")
+    try:
+        with open(path) as f:
+            text = f.read().strip()
+    except OSError:
+        return ""
+    return f"\n\n{domain.capitalize()} guidelines:\n{text}" if text else ""
+
+
+def _static_fields(name: str, key: Tuple) -> Dict[str, Any]:
+    fields = dict(key)
+    if name == "answer":
+        fields.setdefault("guidelines", _guidelines(fields["domain"]))
+    if name == "planner" and isinstance(fields.get("registry"), tuple):
+        # One line per domain instead of the registry's JSON (less than half the tokens)
+        fields["registry"] = "\n".join(f"- {d}: {m}, {t}, {n}" for d, m, t, n in fields["registry"])
+    return fields
+
+
+@lru_cache(maxsize=256)
+def _render_prefix(name: str, key: Tuple) -> Tuple[str, int]:
+    text = _TEMPLATES[name].prefix.format(**_static_fields(name, key))
+    return text, count_tokens(text)
+
+
+def prefix(name: str, **static) -> str:
+    """Rendered static prefix, memoized per template + static fields."""
+    return _render_prefix(name, tuple(sorted(static.items())))[0]
+
+
+def prefix_tokens(name: str, **static) -> int:
+    return _render_prefix(name, tuple(sorted(static.items())))[1]
+
+
+def suffix(name: str, **dynamic) -> str:
+    return _TEMPLATES[name].suffix.format(**dynamic)
+
+
+def registry_key(registry: Dict[str, Dict[str, Any]]) -> Tuple:
+    """DOMAIN_REGISTRY as a hashable static field for the planner prefix."""
+    return tuple((d, r["model_id"], r["temperature"], r["max_output_tokens"]) for d, r in registry.items())
+
+
+# ---- Templates ----
+ANSWER = register(Template(
+    "answer",
+    prefix="""You are the {domain} domain assistant for an internal org.
+Use ONLY the provided context when possible. If the answer isn't in the context, say you don't have that information.
+Cite sources as [#] where # is the chunk index.
+Answer with clear, concise steps and include citations.{guidelines}""",
+    suffix="""Context:
+{context}
+
+User question: {question}""",
+))
+
+PLANNER = register(Template(
+    "planner",
+    prefix="""You are a tiny routing planner.
+Decide which domain and target model should answer the user's question.
+
+Rules:
+- Output ONLY JSON (no prose): {{"domain", "model_id", "temperature", "max_output_tokens", "rationale"}}.
+- If the domain_hint is present, prefer it unless the question clearly belongs elsewhere.
+- Map to these domains: {domains}.
+- Choose the least expensive model that can answer safely; escalate to 'gemini-2.5-pro' only for finance/legal/complex analytical queries.
+- Keep rationale short (<= 2 sentences).
+
+Registry defaults (domain: model_id, temperature, max_output_tokens):
+{registry}""",
+    suffix="{request}",
+))
+
+
+# ---- Binding a prefix to a model ----
+class Bound(NamedTuple):
+    model: Any
+    source: str                   # cached_content | system_instruction | inline
+    inline: Optional[str] = None  # prefix still to be sent in the request
+
+    def contents(self, text: str) -> List[Dict[str, Any]]:
+        parts = ([{"text": self.inline}] if self.inline else []) + [{"text": text}]
+        return [{"role": "user", "parts": parts}]
+
+
+def supports_system_instruction(model_id: str) -> bool:
+    return model_id.startswith("gemini")
+
+
+_cached: Dict[Tuple[str, str], Tuple[Any, float]] = {}       # (model, prefix) -> (handle, refresh at)
+_cache_failed: Dict[Tuple[str, str], float] = {}             # retry creation after this time
+_cache_pending: Dict[Tuple[str, str], "asyncio.Future"] = {}
+prompt_stats = {"cached_content": 0, "system_instruction": 0, "inline": 0,
+                "caches_created": 0, "cache_errors": 0}
+
+
+async def _create_cache(key: Tuple[str, str]):
+    model_id, text = key
+    try:
+        handle = await asyncio.to_thread(clients.cached_content_model, model_id, text, CONTEXT_CACHE_TTL_S)
+        # Re-create a little before the provider expires it
+        _cached[key] = (handle, time.monotonic() + CONTEXT_CACHE_TTL_S * 0.9)
+        prompt_stats["caches_created"] += 1
+    except Exception as e:
+        log.warning("context cache for %s not created (%s); using system_instruction", model_id, e)
+        _cache_failed[key] = time.monotonic() + CONTEXT_CACHE_TTL_S
+        prompt_stats["cache_errors"] += 1
+    finally:
+        _cache_pending.pop(key, None)
+
+
+def _cached_model(model_id: str, text: str, tokens: int) -> Optional[Any]:
+    if not CONTEXT_CACHE or tokens < CONTEXT_CACHE_MIN_TOKENS:
+        return None
+    key = (model_id, text)
+    hit = _cached.get(key)
+    if hit is not None and hit[1] > time.monotonic():
+        return hit[0]
+    if key not in _cache_pending and _cache_failed.get(key, 0.0) <= time.monotonic():
+        # Never on the request path: this request (and any until it's ready) goes without
+        _cache_pending[key] = asyncio.ensure_future(_create_cache(key))
+    return hit[0] if hit is not None else None  # an expiring cache is still good until replaced
+
+
+def _after_fork():
+    # Handles own channels and pending tasks belong to the parent's loop. Each worker
+    # creates its own cache on first use (the master never serves, so it has none yet)
+    _cached.clear()
+    _cache_pending.clear()
+    _cache_failed.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def bind(name: str, model_id: str, **static) -> Bound:
+    """Model handle carrying `name`'s static prefix the cheapest way `model_id` allows."""
+    text, tokens = _render_prefix(name, tuple(sorted(static.items())))
+    if supports_system_instruction(model_id):
+        handle = _cached_model(model_id, text, tokens)
+        if handle is not None:
+            prompt_stats["cached_content"] += 1
+            return Bound(handle, "cached_content")
+        prompt_stats["system_instruction"] += 1
+        return Bound(clients.generative_model(model_id, system_instruction=text), "system_instruction")
+    prompt_stats["inline"] += 1
+    return Bound(clients.generative_model(model_id), "inline", inline=text)
+
+
+def request_json(**fields) -> str:
+    """Compact JSON for a dynamic suffix."""
+    return json.dumps(fields, separators=(",", ":"))
@@ -0,0 +1,140 @@
+# api/server/rerank.py
+# Optional second stage between retrieval and the prompt: exact cosine re-scoring of an
+# over-fetched candidate set against the stored full-precision chunk vectors, then a
+# maximal-marginal-relevance (MMR) pick of the few chunks that go to the generator.
+#
+# ANN distances are approximate and BM25-only candidates have none at all; one NumPy
+# matrix product over ~25 candidates puts them on a single exact scale, and MMR keeps
+# near-duplicates from using up the prompt. Everything runs under a hard time budget:
+# past it the candidates are served in retrieval order, as if reranking were off.
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set
+
+import metrics
+
+log = logging.getLogger("org-rag.rerank")
+
+RERANK = os.getenv("RERANK", "0") == "1"
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", "24"))      # candidates retrieved when reranking
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "4"))           # chunks kept for the prompt
+RERANK_MMR_LAMBDA = float(os.getenv("RERANK_MMR_LAMBDA", "0.7"))  # 1.0 = relevance only, lower = more diverse
+RERANK_MAX_GAP = float(os.getenv("RERANK_MAX_GAP", "0.25"))  # drop candidates this far (cosine) below the best
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "40"))
+
+rerank_stats = {"reranked": 0, "over_budget": 0, "no_vectors": 0, "errors": 0, "candidates": 0, "kept": 0}
+
+# Vector reads outliving their request's budget; held so they aren't garbage-collected mid-flight
+_fetches: Set[asyncio.Task] = set()
+
+
+def _background_fetch(fetch_vectors: Callable[[List[str]], Awaitable[Dict[str, Any]]], ids: List[str]) -> asyncio.Task:
+    task = asyncio.ensure_future(fetch_vectors(ids))
+    _fetches.add(task)
+    task.add_done_callback(_fetch_done)
+    return task
+
+
+def _fetch_done(task: asyncio.Task):
+    _fetches.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        log.debug("vector fetch failed: %s", task.exception())
+
+
+# NumPy is imported on first use, like the other heavy dependencies (see bench/importtime.py);
+# warmup() does it at startup so the first request's budget isn't spent on the import
+def warmup():
+    vecs = _unit([[1.0, 0.0], [0.0, 1.0]])
+    mmr(vecs[:, 0], vecs, 1)
+
+
+def _unit(m):
+    import numpy as np
+    m = np.asarray(m, dtype=np.float32)
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+def mmr(relevance, vecs, n: int, lam: float = RERANK_MMR_LAMBDA) -> List[int]:
+    """
+    Greedy MMR: each pick maximizes lam * relevance - (1 - lam) * (max cosine to the picks
+    so far). `vecs` must be unit rows. Returns row indices in pick order.
+    """
+    import numpy as np
+    n = min(n, len(relevance))
+    if n <= 0:
+        return []
+    sim = vecs @ vecs.T  # [N, N], tiny for a rerank-sized candidate set
+    redundancy = np.full(len(relevance), -np.inf, dtype=np.float32)
+    picked: List[int] = []
+    available = np.ones(len(relevance), dtype=bool)
+    for _ in range(n):
+        gain = lam * relevance - (1 - lam) * np.maximum(redundancy, 0.0)
+        gain[~available] = -np.inf
+        i = int(np.argmax(gain))
+        picked.append(i)
+        available[i] = False
+        redundancy = np.maximum(redundancy, sim[:, i])
+    return picked
+
+
+def _select(qvec: Sequence[float], items: List[Dict[str, Any]], vectors: Dict[str, Any],
+            top_n: int) -> Optional[List[Dict[str, Any]]]:
+    import numpy as np
+    scored = [it for it in items if it.get("datapoint_id") in vectors]
+    if not scored:
+        return None
+    mat = _unit([vectors[it["datapoint_id"]] for it in scored])
+    rel = mat @ _unit(qvec)
+    # Far below the best candidate is noise for the prompt, however diverse it is
+    keep = np.flatnonzero(rel >= rel.max() - RERANK_MAX_GAP)
+    picks = [int(keep[i]) for i in mmr(rel[keep], mat[keep], top_n)]
+    out = []
+    for i in picks:
+        it = scored[i]
+        it["rerank"] = round(float(rel[i]), 4)
+        out.append(it)
+    return out
+
+
+async def rerank(q: str, items: List[Dict[str, Any]],
+                 embed: Callable[[str], Awaitable[Sequence[float]]],
+                 fetch_vectors: Callable[[List[str]], Awaitable[Dict[str, Any]]],
+                 top_n: int = RERANK_TOP_N, fallback_k: int = 8,
+                 budget_ms: float = RERANK_BUDGET_MS) -> List[Dict[str, Any]]:
+    """
+    Up to `top_n` of `items`, re-scored (`rerank` = exact cosine) and diversified by MMR.
+    `embed` is the (cached) query embedding, `fetch_vectors` the backend's stored vectors.
+    Over budget, or on any error, returns `items[:fallback_k]` unchanged. The vector fetch
+    is not cancelled with the request: a late response still fills the backend's cache.
+    """
+    if len(items) <= 1:
+        return items[:top_n]
+    t0 = time.perf_counter()
+    deadline = budget_ms / 1000
+    try:
+        # Shielded like embed_query: on Vertex the read alone can take the whole budget,
+        # and cancelling it at the deadline would leave the vector cache cold forever
+        fetch = _background_fetch(fetch_vectors, [it["datapoint_id"] for it in items])
+        qvec, vectors = await asyncio.wait_for(asyncio.gather(embed(q), asyncio.shield(fetch)), deadline)
+        if time.perf_counter() - t0 > deadline:
+            raise asyncio.TimeoutError()
+        out = _select(qvec, items, vectors, top_n)
+        if out is None:
+            rerank_stats["no_vectors"] += 1
+            return items[:fallback_k]
+    except asyncio.TimeoutError:
+        rerank_stats["over_budget"] += 1
+        return items[:fallback_k]
+    except Exception:
+        rerank_stats["errors"] += 1
+        log.exception("rerank failed; keeping retrieval order")
+        return items[:fallback_k]
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, "rerank")
+    rerank_stats["reranked"] += 1
+    rerank_stats["candidates"] += len(items)
+    rerank_stats["kept"] += len(out)
+    return out
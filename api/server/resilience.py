@@ -0,0 +1,309 @@
+# api/server/resilience.py
+# Deadlines, hedged retries and circuit breakers for the remote (Vertex) dependencies.
+#
+# limits.py bounds how many calls may wait on a dependency; this bounds how long each
+# call may take. Every call gets a deadline (<NAME>_TIMEOUT_MS). Idempotent reads
+# (embeddings, ANN) send a backup copy when the first one is slower than the recent p95,
+# or failed fast, and take whichever answers first. Consecutive failures open a breaker,
+# so callers fail fast (and fall back) instead of paying the full deadline on every
+# request while a dependency is down.
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import limits
+import metrics
+
+log = logging.getLogger("org-rag.resilience")
+
+
+class CircuitOpen(Exception):
+    """Raised without calling the dependency while its breaker is open; the API maps it to 503."""
+
+    def __init__(self, name: str, retry_after_s: float):
+        super().__init__(f"{name} circuit is open")
+        self.name = name
+        self.retry_after_s = retry_after_s
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """A dependency call ran past its deadline; the API maps it to 504."""
+
+    def __init__(self, name: str, timeout_s: float):
+        super().__init__(f"{name} took longer than {timeout_s * 1000:.0f} ms")
+        self.name = name
+
+
+# Our own backpressure and breakers say nothing about the dependency's health
+_NOT_A_FAILURE = (limits.Overloaded, CircuitOpen)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive failed calls; while open, calls fail fast with
+    CircuitOpen. After `cooldown_s` a single probe is let through (half-open): success
+    closes the breaker, failure re-opens it for another cooldown.
+    """
+
+    def __init__(self, name: str, failures: int = 5, cooldown_s: float = 10.0):
+        self.name = name
+        self.failures = max(1, failures)
+        self.cooldown_s = cooldown_s
+        self.state = CLOSED
+        self.opened = 0  # times tripped
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def _retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.cooldown_s - time.monotonic())
+
+    def available(self) -> bool:
+        """Would a call be let through right now? (no side effects; for picking a fallback)"""
+        if self.state == CLOSED:
+            return True
+        return not self._probing and self._retry_after() == 0.0
+
+    def allow(self):
+        if self.state == CLOSED:
+            return
+        if self.state == OPEN:
+            if self._retry_after() > 0:
+                raise CircuitOpen(self.name, self._retry_after())
+            self.state = HALF_OPEN
+        if self._probing:  # one probe at a time while half-open
+            raise CircuitOpen(self.name, 1.0)
+        self._probing = True
+
+    def record(self, ok: Optional[bool]):
+        """ok=None: the call ended without a verdict (cancelled, shed by our own limiter)."""
+        self._probing = False
+        if ok is None:
+            return
+        if ok:
+            self._consecutive = 0
+            if self.state != CLOSED:
+                log.info("%s breaker closed", self.name)
+                self.state = CLOSED
+            return
+        self._consecutive += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self._consecutive >= self.failures):
+            if self.state == CLOSED:
+                self.opened += 1
+                log.warning("%s breaker opened after %d consecutive failures", self.name, self._consecutive)
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self._consecutive, "opened": self.opened,
+                "retry_after_s": round(self._retry_after(), 2) if self.state == OPEN else 0.0}
+
+
+class Dependency:
+    """
+    One remote dependency: deadline + breaker, and optional hedging.
+
+    With `hedge`, a second attempt goes out when the first hasn't answered after the
+    recent p95 latency (at least `hedge_after_ms`), or right away if the first failed
+    fast; whichever succeeds first wins and the other is cancelled. At most
+    `hedge_max_ratio` of calls send a backup, so a slow dependency isn't hit with double load.
+    """
+
+    def __init__(self, name: str, timeout_ms: float, hedge: bool = False, hedge_after_ms: float = 50.0,
+                 hedge_max_ratio: float = 0.1, failures: int = 5, cooldown_s: float = 10.0):
+        self.name = name
+        self.timeout_s = timeout_ms / 1000
+        self.hedge = hedge
+        self.hedge_after_s = hedge_after_ms / 1000
+        self.hedge_max_ratio = hedge_max_ratio
+        self.breaker = CircuitBreaker(name, failures, cooldown_s)
+        self._latencies: deque = deque(maxlen=256)
+        self._p95: Optional[float] = None
+        self._outcomes: deque = deque(maxlen=100)  # recent True/False verdicts, for error_rate()
+        # counters
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.short_circuits = 0
+        self.hedges = 0
+        self.backup_wins = 0
+
+    # ---- hedging ----
+    def _observe(self, seconds: float):
+        self._latencies.append(seconds)
+        if len(self._latencies) >= 20 and (self._p95 is None or len(self._latencies) % 16 == 0):
+            xs = sorted(self._latencies)
+            self._p95 = xs[int(0.95 * (len(xs) - 1))]
+
+    def _hedge_delay(self) -> Optional[float]:
+        if self.hedges >= self.hedge_max_ratio * max(self.calls, 10):
+            return None
+        if self._p95 is None:  # no history yet: only back up calls that are clearly stuck
+            return max(self.hedge_after_s, self.timeout_s / 4)
+        return min(max(self.hedge_after_s, self._p95), self.timeout_s / 2)
+
+    async def _attempt(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        t0 = time.perf_counter()
+        res = await fn()
+        self._observe(time.perf_counter() - t0)
+        return res
+
+    async def _attempts(self, fn: Callable[[], Awaitable[Any]], hedge: bool) -> Any:
+        first = asyncio.ensure_future(self._attempt(fn))
+        delay = self._hedge_delay() if hedge else None
+        if delay is None:
+            return await first
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done and (first.exception() is None or isinstance(first.exception(), _NOT_A_FAILURE)):
+                return first.result()
+            # Slow (hedge) or failed fast (retry): one more copy, first good answer wins
+            self.hedges += 1
+            metrics.RESILIENCE.inc(self.name, "retry" if done else "hedge")
+            tasks.add(asyncio.ensure_future(self._attempt(fn)))
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        if t is not first:
+                            self.backup_wins += 1
+                            metrics.RESILIENCE.inc(self.name, "backup_won")
+                        return t.result()
+                    error = t.exception()
+            raise error
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    # ---- calls ----
+    def _enter(self):
+        try:
+            self.breaker.allow()
+        except CircuitOpen:
+            self.short_circuits += 1
+            metrics.RESILIENCE.inc(self.name, "short_circuit")
+            raise
+        self.calls += 1
+
+    @contextmanager
+    def _outcome(self):
+        # Feeds the breaker; TimeoutError from the deadline becomes DeadlineExceeded
+        ok: Optional[bool] = None
+        try:
+            yield
+            ok = True
+        except asyncio.TimeoutError:
+            ok = False
+            self.timeouts += 1
+            metrics.RESILIENCE.inc(self.name, "timeout")
+            raise DeadlineExceeded(self.name, self.timeout_s) from None
+        except _NOT_A_FAILURE:
+            raise
+        except Exception:
+            ok = False
+            self.errors += 1
+            metrics.RESILIENCE.inc(self.name, "error")
+            raise
+        finally:
+            self.breaker.record(ok)
+            if ok is not None:
+                self._outcomes.append(ok)
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], hedge: Optional[bool] = None) -> Any:
+        """`await fn()` under this dependency's breaker and deadline (hedged if enabled)."""
+        self._enter()
+        with self._outcome():
+            return await asyncio.wait_for(self._attempts(fn, self.hedge if hedge is None else hedge),
+                                          self.timeout_s)
+
+    async def stream(self, open_fn: Callable[[], Awaitable[Any]]) -> AsyncIterator[Any]:
+        """call() for streaming responses: the one deadline covers opening the stream and every chunk."""
+        self._enter()
+        t0 = time.monotonic()
+        deadline = t0 + self.timeout_s
+        with self._outcome():
+            parts = (await asyncio.wait_for(open_fn(), self.timeout_s)).__aiter__()
+            while True:
+                try:
+                    part = await asyncio.wait_for(parts.__anext__(), max(0.0, deadline - time.monotonic()))
+                except StopAsyncIteration:
+                    break
+                yield part
+            self._observe(time.monotonic() - t0)
+
+    def available(self) -> bool:
+        return self.breaker.available()
+
+    def p95_ms(self) -> Optional[float]:
+        """Recent p95 of successful calls (None until there are 20 samples)."""
+        return self._p95 * 1000 if self._p95 is not None else None
+
+    def error_rate(self, min_calls: int = 10) -> float:
+        """Share of the last 100 calls that failed or timed out (0.0 until `min_calls` have finished)."""
+        if len(self._outcomes) < min_calls:
+            return 0.0
+        return 1.0 - sum(self._outcomes) / len(self._outcomes)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "timeout_ms": self.timeout_s * 1000,
+            "hedge": self.hedge,
+            "hedge_after_ms": round((self._hedge_delay() or 0.0) * 1000, 1) if self.hedge else None,
+            "p95_ms": round(self._p95 * 1000, 1) if self._p95 is not None else None,
+            "error_rate": round(self.error_rate(), 3),
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "short_circuits": self.short_circuits,
+            "hedges": self.hedges,
+            "backup_wins": self.backup_wins,
+            "breaker": self.breaker.stats(),
+        }
+
+
+def _from_env(name: str, timeout_ms: float, hedge: bool = False) -> Dependency:
+    key = name.upper()
+    return Dependency(
+        name,
+        timeout_ms=float(os.getenv(f"{key}_TIMEOUT_MS", timeout_ms)),
+        hedge=os.getenv(f"{key}_HEDGE", "1" if hedge else "0") == "1",
+        hedge_after_ms=float(os.getenv(f"{key}_HEDGE_AFTER_MS", "50")),
+        hedge_max_ratio=float(os.getenv("HEDGE_MAX_RATIO", "0.1")),
+        failures=int(os.getenv("BREAKER_FAILURES", "5")),
+        cooldown_s=float(os.getenv("BREAKER_COOLDOWN_S", "10")),
+    )
+
+
+# ---- One per remote dependency (env overridable, e.g. EMBED_TIMEOUT_MS=800, ANN_HEDGE=0) ----
+EMBED = _from_env("embed", 2000, hedge=True)
+# The in-process index has no network tail to hedge against
+ANN = _from_env("ann", 2000, hedge=os.getenv("RETRIEVER_BACKEND", "vertex").lower() == "vertex")
+PLANNER = _from_env("planner", 2000)
+
+# Generation gets a breaker per model, so a struggling pro endpoint can degrade to flash
+_generate: Dict[str, Dependency] = {}
+
+
+def generate(model_id: str) -> Dependency:
+    dep = _generate.get(model_id)
+    if dep is None:
+        # Not hedged: a duplicate generation doubles the bill
+        dep = _generate[model_id] = _from_env("generate", 30000)
+        dep.name = dep.breaker.name = f"generate:{model_id}"
+    return dep
+
+
+def all_dependencies() -> Dict[str, Dependency]:
+    return {d.name: d for d in (EMBED, ANN, PLANNER, *_generate.values())}
+
+
+def stats() -> Dict[str, Any]:
+    return {name: d.stats() for name, d in all_dependencies().items()}
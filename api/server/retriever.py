@@ -1,176 +1,376 @@
-# api/server/retriever.py  (cloud-only, no local JSON)
-import os, json
-from typing import Any, Dict, List, Optional
-
-from vertexai import init as vertex_init
-from vertexai.language_models import TextEmbeddingModel, TextEmbeddingInput
-from google.cloud import aiplatform_v1
-
-# --- Config (env overridable) ---
-PROJECT = os.getenv("GCP_PROJECT", "589329822647")
-LOCATION = os.getenv("GCP_LOCATION", "us-central1")
+# api/server/retriever.py  (embeddings + ANN via a pluggable backend, see backends.py; BM25 fusion in lexical.py)
+import os
+import math
+import asyncio
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import limits
+import cache
+import clients
+import backends
+import batcher
+import lexical
+import metrics
+import resilience
+import rerank
+import vectors
+from meta_store import MetaStore
+from vectors import Vector
+
+log = logging.getLogger("org-rag.retriever")
+
+# --- Config (env overridable; project/region live in clients.py) ---
 EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-004")
 
-API_ENDPOINT = os.getenv("ME_API_HOST", "257828499.us-central1-589329822647.vdb.vertexai.goog")
-INDEX_ENDPOINT = os.getenv("ME_INDEX_ENDPOINT", "projects/589329822647/locations/us-central1/indexEndpoints/1398598581740371968")
-DEPLOYED_ID   = os.getenv("ME_DEPLOYED_INDEX_ID", "sunhack_deploy_1759016114032")
-DEPLOYED_INDEX_ID = "sunhack_deploy_1759016114032"
-
-# --- Init once ---
-vertex_init(project=PROJECT, location=LOCATION)
-_embed_model = TextEmbeddingModel.from_pretrained(EMBED_MODEL)
-_client = aiplatform_v1.MatchServiceClient(client_options={"api_endpoint": API_ENDPOINT})
-
-def embed_query(text: str) -> List[float]:
+# Vector backend: RETRIEVER_BACKEND=vertex (Matching Engine, ME_* vars) or local (LOCAL_INDEX_DIR)
+ANN_MAX_NEIGHBORS = int(os.getenv("ANN_MAX_NEIGHBORS", "100"))
+
+# Query-embedding cache: LRU + TTL, optionally shared across replicas via EMBED_CACHE_SHARED (sqlite path)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+EMBED_CACHE_TTL_S = float(os.getenv("EMBED_CACHE_TTL_S", "3600"))
+EMBED_CACHE_SHARED = os.getenv("EMBED_CACHE_SHARED", "")
+
+# Max texts per get_embeddings call (text-embedding-004 accepts up to 250 inputs)
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "250"))
+
+# Hybrid retrieval: in-process BM25 next to the ANN query, fused by reciprocal rank.
+# If the vector side misses VECTOR_DEADLINE_MS (or fails), lexical hits are served alone.
+HYBRID = os.getenv("HYBRID", "1") == "1"
+RRF_K = int(os.getenv("RRF_K", "60"))
+VECTOR_DEADLINE_MS = float(os.getenv("VECTOR_DEADLINE_MS", "1500"))
+
+# Written by seed_vectors.py on every (re-)seed; compiled into a SQLite metadata store
+# (META_DB_PATH) that search() joins against, and its mtime doubles as the index version
+SEED_META_PATH = os.getenv("SEED_META_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "seed_meta.json"))
+META_DB_PATH = os.getenv("META_DB_PATH", os.path.join(tempfile.gettempdir(), "org-rag-meta.sqlite"))
+
+# --- Init once, on first use (keeps import cheap; the lifespan warmup usually gets here first) ---
+_meta_store: Optional[MetaStore] = None
+_backend: Optional[backends.Backend] = None
+_init_lock = threading.RLock()  # warmup builds these on a worker thread
+
+def get_meta_store() -> MetaStore:
+    global _meta_store
+    if _meta_store is None:
+        with _init_lock:
+            if _meta_store is None:
+                _meta_store = MetaStore(SEED_META_PATH, META_DB_PATH)
+    return _meta_store
+
+_lexical = lexical.LexicalIndex()
+_lexical_lock = threading.Lock()
+
+def get_lexical() -> lexical.LexicalIndex:
+    """BM25 index kept in step with the metadata store (only changed chunks are re-indexed)."""
+    store = get_meta_store()
+    store.maybe_reload()
+    if _lexical.version != store.version:
+        with _lexical_lock:
+            if _lexical.version != store.version:
+                _lexical.sync(store.items(), version=store.version)
+    return _lexical
+
+def get_backend() -> backends.Backend:
+    global _backend
+    if _backend is None:
+        with _init_lock:
+            if _backend is None:
+                _backend = backends.from_env(get_meta_store(), embed_model=EMBED_MODEL)
+    return _backend
+
+
+# Vectors are float32 array('f') (3 KB each instead of ~25 KB of boxed floats); the shared
+# tier stores them as tagged bytes (VECTOR_DTYPE=float16 halves that again)
+embed_cache = cache.TTLCache("embed", maxsize=EMBED_CACHE_SIZE, ttl_s=EMBED_CACHE_TTL_S,
+                             shared=cache.shared_backend(EMBED_CACHE_SHARED),
+                             dumps=vectors.to_bytes, loads=vectors.from_bytes)
+_embed_inflight: Dict[str, "asyncio.Future[Vector]"] = {}
+
+async def _embed_texts(texts: List[str]) -> List[Vector]:
     # Use RETRIEVAL_QUERY for queries (doc vectors used RETRIEVAL_DOCUMENT at upsert)
-    return _embed_model.get_embeddings([TextEmbeddingInput(text, "RETRIEVAL_QUERY")])[0].values
-
-def _neighbor_id(n) -> Optional[str]:
-    # Works across shapes
-    if getattr(n, "id", None): return n.id
-    if getattr(n, "entity_id", None): return n.entity_id
-    dp = getattr(n, "datapoint", None)
-    if dp:
-        if getattr(dp, "datapoint_id", None): return dp.datapoint_id
-        if getattr(dp, "entity_id", None):    return dp.entity_id
-    return None
-
-def _meta_from_neighbor(n):
-    import json
-    dp = getattr(n, "datapoint", None)
-    if not dp:
-        return {}
-
-    # ✅ Prefer restricts (robust)
-    # In python proto, it's 'allow_list' (snake_case)
-    for r in getattr(dp, "restricts", []) or []:
-        ns = getattr(r, "namespace", None)
-        allow = getattr(r, "allow_list", None)
-        if ns == "meta" and allow:
-            try:
-                first = allow[0]
-                if isinstance(first, bytes):
-                    first = first.decode("utf-8", errors="ignore")
-                if isinstance(first, str):
-                    return json.loads(first)
-            except Exception:
-                pass
-
-    # Fallback (often numeric in your env)
-    ct = getattr(dp, "crowding_tag", None)
-    ca = getattr(ct, "crowding_attribute", None) if ct else None
-    if isinstance(ca, str):
-        try:
-            return json.loads(ca)
-        except Exception:
-            pass
-
-    return {}
-
-
-
-# def _meta_from_neighbor(n):
-#     # Prefer restricts (robust across shapes)
-#     dp = getattr(n, "datapoint", None)
-#     if not dp:
-#         return {}
-#     # dp.restricts is a repeated field of IndexDatapoint.Restricts
-#     for r in getattr(dp, "restricts", []) or []:
-#         # Try common fields across proto shapes
-#         val = getattr(r, "value", None) or getattr(r, "string_value", None) or getattr(r, "stringValue", None)
-#         if isinstance(val, str) and r.namespace == "meta":
-#             try:
-#                 return json.loads(val)
-#             except Exception:
-#                 pass
-
-#     # Fallback: crowding_tag (often unreliable)
-#     ct = getattr(dp, "crowding_tag", None)
-#     ca = getattr(ct, "crowding_attribute", None) if ct else None
-#     if isinstance(ca, str):
-#         try:
-#             return json.loads(ca)
-#         except Exception:
-#             pass
-
-#     return {}
-
-
-
-def search(q: str, domain: str, clearance: int, k: int = 8) -> List[Dict[str, Any]]:
-    # 1) Embed
-    vec = embed_query(q)
-
-    # 2) Retrieve with full datapoints so we can parse metadata directly
-   
-
-
-    req = aiplatform_v1.FindNeighborsRequest(
-        index_endpoint=INDEX_ENDPOINT,
-        deployed_index_id=DEPLOYED_INDEX_ID,
-        queries=[aiplatform_v1.FindNeighborsRequest.Query(
-            datapoint=aiplatform_v1.IndexDatapoint(feature_vector=vec),
-            neighbor_count=10
-        )],
-        return_full_datapoint=True,   # <-- make sure this is True
-    )
-
-
+    from vertexai.language_models import TextEmbeddingInput
+    inputs = [TextEmbeddingInput(t, "RETRIEVAL_QUERY") for t in texts]
+
+    async def _call():
+        async with limits.EMBED:
+            return await clients.embedding_model(EMBED_MODEL).get_embeddings_async(inputs)
+    # Deadline + breaker, and a hedged second call when this one is slower than recent p95
+    with metrics.STAGE_SECONDS.time("embed"):
+        res = await resilience.EMBED.call(_call)
+    return [vectors.pack(r.values) for r in res]
+
+# Concurrent cache misses from separate requests share one get_embeddings call
+# (EMBED_MICROBATCH_WINDOW_MS / EMBED_MICROBATCH_MAX; window 0 = off)
+_embed_batcher = batcher.from_env("embed", _embed_texts, max_batch=32, window_ms=5.0)
+
+async def _embed_remote(key: str, text: str) -> Vector:
+    vec = await _embed_batcher.submit(text)
+    embed_cache.set(key, vec)
+    return vec
+
+async def _embed_remote_many(keys: List[str], texts: List[str]) -> Dict[str, Vector]:
+    out: Dict[str, Vector] = {}
+    for i in range(0, len(texts), EMBED_BATCH_MAX):
+        vecs = await _embed_texts(texts[i:i + EMBED_BATCH_MAX])
+        for key, vec in zip(keys[i:i + EMBED_BATCH_MAX], vecs):
+            out[key] = vec
+            embed_cache.set(key, vec)
+    return out
+
+async def embed_many(texts: List[str]) -> List[Vector]:
+    """embed_query for a list: cache hits and in-flight calls are reused, the rest go out in one request."""
+    keys = [f"{EMBED_MODEL}:{cache.normalize_query(t)}" for t in texts]
+    futs: Dict[str, "asyncio.Future[Vector]"] = {}
+    vecs: Dict[str, Vector] = {}
+    missing: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key in vecs or key in futs or key in missing:
+            continue
+        vec = embed_cache.get(key)
+        if vec is not None:
+            vecs[key] = vec
+        elif key in _embed_inflight:
+            futs[key] = _embed_inflight[key]
+        else:
+            missing[key] = text.strip()
+    if missing:
+        batch = asyncio.ensure_future(_embed_remote_many(list(missing), list(missing.values())))
+
+        async def _one(key: str) -> Vector:
+            return (await batch)[key]
+        # Registered as in-flight, so a concurrent embed_query for the same text joins this call
+        for key in missing:
+            fut = futs[key] = asyncio.ensure_future(_one(key))
+            _embed_inflight[key] = fut
+            fut.add_done_callback(lambda _f, key=key: _embed_inflight.pop(key, None))
+    if futs:
+        done = await asyncio.shield(asyncio.gather(*futs.values(), return_exceptions=True))
+        for key, res in zip(futs, done):
+            if isinstance(res, BaseException):
+                raise res
+            vecs[key] = res
+    return [vecs[key] for key in keys]
+
+async def embed_query(text: str) -> Vector:
+    key = f"{EMBED_MODEL}:{cache.normalize_query(text)}"
+    vec = embed_cache.get(key)
+    if vec is not None:
+        return vec
+    # Single-flight: concurrent callers for the same text (e.g. search + inspect) share one call
+    fut = _embed_inflight.get(key)
+    if fut is None:
+        fut = asyncio.ensure_future(_embed_remote(key, text.strip()))
+        _embed_inflight[key] = fut
+        fut.add_done_callback(lambda _f: _embed_inflight.pop(key, None))
+    return await asyncio.shield(fut)
+
+async def warmup():
+    """Build the metadata store, open the ANN channel (or load the local index) before the first query."""
+    backend = await asyncio.to_thread(get_backend)
+    if HYBRID:
+        await asyncio.to_thread(get_lexical)
+    if rerank.RERANK:
+        await asyncio.to_thread(rerank.warmup)
+    await backend.warmup()
+
+def preload():
+    """
+    The synchronous part of warmup(), for a pre-forking master (SERVE_MODE=workers): metadata
+    store, BM25 index, backend (the local index is memory-mapped) and NumPy. Opens no network
+    channel, so the workers forked afterwards share all of it and only connect in warmup().
+    """
+    get_backend()
+    if HYBRID:
+        get_lexical()
+    if rerank.RERANK:
+        rerank.warmup()
+
+def _after_fork():
+    global _init_lock, _lexical_lock
+    # Locks held by a thread at fork time would stay held in the child forever
+    _init_lock, _lexical_lock = threading.RLock(), threading.Lock()
+    _embed_inflight.clear()
+    if _backend is not None:
+        _backend.after_fork()
+
+os.register_at_fork(after_in_child=_after_fork)
+
+def index_version() -> Optional[float]:
+    """Changes whenever the index is re-seeded; caches keyed on retrieval results compare against it."""
+    store = get_meta_store()
+    store.maybe_reload()
+    return store.version
+
+# Share of returned neighbors that survive the post-filter, per (domain, clearance).
+# With restricts pushed into the index this stays ~1.0; datapoints seeded without
+# restricts drag it down and the next query over-fetches accordingly.
+_pass_rate: Dict[tuple, float] = {}
+
+def _neighbor_budget(scope: tuple, k: int) -> int:
+    rate = _pass_rate.get(scope, 1.0)
+    return min(ANN_MAX_NEIGHBORS, max(k, math.ceil(k / max(rate, 0.05))))
+
+def _observe_pass_rate(scope: tuple, returned: int, kept: int, alpha: float = 0.2):
+    if returned:
+        prev = _pass_rate.get(scope, 1.0)
+        _pass_rate[scope] = (1 - alpha) * prev + alpha * (kept / returned)
+
+def _item(dp_id: str, meta: Dict[str, Any], distance: Optional[float] = None) -> Dict[str, Any]:
+    # normalize clearance
+    cm = meta.get("clearance_min")
+    try:
+        cm_int = int(cm) if cm is not None else 0
+    except Exception:
+        cm_int = 0
+    return {
+        "text": meta.get("chunk") or f"(no-chunk) id={dp_id}",
+        "doc_id": meta.get("doc_id"),
+        "section": meta.get("section"),
+        "domain_meta": meta.get("domain"),
+        "clearance_min": cm_int,
+        "datapoint_id": dp_id,
+        "distance": distance,
+    }
+
+def _allowed(items: List[Dict[str, Any]], domain: str, clearance: int) -> List[Dict[str, Any]]:
+    # Still re-check here: never trust a backend (or a datapoint missing restricts) with clearance
+    return [it for it in items
+            if it.get("domain_meta") == domain and it["clearance_min"] <= int(clearance)]
 
-    resp = _client.find_neighbors(req)
-    neighbors = list(resp.nearest_neighbors[0].neighbors or []) if resp.nearest_neighbors else []
+# Same for ANN lookups: one FindNeighborsRequest carries every query that arrived within the
+# window. Off by default for the in-process index, where there is no round trip to save.
+async def _find_neighbors_many(queries: List[backends.NeighborQuery]) -> List[List[backends.Neighbor]]:
+    backend = get_backend()
+    with metrics.STAGE_SECONDS.time("find_neighbors"):
+        return await resilience.ANN.call(lambda: backend.find_neighbors_many(queries))
 
-    # 3) Build items from metadata on the datapoint itself
-    items: List[Dict[str, Any]] = []
-    for n in neighbors:
-        meta = _meta_from_neighbor(n)
-        dp_id = _neighbor_id(n)
-
-        # normalize clearance
-        cm = meta.get("clearance_min")
-        try:
-            cm_int = int(cm) if cm is not None else 0
-        except Exception:
-            cm_int = 0
-
-        items.append({
-            "text": meta.get("chunk") or f"(no-chunk) id={dp_id}",
-            "doc_id": meta.get("doc_id"),
-            "section": meta.get("section"),
-            "domain_meta": meta.get("domain"),
-            "clearance_min": cm_int,
-            "datapoint_id": dp_id,
-            "distance": n.distance,
-        })
+_ann_batcher = batcher.from_env("ann", _find_neighbors_many, max_batch=32,
+                                window_ms=5.0 if os.getenv("RETRIEVER_BACKEND", "vertex").lower() == "vertex" else 0.0)
 
-    # # 4) Domain + clearance filter (your original behavior)
-    # same = [it for it in items if it.get("domain_meta") == domain and it["clearance_min"] <= int(clearance)]
-    # return same if same else [it for it in items if it["clearance_min"] <= int(clearance)]
+def batch_stats() -> Dict[str, Any]:
+    return {"embed": _embed_batcher.stats(), "ann": _ann_batcher.stats()}
 
+def _vector_items(neighbors: List[backends.Neighbor], domain: str, clearance: int, k: int) -> List[Dict[str, Any]]:
+    # Build items from the joined metadata, then the domain + clearance filter
+    items = [_item(n.id, n.meta, n.distance) for n in neighbors]
+    same = _allowed(items, domain, clearance)
+    _observe_pass_rate((domain, int(clearance)), len(items), len(same))
+    return same[:k]  # no cross-domain fallback
 
-    same = [it for it in items
-            if it.get("domain_meta") == domain and it["clearance_min"] <= int(clearance)]
-    return same  # no cross-domain fallback
-
-
-def inspect_neighbors(q: str, k: int = 5) -> Dict[str, Any]:
-    vec = embed_query(q)
-    req = aiplatform_v1.FindNeighborsRequest(
-        index_endpoint=INDEX_ENDPOINT,
-        deployed_index_id=DEPLOYED_ID,
-        queries=[aiplatform_v1.FindNeighborsRequest.Query(
-            datapoint=aiplatform_v1.IndexDatapoint(feature_vector=vec),
-            neighbor_count=k
-        )],
-        return_full_datapoint=True,
-    )
-    resp = _client.find_neighbors(req)
-    neighbors = list(resp.nearest_neighbors[0].neighbors or []) if resp.nearest_neighbors else []
+async def vector_search(q: str, domain: str, clearance: int, k: int = 8) -> List[Dict[str, Any]]:
+    # 1) Embed
+    vec = await embed_query(q)
+
+    # 2) Nearest neighbors, with domain/clearance filtering done by the index itself
+    scope = (domain, int(clearance))
+    neighbors = await _ann_batcher.submit(
+        backends.NeighborQuery(vec, _neighbor_budget(scope, k), domain, int(clearance)))
+    return _vector_items(neighbors, domain, clearance, k)
+
+def lexical_search(q: str, domain: str, clearance: int, k: int = 8) -> List[Dict[str, Any]]:
+    with metrics.STAGE_SECONDS.time("lexical"):
+        hits = get_lexical().search(q, k, domain=domain, max_clearance=int(clearance))
+    metas = get_meta_store().get_many([dp_id for dp_id, _ in hits])
+    items = []
+    for dp_id, score in hits:
+        if dp_id in metas:
+            it = _item(dp_id, metas[dp_id])
+            it["bm25"] = round(score, 4)
+            items.append(it)
+    return _allowed(items, domain, clearance)
+
+def _lexical_or_empty(q: str, domain: str, clearance: int, k: int) -> List[Dict[str, Any]]:
+    try:
+        return lexical_search(q, domain, clearance, k)
+    except Exception:
+        log.exception("lexical search failed")
+        return []
+
+def _fuse(vec: List[Dict[str, Any]], lex: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+    by_id = {it["datapoint_id"]: it for it in lex}
+    for it in vec:
+        if "bm25" in by_id.get(it["datapoint_id"], {}):
+            it["bm25"] = by_id[it["datapoint_id"]]["bm25"]
+        by_id[it["datapoint_id"]] = it
+    fused = lexical.rrf([[it["datapoint_id"] for it in vec], [it["datapoint_id"] for it in lex]], k=RRF_K)
+    out = []
+    for dp_id, score in fused[:k]:
+        it = by_id[dp_id]
+        it["rrf"] = round(score, 5)
+        out.append(it)
+    return out
+
+async def search(q: str, domain: str, clearance: int, k: int = 8) -> List[Dict[str, Any]]:
+    if not HYBRID:
+        return await vector_search(q, domain, clearance, k)
+
+    # ANN in flight while BM25 runs locally; a slow or failing vector side doesn't hold up lexical hits
+    vec_task = asyncio.ensure_future(vector_search(q, domain, clearance, k))
+    lex = _lexical_or_empty(q, domain, clearance, k)
+    # Past the deadline only give up on the vector side if there is something to serve instead
+    await asyncio.wait([vec_task], timeout=VECTOR_DEADLINE_MS / 1000 if lex else None)
+    try:
+        if not vec_task.done():
+            vec_task.cancel()
+            raise TimeoutError(f"vector search over {VECTOR_DEADLINE_MS:.0f} ms")
+        vec = vec_task.result()
+    except Exception as e:
+        if not lex:
+            raise
+        log.warning("vector search unavailable (%s); serving %d lexical hits", type(e).__name__, len(lex))
+        vec = []
+    return _fuse(vec, lex, k)
+
+async def search_many(queries: List[Tuple[str, str, int]], k: int = 8) -> List[Union[List[Dict[str, Any]], Exception]]:
+    """
+    search() for many (query, domain, clearance) at once: one embedding request and one
+    find_neighbors request carrying every query. Returns one result per query, in order;
+    an item whose retrieval failed gets its exception instead of a list.
+    """
+    if not queries:
+        return []
+    lex = [_lexical_or_empty(q, d, c, k) if HYBRID else [] for q, d, c in queries]
+    try:
+        vecs = await embed_many([q for q, _, _ in queries])
+        batch = await _find_neighbors_many([
+            backends.NeighborQuery(v, _neighbor_budget((d, int(c)), k), d, int(c))
+            for v, (_, d, c) in zip(vecs, queries)
+        ])
+        vec_items: List[Any] = [_vector_items(n, d, c, k) for n, (_, d, c) in zip(batch, queries)]
+    except Exception as e:
+        # Shared failure (embedding or ANN): items with lexical hits still get an answer
+        log.warning("batched vector search failed (%s)", type(e).__name__)
+        vec_items = [e] * len(queries)
+
+    out: List[Union[List[Dict[str, Any]], Exception]] = []
+    for vec, lx in zip(vec_items, lex):
+        if isinstance(vec, Exception):
+            out.append(_fuse([], lx, k) if lx else vec)
+        else:
+            out.append(_fuse(vec, lx, k) if HYBRID else vec)
+    return out
+
+# ---- Optional rerank of an over-fetched candidate set (RERANK=1, see rerank.py) ----
+async def _stored_vectors(ids: List[str]) -> Dict[str, Vector]:
+    backend = get_backend()
+    return await resilience.ANN.call(lambda: backend.vectors(ids))
+
+async def rerank_items(q: str, items: List[Dict[str, Any]], k: int = 8) -> List[Dict[str, Any]]:
+    """Exact-cosine + MMR pick of the prompt chunks; `items[:k]` if it can't finish in RERANK_BUDGET_MS."""
+    return await rerank.rerank(q, items, embed_query, _stored_vectors, fallback_k=k)
+
+
+async def inspect_neighbors(q: str, k: int = 5) -> Dict[str, Any]:
+    vec = await embed_query(q)
+    neighbors = await get_backend().find_neighbors(vec, k)
     out = []
     for n in neighbors:
         out.append({
-            "id": _neighbor_id(n),
+            "id": n.id,
             "distance": n.distance,
-            "meta": _meta_from_neighbor(n),  # ← shows chunk/doc/section directly
+            "meta": n.meta,  # ← shows chunk/doc/section directly
         })
-    return {"neighbors": out}
+    return {"neighbors": out, "backend": get_backend().name}
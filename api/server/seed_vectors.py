@@ -1,29 +1,16 @@
-# api/server/seed_vectors.py  — minimal, works on Tree-AH
-import json
-import requests
-import google.auth
-from google.auth.transport.requests import Request
-import vertexai
-from vertexai.language_models import TextEmbeddingInput, TextEmbeddingModel
-
-PROJECT = "teja-sunhack"
-LOCATION = "us-central1"
-INDEX_ID = "3872376598934061056"  # your index id
-INDEX_NAME = f"projects/{PROJECT}/locations/{LOCATION}/indexes/{INDEX_ID}"
-EMBED_MODEL = "text-embedding-004"
-
-# auth
-SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
-creds, _ = google.auth.default(scopes=SCOPES)
-creds.refresh(Request())
-HEADERS = {"Authorization": f"Bearer {creds.token}", "Content-Type": "application/json"}
-
-vertexai.init(project=PROJECT, location=LOCATION)
-embed_model = TextEmbeddingModel.from_pretrained(EMBED_MODEL)
-
-def embed(txt: str):
-    vals = embed_model.get_embeddings([TextEmbeddingInput(txt, "RETRIEVAL_DOCUMENT")])[0].values
-    return [float(x) for x in vals]
+# api/server/seed_vectors.py  — seeds the demo corpus below through the ingest pipeline
+#
+#   python api/server/seed_vectors.py                  # Vertex embeddings + upsertDatapoints
+#   python api/server/seed_vectors.py --backend local  # Vertex embeddings + LocalIndex
+#   ... --backend local --embedder hash                # no GCP at all (tests; not servable)
+#
+# Importing this module has no side effects (benchmarks reuse DOCS); batching, retries and
+# incremental re-runs live in ingest.py.
+import os
+import asyncio
+import argparse
+
+import ingest
 
 # (id, text, domain, clearance_min, doc_id, section)
 DOCS = [
@@ -100,47 +87,28 @@ DOCS_EXT = [
 DOCS = DOCS + DOCS_EXT
 
 
-datapoints = []
-for did, text, domain, cmin, doc_id, section in DOCS:
-
-
-    meta = {
-        "doc_id": doc_id,
-        "section": section,
-        "chunk": text,
-        "domain": domain,
-        "clearance_min": cmin,
-    }
-
-    datapoints.append({
-        "datapointId": did,
-        "featureVector": embed(text),
-
-        # keep if you want, but we won't rely on it
-        "crowdingTag": {"crowdingAttribute": json.dumps(meta)},
-
-        # ✅ reliable place for our JSON
-        "restricts": [
-            {
-                "namespace": "meta",
-                "allowList": [json.dumps(meta)]   # <-- THIS field name matters
-            }
-        ],
-    })
-
-
+def main():
+    ap = argparse.ArgumentParser(description="Seed the demo corpus")
+    ap.add_argument("--backend", choices=("vertex", "local"), default="vertex")
+    ap.add_argument("--embedder", choices=("vertex", "hash"), default="vertex")
+    ap.add_argument("--concurrency", type=int, default=4)
+    args = ap.parse_args()
 
-url = f"https://{LOCATION}-aiplatform.googleapis.com/v1/{INDEX_NAME}:upsertDatapoints"
-body = {"datapoints": datapoints}
+    embedder = ingest.make_embedder(args.embedder)
+    if args.backend == "local":
+        sink = ingest.LocalIndexSink(os.getenv("LOCAL_INDEX_DIR", os.path.join(ingest.HERE, "local_index")), embedder.id)
+    else:
+        sink = ingest.VertexIndexSink()
 
-r = requests.post(url, headers=HEADERS, data=json.dumps(body), timeout=60)
+    meta_path = os.getenv("SEED_META_PATH", os.path.join(ingest.HERE, "seed_meta.json"))
+    stats = asyncio.run(ingest.ingest(
+        ingest.chunks_from_rows(DOCS), embedder, sink,
+        state_path=os.path.join(ingest.HERE, f".seed_state.{args.backend}.json"),
+        meta_path=meta_path,
+        concurrency=args.concurrency,
+    ))
+    print(f"Seeded {stats}; wrote {meta_path}")
 
-# after requests.post(...) success
-id_map = {d["datapointId"]: json.loads(d["crowdingTag"]["crowdingAttribute"]) for d in datapoints}
-with open("api/server/seed_meta.json", "w") as f:
-    json.dump(id_map, f)
-print("Wrote api/server/seed_meta.json with", len(id_map), "entries")
 
-if r.status_code >= 300:
-    raise RuntimeError(f"Upsert failed: {r.status_code} {r.text}")
-print("Upserted:", [d["datapointId"] for d in datapoints])
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+# api/server/tests/conftest.py
+# The server is a set of flat modules run from api/server; make them importable from
+# wherever pytest is started, and give tests a clock they can move.
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeClock:
+    """Stands in for a module's `time`: monotonic(), time() and perf_counter() all read `now`."""
+
+    def __init__(self, start: float = 1000.0):
+        self.now = start
+
+    def monotonic(self) -> float:
+        return self.now
+
+    time = perf_counter = monotonic
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
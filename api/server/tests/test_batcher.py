@@ -0,0 +1,116 @@
+# api/server/tests/test_batcher.py
+import asyncio
+import gc
+
+import pytest
+
+from batcher import MicroBatcher
+
+
+def _recording(fn=None):
+    calls = []
+
+    async def call(items):
+        calls.append(list(items))
+        await asyncio.sleep(0)
+        return [fn(x) if fn else x * 10 for x in items]
+
+    return call, calls
+
+
+def test_concurrent_submits_share_a_batch_and_get_their_own_results():
+    fn, calls = _recording()
+    b = MicroBatcher("t", fn, max_batch=8, window_ms=5)
+
+    async def main():
+        return await asyncio.gather(*(b.submit(i) for i in range(5)))
+
+    assert asyncio.run(main()) == [0, 10, 20, 30, 40]
+    assert calls == [[0, 1, 2, 3, 4]]
+
+
+def test_full_batch_goes_out_without_waiting_for_the_window():
+    fn, calls = _recording()
+    b = MicroBatcher("t", fn, max_batch=3, window_ms=10_000)
+
+    async def main():
+        return await asyncio.wait_for(asyncio.gather(*(b.submit(i) for i in range(6))), 1.0)
+
+    assert asyncio.run(main()) == [0, 10, 20, 30, 40, 50]
+    assert calls == [[0, 1, 2], [3, 4, 5]]
+    assert b.full_flushes == 2
+
+
+def test_per_item_exception_fails_only_that_caller():
+    fn, _ = _recording(lambda x: ValueError(x) if x == 2 else x)
+    b = MicroBatcher("t", fn, max_batch=8, window_ms=1)
+
+    async def main():
+        return await asyncio.gather(*(b.submit(i) for i in range(4)), return_exceptions=True)
+
+    out = asyncio.run(main())
+    assert out[:2] == [0, 1] and out[3] == 3
+    assert isinstance(out[2], ValueError)
+
+
+def test_batch_failure_reaches_every_caller():
+    async def fn(items):
+        raise RuntimeError("down")
+
+    b = MicroBatcher("t", fn, max_batch=8, window_ms=1)
+
+    async def main():
+        return await asyncio.gather(*(b.submit(i) for i in range(3)), return_exceptions=True)
+
+    assert all(isinstance(e, RuntimeError) for e in asyncio.run(main()))
+
+
+def test_cancelled_caller_is_left_out_of_the_batch():
+    fn, calls = _recording()
+    b = MicroBatcher("t", fn, max_batch=8, window_ms=5)
+
+    async def main():
+        gone = asyncio.ensure_future(b.submit(1))
+        stay = asyncio.ensure_future(b.submit(2))
+        await asyncio.sleep(0)
+        gone.cancel()
+        return await stay
+
+    assert asyncio.run(main()) == 20
+    assert calls == [[2]]
+
+
+def test_disabled_calls_one_item_at_a_time():
+    fn, calls = _recording(lambda x: ValueError() if x == 1 else x)
+    b = MicroBatcher("t", fn, window_ms=0)
+
+    async def main():
+        assert await b.submit(0) == 0
+        with pytest.raises(ValueError):
+            await b.submit(1)
+
+    asyncio.run(main())
+    assert calls == [[0], [1]]
+    assert not b.enabled
+
+
+def test_dispatch_survives_garbage_collection():
+    release = None
+
+    async def fn(items):
+        await release.wait()
+        return items
+
+    b = MicroBatcher("t", fn, max_batch=2, window_ms=1)
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        futs = [asyncio.ensure_future(b.submit(i)) for i in range(2)]
+        await asyncio.sleep(0.01)
+        gc.collect()
+        release.set()
+        return await asyncio.wait_for(asyncio.gather(*futs), 1.0)
+
+    assert asyncio.run(main()) == [0, 1]
+    assert not b._tasks
@@ -0,0 +1,100 @@
+# api/server/tests/test_cache.py
+import cache
+
+Q = [1.0, 0.0, 0.0]
+NEAR = [0.99, 0.05, 0.0]  # cosine ~0.9987 with Q
+FAR = [0.0, 1.0, 0.0]
+
+
+def test_semantic_hit_needs_similar_query_in_same_partition():
+    c = cache.SemanticCache(threshold=0.97)
+    finance = c.partition("finance", 2, ["b", "a"])
+    c.set(finance, Q, {"answer": "x"})
+    assert c.get(finance, NEAR) == {"answer": "x"}
+    assert c.get(finance, FAR) is None
+    # same question, other scope or other grounding: never shared
+    assert c.get(c.partition("finance", 1, ["a", "b"]), Q) is None
+    assert c.get(c.partition("hr", 2, ["a", "b"]), Q) is None
+    assert c.get(c.partition("finance", 2, ["a"]), Q) is None
+    # chunk order doesn't matter
+    assert c.get(c.partition("finance", 2, ["a", "b"]), Q) == {"answer": "x"}
+
+
+def test_semantic_best_match_wins():
+    c = cache.SemanticCache(threshold=0.5)
+    p = c.partition("hr", 1, ["a"])
+    c.set(p, FAR, {"answer": "far"})
+    c.set(p, Q, {"answer": "q"})
+    assert c.get(p, NEAR) == {"answer": "q"}
+
+
+def test_semantic_ttl(monkeypatch, clock):
+    monkeypatch.setattr(cache, "time", clock)
+    c = cache.SemanticCache(ttl_s=10)
+    p = c.partition("hr", 1, ["a"])
+    c.set(p, Q, {"answer": "x"})
+    clock.advance(9)
+    assert c.get(p, Q) == {"answer": "x"}
+    clock.advance(2)
+    assert c.get(p, Q) is None
+    assert c.stats()["size"] == 0
+
+
+def test_semantic_version_change_invalidates():
+    c = cache.SemanticCache()
+    p = c.partition("hr", 1, ["a"])
+    c.set(p, Q, {"answer": "x"}, version=1.0)
+    assert c.get(p, Q, version=1.0) == {"answer": "x"}
+    assert c.get(p, Q, version=2.0) is None
+    assert c.invalidations == 1
+    assert c.get(p, Q, version=1.0) is None  # the old entries are gone, not hidden
+
+
+def test_semantic_lru_eviction():
+    c = cache.SemanticCache(maxsize=2)
+    parts = [c.partition("hr", 1, [str(i)]) for i in range(3)]
+    c.set(parts[0], Q, {"n": 0})
+    c.set(parts[1], Q, {"n": 1})
+    assert c.get(parts[0], Q) == {"n": 0}  # now most recently used
+    c.set(parts[2], Q, {"n": 2})
+    assert c.get(parts[1], Q) is None
+    assert c.get(parts[0], Q) == {"n": 0}
+    assert c.evictions == 1
+
+
+def test_semantic_partition_grows_and_shrinks():
+    c = cache.SemanticCache(threshold=0.999, maxsize=1000)
+    p = c.partition("hr", 1, ["a"])
+    vecs = [[1.0 if j == i else 0.0 for j in range(20)] for i in range(20)]
+    for i, v in enumerate(vecs):
+        c.set(p, v, {"n": i})
+    assert all(c.get(p, v) == {"n": i} for i, v in enumerate(vecs))
+    c.maxsize = 5
+    c.set(c.partition("hr", 1, ["b"]), Q, {"n": "b"})
+    assert [i for i, v in enumerate(vecs) if c.get(p, v)] == [16, 17, 18, 19]
+
+
+def test_ttl_cache_lru_and_expiry(monkeypatch, clock):
+    monkeypatch.setattr(cache, "time", clock)
+    c = cache.TTLCache("t", maxsize=2, ttl_s=5)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1
+    c.set("c", 3)
+    assert c.get("b") is None and c.get("a") == 1
+    clock.advance(6)
+    assert c.get("a") is None
+    assert c.stats()["evictions"] == 1
+
+
+def test_ttl_cache_shared_backend(tmp_path):
+    shared = cache.shared_backend(str(tmp_path / "kv.sqlite"))
+    writer = cache.TTLCache("t", shared=shared)
+    reader = cache.TTLCache("t", shared=cache.shared_backend(str(tmp_path / "kv.sqlite")))
+    writer.set("k", {"v": 1})
+    assert reader.get("k") == {"v": 1}
+    assert reader.shared_hits == 1
+
+
+def test_normalize_query():
+    assert cache.normalize_query("  Travel   Reimbursement?") == "travel reimbursement?"
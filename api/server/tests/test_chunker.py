@@ -0,0 +1,85 @@
+# api/server/tests/test_chunker.py
+import random
+
+from chunker import chunk_lines, count_tokens, truncate_tokens
+
+
+def _chunks(text: str, **kw):
+    return list(chunk_lines(text.splitlines(keepends=True), **kw))
+
+
+def _words(n: int, prefix: str = "w") -> str:
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+
+def _doc(rng: random.Random):
+    """Random markdown document, and its body words in order."""
+    lines, body = [], []
+    for s in range(rng.randint(1, 6)):
+        lines += [f"# H{s}", ""]
+        for p in range(rng.randint(0, 3)):
+            words = [f"s{s}p{p}w{i}" + ("." if rng.random() < 0.2 else "")
+                     for i in range(rng.choice([1, 2, 3, 10, 40, 150]))]
+            body += [w.rstrip(".") for w in words]
+            lines += [" ".join(words), ""]
+    return "\n".join(lines), body
+
+
+def test_count_and_truncate_tokens():
+    assert count_tokens("Travel expenses, per diem.") == 7  # "expenses" is two
+    assert count_tokens("") == 0
+    assert truncate_tokens("one two three four", 2) == "one two"
+
+
+def test_text_preserved_in_order_within_budget():
+    rng = random.Random(7)
+    for _ in range(500):
+        text, body = _doc(rng)
+        max_tokens, overlap = rng.choice([(30, 5), (60, 10), (100, 0)])
+        chunks = _chunks(text, max_tokens=max_tokens, overlap_tokens=overlap)
+        words = []
+        for n, c in enumerate(chunks):
+            assert c.index == n
+            assert c.tokens == count_tokens(c.text) <= max_tokens
+            if n < len(chunks) - 1:
+                assert c.tokens >= 8
+            ws = [w.rstrip(".") for w in c.text.split() if not w.startswith("H")]
+            k = 0  # skip the overlap with what earlier chunks already covered
+            while k < len(ws) and ws[k] in words[-len(ws):]:
+                k += 1
+            words += ws[k:]
+        assert words == body
+
+
+def test_short_sections_carried_forward_in_order():
+    text = "# A\n\nx.\n\n# B\n\ny.\n\n# C\n\n" + " ".join(f"w{i} alpha beta." for i in range(300))
+    first = _chunks(text, max_tokens=100, overlap_tokens=20)[0]
+    assert first.section == "A"
+    assert first.text.startswith("x.\n\nB\n\ny.\n\nC\n\nw0 alpha beta.")
+
+
+def test_short_section_not_emitted_alone_before_a_long_one():
+    chunks = _chunks("# Title\n\nshort.\n\n## A\n\n" + _words(900), max_tokens=100, overlap_tokens=20)
+    assert chunks[0].section == "Title"
+    assert chunks[0].text.startswith("short.\n\nA\n\nw0 w1")
+    assert chunks[0].tokens == 100
+    assert all(c.section == "A" for c in chunks[1:])
+
+
+def test_heading_starts_a_new_chunk():
+    chunks = _chunks(f"# A\n\n{_words(20, 'a')}\n\n# B\n\n{_words(20, 'b')}", max_tokens=100)
+    assert [(c.section, c.text) for c in chunks] == [("A", _words(20, "a")), ("B", _words(20, "b"))]
+
+
+def test_consecutive_chunks_overlap():
+    sentences = " ".join(f"Sentence number {i} is here." for i in range(60))
+    chunks = _chunks(f"# A\n\n{sentences}", max_tokens=60, overlap_tokens=15)
+    assert len(chunks) > 2
+    for prev, cur in zip(chunks, chunks[1:]):
+        assert cur.text.split(". ")[0] in prev.text
+
+
+def test_pdf_headings_and_hyphenation():
+    chunks = _chunks("3.2 Travel Expenses\nEmployees may claim reimburse-\nment for approved trips.\n")
+    assert [(c.section, c.text) for c in chunks] == [
+        ("3.2 Travel Expenses", "Employees may claim reimbursement for approved trips.")]
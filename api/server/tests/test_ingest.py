@@ -0,0 +1,137 @@
+# api/server/tests/test_ingest.py
+import asyncio
+import json
+
+import pytest
+
+import ingest
+from local_index import LocalIndex
+
+
+def _rows(n, domain="hr"):
+    return [(f"c{i}", f"policy {i} about topic {i % 7} and rule {i * 3}", domain, 0, f"doc{i // 5}", "Intro")
+            for i in range(n)]
+
+
+class Embedder(ingest.HashEmbedder):
+    """Small hash embedder that can be told to fail after a number of batches."""
+    max_batch = 10
+
+    def __init__(self, dim=64, fail_after=None):
+        super().__init__(dim)
+        self.batches = 0
+        self.fail_after = fail_after
+
+    async def embed(self, texts):
+        self.batches += 1
+        if self.fail_after is not None and self.batches > self.fail_after:
+            raise ValueError("embedding quota exhausted")
+        return await super().embed(texts)
+
+
+@pytest.fixture
+def run(tmp_path):
+    def run(rows, embedder=None, **kw):
+        embedder = embedder or Embedder()
+        sink = ingest.LocalIndexSink(str(tmp_path / "idx"), embedder.id)
+        return asyncio.run(ingest.ingest(
+            ingest.chunks_from_rows(rows), embedder, sink, state_path=str(tmp_path / "state.json"),
+            meta_path=str(tmp_path / "meta.json"), concurrency=1, upsert_batch=10, **kw))
+    return run
+
+
+def _state(tmp_path):
+    return json.loads((tmp_path / "state.json").read_text())
+
+
+def test_rerun_only_touches_changes(run, tmp_path):
+    assert run(_rows(45)) == {"chunks": 45, "changed": 45, "unchanged": 0, "removed": 0}
+    idx = LocalIndex.load(str(tmp_path / "idx"))
+    assert len(idx) == 45 and idx.embedder == "hash-64"
+    assert set(json.loads((tmp_path / "meta.json").read_text())) == {f"c{i}" for i in range(45)}
+
+    assert run(_rows(45))["changed"] == 0
+
+    # A metadata move (new domain) is a change even with identical text
+    rows = _rows(45)
+    rows[3] = rows[3][:2] + ("finance",) + rows[3][3:]
+    assert run(rows)["changed"] == 1
+    assert LocalIndex.load(str(tmp_path / "idx")).metas["c3"]["domain"] == "finance"
+
+
+def test_dry_run_writes_nothing(run, tmp_path):
+    assert run(_rows(12), dry_run=True)["changed"] == 12
+    assert not (tmp_path / "state.json").exists() and not (tmp_path / "idx").exists()
+
+
+def test_failed_run_resumes_where_it_stopped(run, tmp_path):
+    with pytest.raises(ValueError):
+        run(_rows(60), Embedder(fail_after=3))
+    done = _state(tmp_path)["chunks"]
+    assert 0 < len(done) < 60
+    # The checkpoint and the index agree: nothing recorded that wasn't upserted
+    assert sorted(LocalIndex.load(str(tmp_path / "idx")).ids) == sorted(done)
+
+    stats = run(_rows(60))
+    assert stats["changed"] == 60 - len(done) and stats["unchanged"] == len(done)
+    assert len(LocalIndex.load(str(tmp_path / "idx"))) == 60
+
+
+def test_prune_removes_vanished_chunks(run, tmp_path):
+    run(_rows(30))
+    assert run(_rows(20))["removed"] == 0  # without --prune nothing goes
+    assert run(_rows(20), prune=True)["removed"] == 10
+    assert len(LocalIndex.load(str(tmp_path / "idx"))) == 20
+    assert len(_state(tmp_path)["chunks"]) == 20
+
+    assert run([], prune=True)["removed"] == 20
+    assert not (tmp_path / "idx").exists()
+    assert _state(tmp_path)["chunks"] == {}
+
+
+def test_other_embedder_reembeds_everything(run, tmp_path):
+    run(_rows(25))
+    stats = run(_rows(25), Embedder(dim=32))
+    assert stats["changed"] == 25
+    idx = LocalIndex.load(str(tmp_path / "idx"))
+    assert idx.embedder == "hash-32" and idx.vectors.shape == (25, 32)
+    assert _state(tmp_path)["target"]["embedder"] == "hash-32"
+
+
+def test_with_retry_retries_only_transient_errors():
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ingest.RetryableError("429")
+        return "ok"
+
+    assert asyncio.run(ingest.with_retry(flaky, base_delay=0)) == "ok" and len(calls) == 3
+
+    class BadRequest(Exception):
+        code = 400
+
+    async def bad():
+        calls.append(1)
+        raise BadRequest("invalid payload")
+
+    calls.clear()
+    with pytest.raises(BadRequest):
+        asyncio.run(ingest.with_retry(bad, base_delay=0))
+    assert len(calls) == 1
+
+
+def test_read_documents_front_matter_and_folders(tmp_path):
+    (tmp_path / "finance").mkdir()
+    (tmp_path / "finance" / "travel.md").write_text("# Travel\n\nBook economy class for flights under six hours.\n")
+    (tmp_path / "handbook.md").write_text(
+        "---\ndomain: HR\nclearance_min: 2\ndoc_id: hb-1\n---\n# Leave\n\nTwenty days of annual leave.\n")
+    chunks = list(ingest.read_documents(str(tmp_path), None, 0))
+    by_doc = {c.meta["doc_id"]: c for c in chunks}
+    assert set(by_doc) == {"travel.md", "hb-1"}
+    assert by_doc["travel.md"].meta["domain"] == "finance" and by_doc["travel.md"].meta["clearance_min"] == 0
+    hb = by_doc["hb-1"]
+    assert hb.meta["domain"] == "hr" and hb.meta["clearance_min"] == 2 and hb.meta["section"] == "Leave"
+    assert "---" not in hb.text and "annual leave" in hb.text
+    assert hb.id == "handbook-md-0"
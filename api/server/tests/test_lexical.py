@@ -0,0 +1,80 @@
+# api/server/tests/test_lexical.py
+import lexical
+
+
+def _meta(text: str, domain: str = "hr", clearance: int = 1, section: str = ""):
+    return {"chunk": text, "domain": domain, "clearance_min": clearance, "section": section}
+
+
+def _index(**docs):
+    idx = lexical.LexicalIndex()
+    idx.sync(docs.items(), version=1.0)
+    return idx
+
+
+def _ids(hits):
+    return [dp_id for dp_id, _ in hits]
+
+
+def test_tokenize_keeps_codes_whole_and_split():
+    assert lexical.tokenize("SEV-1 needs the I-9 and $5,000.") == ["sev-1", "sev", "1", "needs", "i-9", "9", "5000"]  # "i" is a stop word
+
+
+def test_exact_terms_rank_first():
+    idx = _index(a=_meta("New hires must complete I-9 within three business days."),
+                 b=_meta("New hires must complete training within fourteen days."))
+    assert _ids(idx.search("I-9 deadline")) == ["a"]
+    assert _ids(idx.search("new hires training")) == ["b", "a"]
+
+
+def test_filters():
+    idx = _index(a=_meta("travel policy", "finance", 3), b=_meta("travel policy", "finance", 1),
+                 c=_meta("travel policy", "hr", 1))
+    assert _ids(idx.search("travel", domain="finance", max_clearance=2)) == ["b"]
+    assert sorted(_ids(idx.search("travel", max_clearance=1))) == ["b", "c"]
+    assert idx.search("travel", domain="legal") == []
+
+
+def test_sync_tombstones_changed_and_removed_docs():
+    idx = _index(a=_meta("vacation days carry over"), b=_meta("sick leave is separate"))
+    idx.sync({"a": _meta("parental leave weeks"), "c": _meta("vacation policy")}.items(), version=2.0)
+    assert idx.version == 2.0
+    assert len(idx) == 2
+    assert idx.stats()["tombstones"] == 2  # old "a" and "b"
+    assert _ids(idx.search("vacation")) == ["c"]
+    assert _ids(idx.search("leave")) == ["a"]
+    assert idx.search("sick") == []
+
+
+def test_unchanged_upsert_is_a_no_op():
+    idx = _index(a=_meta("vacation days"))
+    idx.sync({"a": _meta("vacation days")}.items(), version=2.0)
+    assert idx.stats()["tombstones"] == 0
+
+
+def test_compact_drops_tombstones_and_keeps_results():
+    idx = _index(**{f"d{i}": _meta(f"policy number {i} vacation") for i in range(10)})
+    for i in range(0, 10, 2):
+        idx.remove(f"d{i}")
+    before = idx.search("vacation policy", k=10)
+    postings = idx.stats()["postings"]
+    idx.compact()
+    assert idx.stats()["tombstones"] == 0
+    assert idx.stats()["postings"] < postings
+    assert idx.search("vacation policy", k=10) == before
+    idx.upsert("d0", "vacation again", "hr", 1)
+    assert "d0" in _ids(idx.search("vacation", k=10))
+
+
+def test_sync_compacts_after_mass_replacement():
+    idx = lexical.LexicalIndex()
+    for v in range(4):
+        idx.sync(((f"d{i}", _meta(f"text {v} item {i}")) for i in range(100)), version=float(v))
+    assert idx.stats()["tombstones"] <= 2 * len(idx)
+    assert len(idx) == 100
+
+
+def test_rrf():
+    fused = lexical.rrf([["a", "b", "c"], ["c", "a"]], k=60)
+    assert [dp_id for dp_id, _ in fused] == ["a", "c", "b"]
+    assert fused[0][1] == 1 / 61 + 1 / 62
@@ -0,0 +1,92 @@
+# api/server/tests/test_local_index.py
+import json
+
+import numpy as np
+import pytest
+
+from local_index import LocalIndex
+
+
+def _corpus(n=2000, dim=32, seed=0):
+    # Clustered, like real embeddings (topics), so IVF lists mean something
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(40, dim))
+    vecs = (topics[rng.integers(40, size=n)] + rng.normal(scale=0.5, size=(n, dim))).astype(np.float32)
+    ids = [f"dp{i}" for i in range(n)]
+    metas = {dp: {"doc_id": f"d{i // 4}", "domain": ("hr", "finance")[i % 2], "clearance_min": i % 3}
+             for i, dp in enumerate(ids)}
+    return ids, vecs, metas
+
+
+def _exact_top(vecs, q, n):
+    x = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+    return list(np.argsort(-(x @ (q / np.linalg.norm(q))))[:n])
+
+
+def test_exact_search_matches_brute_force():
+    ids, vecs, metas = _corpus(300)
+    idx = LocalIndex.build(ids, vecs, metas, kind="exact", quant="none")
+    assert idx.kind == "exact" and len(idx) == 300
+    q = vecs[7] + 0.01
+    hits = idx.search(q, 5)
+    assert [h[0] for h in hits] == [ids[i] for i in _exact_top(vecs, q, 5)]
+    assert hits[0][0] == "dp7" and hits[0][2]["doc_id"] == "d1"
+    assert all(a[1] >= b[1] for a, b in zip(hits, hits[1:]))
+
+
+def test_filters_restrict_by_domain_and_clearance():
+    ids, vecs, metas = _corpus(300)
+    idx = LocalIndex.build(ids, vecs, metas, kind="exact", quant="none")
+    hits = idx.search(vecs[0], 20, domain="finance", max_clearance=1)
+    assert len(hits) == 20
+    assert all(m["domain"] == "finance" and m["clearance_min"] <= 1 for _, _, m in hits)
+    assert idx.search(vecs[0], 5, domain="legal") == []
+
+
+def test_ivf_recall_against_exact():
+    ids, vecs, metas = _corpus(4000)
+    idx = LocalIndex.build(ids, vecs, metas, kind="ivf", quant="none")
+    assert idx.kind == "ivf"
+    rng = np.random.default_rng(1)
+    found = 0
+    for qi in rng.choice(len(ids), 20, replace=False):
+        q = vecs[qi] + rng.normal(scale=0.1, size=vecs.shape[1]).astype(np.float32)
+        want = {ids[i] for i in _exact_top(vecs, q, 10)}
+        found += len(want & {h[0] for h in idx.search(q, 10)})
+    assert found / 200 >= 0.9
+
+
+def test_ivf_widens_probe_for_selective_filters():
+    ids, vecs, metas = _corpus(4000)
+    for dp in ids[:10]:
+        metas[dp] = dict(metas[dp], domain="legal")
+    idx = LocalIndex.build(ids, vecs, metas, kind="ivf", quant="none")
+    idx.nprobe = 1
+    hits = idx.search(vecs[500], 10, domain="legal")
+    assert sorted(h[0] for h in hits) == sorted(ids[:10])
+
+
+@pytest.mark.parametrize("kind", ["exact", "ivf"])
+def test_save_load_round_trip(tmp_path, kind):
+    ids, vecs, metas = _corpus(1000)
+    idx = LocalIndex.build(ids, vecs, metas, kind=kind, quant="none", embedder="text-embedding-004")
+    idx.save(str(tmp_path), dtype="float32")
+    assert json.loads((tmp_path / "info.json").read_text()) == {"embedder": "text-embedding-004"}
+
+    back = LocalIndex.load(str(tmp_path))
+    assert back.kind == kind and back.embedder == "text-embedding-004" and back.ids == idx.ids
+    q = vecs[42]
+    assert [h[0] for h in back.search(q, 5)] == [h[0] for h in idx.search(q, 5)]
+
+    # Rebuilt as exact: the stale IVF files go away
+    LocalIndex.build(ids, vecs, metas, kind="exact", quant="none").save(str(tmp_path), dtype="float32")
+    assert not (tmp_path / "centroids.npy").exists()
+    assert LocalIndex.load(str(tmp_path)).embedder is None
+
+
+def test_vectors_for_skips_unknown_ids():
+    ids, vecs, metas = _corpus(50)
+    idx = LocalIndex.build(ids, vecs, metas, kind="exact", quant="none")
+    found, mat = idx.vectors_for(["dp3", "nope", "dp9"])
+    assert found == ["dp3", "dp9"] and mat.shape == (2, 32) and mat.dtype == np.float32
+    assert np.allclose(mat[0], vecs[3] / np.linalg.norm(vecs[3]), atol=1e-6)
@@ -0,0 +1,76 @@
+# api/server/tests/test_packing.py
+import random
+
+import packing
+from chunker import count_tokens
+
+
+def _chunk(i: int, n_words: int, distance=None, **extra):
+    return {"datapoint_id": f"c{i}", "text": " ".join(f"t{i}w{k}" for k in range(n_words)),
+            "distance": distance, **extra}
+
+
+def _ids(packed):
+    return [c["datapoint_id"] for c in packed.chunks]
+
+
+def test_stays_within_budget():
+    rng = random.Random(3)
+    for _ in range(300):
+        chunks = [_chunk(i, rng.randint(1, 400), rng.random()) for i in range(rng.randint(1, 10))]
+        budget = rng.randint(0, 1500)
+        packed = packing.pack(chunks, budget, max_chunks=rng.randint(1, 6))
+        assert packed.tokens <= budget
+        assert packed.tokens == sum(count_tokens(c["text"]) for c in packed.chunks)
+        assert packed.dropped == len(chunks) - len(packed.chunks)
+        if packed.chunks:
+            assert packed.chunks[0]["datapoint_id"] == "c0"
+
+
+def test_top_chunk_trimmed_not_dropped():
+    packed = packing.pack([_chunk(0, 500, 0.9), _chunk(1, 10, 0.8)], 100)
+    assert _ids(packed) == ["c0"]
+    assert packed.chunks[0]["text"].endswith("…")
+    assert packed.tokens == 100
+
+
+def test_budget_bound_prefers_value_per_token():
+    # c1 is slightly more relevant than c2..c4 but costs as much as all three together
+    chunks = [_chunk(0, 50, 0.9), _chunk(1, 300, 0.85), _chunk(2, 40, 0.80), _chunk(3, 40, 0.79),
+              _chunk(4, 40, 0.5)]
+    assert _ids(packing.pack(chunks, 200)) == ["c0", "c2", "c3", "c4"]
+
+
+def test_cap_bound_prefers_value():
+    chunks = [_chunk(0, 50, 0.9), _chunk(1, 300, 0.85), _chunk(2, 40, 0.80), _chunk(3, 40, 0.2)]
+    assert _ids(packing.pack(chunks, 2000, max_chunks=3)) == ["c0", "c1", "c2"]
+
+
+def test_keeps_retrieval_order():
+    chunks = [_chunk(0, 10, 0.9), _chunk(1, 10, 0.1), _chunk(2, 10, 0.5)]
+    assert _ids(packing.pack(chunks, 1000)) == ["c0", "c1", "c2"]
+
+
+def test_relevance_prefers_rerank_then_rrf_then_distance():
+    chunks = [_chunk(0, 5, 0.1, rrf=0.03, rerank=0.2), _chunk(1, 5, 0.9, rrf=0.01, rerank=0.9)]
+    assert packing.relevance(chunks) == [0.1, 1.0]
+    chunks = [_chunk(0, 5, 0.1, rrf=0.03), _chunk(1, 5, 0.9, rrf=0.01)]
+    assert packing.relevance(chunks) == [1.0, 0.1]
+    # lexical-only hits have no distance: fall back to rank
+    assert packing.relevance([_chunk(0, 5), _chunk(1, 5, 0.9)]) == [1.0, 0.5]
+
+
+def test_near_duplicates_dropped():
+    text = "Hotel stays are reimbursable up to 180 dollars per night in Tier-1 cities."
+    chunks = [{"datapoint_id": "a", "text": text, "distance": 0.9},
+              {"datapoint_id": "b", "text": text + " ", "distance": 0.8},
+              {"datapoint_id": "c", "text": "Per-diem covers meals only.", "distance": 0.7}]
+    packed = packing.pack(chunks, 1000)
+    assert _ids(packed) == ["a", "c"]
+    assert packed.dropped == 1
+
+
+def test_context_budget():
+    assert packing.context_budget("gemini-2.5-flash", 1024, 200) == 2048
+    assert packing.context_budget("gemma-2-2b-it", 8000, 100) == 92
+    assert packing.context_budget("gemma-2-2b-it", 9000, 100) == 0
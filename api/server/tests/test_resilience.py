@@ -0,0 +1,146 @@
+# api/server/tests/test_resilience.py
+import asyncio
+
+import pytest
+
+import resilience
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, DeadlineExceeded, Dependency
+
+
+def test_breaker_open_half_open_closed(monkeypatch, clock):
+    monkeypatch.setattr(resilience, "time", clock)
+    b = CircuitBreaker("t", failures=3, cooldown_s=10)
+    for _ in range(2):
+        b.allow()
+        b.record(False)
+    assert b.state == CLOSED
+    b.allow()
+    b.record(False)
+    assert b.state == OPEN and b.opened == 1
+
+    with pytest.raises(CircuitOpen):
+        b.allow()
+    assert not b.available()
+    clock.advance(10)
+    assert b.available()
+
+    b.allow()  # the probe
+    assert b.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        b.allow()  # one probe at a time
+    b.record(True)
+    assert b.state == CLOSED
+    b.allow()
+
+
+def test_failed_probe_reopens(monkeypatch, clock):
+    monkeypatch.setattr(resilience, "time", clock)
+    b = CircuitBreaker("t", failures=1, cooldown_s=5)
+    b.allow()
+    b.record(False)
+    clock.advance(5)
+    b.allow()
+    b.record(False)
+    assert b.state == OPEN
+    with pytest.raises(CircuitOpen):
+        b.allow()
+    assert b.opened == 1  # re-opening from half-open is the same outage
+
+
+def test_no_verdict_keeps_state():
+    b = CircuitBreaker("t", failures=1)
+    b.allow()
+    b.record(None)
+    assert b.state == CLOSED and b.stats()["consecutive_failures"] == 0
+
+
+def test_dependency_deadline_and_short_circuit():
+    dep = Dependency("t", timeout_ms=20, failures=2, cooldown_s=60)
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(1)
+
+    async def main():
+        for _ in range(2):
+            with pytest.raises(DeadlineExceeded):
+                await dep.call(slow)
+        with pytest.raises(CircuitOpen):
+            await dep.call(slow)
+
+    asyncio.run(main())
+    assert len(calls) == 2
+    assert dep.timeouts == 2 and dep.short_circuits == 1
+    assert dep.error_rate(min_calls=1) == 1.0
+
+
+def test_errors_propagate_and_success_resets():
+    dep = Dependency("t", timeout_ms=1000, failures=2)
+
+    async def boom():
+        raise ValueError("bad")
+
+    async def ok():
+        return "ok"
+
+    async def main():
+        with pytest.raises(ValueError):
+            await dep.call(boom)
+        assert await dep.call(ok) == "ok"
+        with pytest.raises(ValueError):
+            await dep.call(boom)
+
+    asyncio.run(main())
+    assert dep.breaker.state == CLOSED
+
+
+def test_hedge_backup_wins_when_first_is_slow():
+    dep = Dependency("t", timeout_ms=2000, hedge=True, hedge_after_ms=20, hedge_max_ratio=1.0)
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        await asyncio.sleep(1.0 if len(attempts) == 1 else 0.0)
+        return len(attempts)
+
+    async def main():
+        return await dep.call(fn)
+
+    assert asyncio.run(main()) == 2
+    assert dep.hedges == 1 and dep.backup_wins == 1
+
+
+def test_fast_failure_is_retried_once():
+    dep = Dependency("t", timeout_ms=2000, hedge=True, hedge_after_ms=50, hedge_max_ratio=1.0)
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("reset")
+        return "ok"
+
+    assert asyncio.run(dep.call(fn)) == "ok"
+    assert len(attempts) == 2
+
+
+def test_stream_deadline_covers_every_chunk():
+    dep = Dependency("t", timeout_ms=50)
+
+    async def parts():
+        for i in range(10):
+            await asyncio.sleep(0.02)
+            yield i
+
+    async def open_stream():
+        return parts()
+
+    async def main():
+        got = []
+        with pytest.raises(DeadlineExceeded):
+            async for p in dep.stream(open_stream):
+                got.append(p)
+        return got
+
+    assert 0 < len(asyncio.run(main())) < 10
@@ -0,0 +1,78 @@
+# api/server/tests/test_vectors.py
+import json
+from array import array
+
+import numpy as np
+
+import vectors
+from local_index import LocalIndex
+
+
+def test_pack_is_float32_array():
+    v = vectors.pack([0.5, -1.25, 3.0])
+    assert isinstance(v, array) and v.typecode == "f" and list(v) == [0.5, -1.25, 3.0]
+    assert vectors.pack(v) is v
+    assert list(vectors.pack(np.array([1.0, 2.0], dtype=np.float64))) == [1.0, 2.0]
+
+
+def test_bytes_round_trip():
+    vals = [0.1234567, -0.5, 1e-3, 0.0]
+    f32 = vectors.to_bytes(vals, dtype="float32")
+    assert f32[:1] == b"f" and len(f32) == 1 + 4 * len(vals)
+    assert np.allclose(vectors.from_bytes(f32), vals, atol=1e-7)
+
+    f16 = vectors.to_bytes(vals, dtype="float16")
+    assert f16[:1] == b"e" and len(f16) == 1 + 2 * len(vals)
+    assert np.allclose(vectors.from_bytes(f16), vals, rtol=1e-3, atol=1e-4)
+
+
+def test_legacy_json_entries_still_load():
+    assert list(vectors.from_bytes(json.dumps([1.0, 2.5]).encode())) == [1.0, 2.5]
+
+
+def test_quantize_int8_reconstructs_rows():
+    rng = np.random.default_rng(0)
+    m = rng.normal(size=(50, 64)).astype(np.float32)
+    m[3] = 0.0
+    codes, scales = vectors.quantize_int8(m)
+    assert codes.dtype == np.int8 and scales.dtype == np.float32 and scales.shape == (50,)
+    assert np.abs(codes).max() == 127
+    assert np.allclose(codes * scales[:, None], m, atol=scales.max() / 2 + 1e-6)
+    assert not codes[3].any()
+
+
+def test_int8_scores_match_float_dot_products():
+    rng = np.random.default_rng(1)
+    m = rng.normal(size=(3000, 64)).astype(np.float32)
+    q = rng.normal(size=64).astype(np.float32)
+    codes, scales = vectors.quantize_int8(m)
+    exact = m @ q
+    approx = vectors.int8_scores(q, codes, scales, block=256)
+    assert np.allclose(approx, exact, atol=0.05 * np.abs(exact).max())
+    rows = np.array([5, 2999, 17])
+    assert np.allclose(vectors.int8_scores(q, codes, scales, rows), approx[rows])
+
+
+def test_int8_index_rescores_to_the_exact_top_k(tmp_path, monkeypatch):
+    rng = np.random.default_rng(2)
+    vecs = rng.normal(size=(2000, 48)).astype(np.float32)
+    ids = [f"dp{i}" for i in range(len(vecs))]
+    metas = {dp: {"domain": "hr"} for dp in ids}
+    exact = LocalIndex.build(ids, vecs, metas, kind="exact", quant="none")
+    int8 = LocalIndex.build(ids, vecs, metas, kind="exact", quant="int8")
+    assert int8.codes is not None and int8.codes.shape == vecs.shape
+
+    for qi in (0, 77, 1500):
+        q = vecs[qi] + 0.05
+        want = exact.search(q, 10)
+        got = int8.search(q, 10)
+        # The short list is re-scored from the stored vectors, so scores are exact too
+        assert [h[0] for h in got] == [h[0] for h in want]
+        assert np.allclose([h[1] for h in got], [h[1] for h in want])
+    assert [h[0] for h in int8.search(vecs[9], 5, domain="hr")] == [h[0] for h in exact.search(vecs[9], 5)]
+
+    monkeypatch.setattr("local_index.LOCAL_INDEX_QUANT", "int8")
+    int8.save(str(tmp_path), dtype="float16")
+    back = LocalIndex.load(str(tmp_path))
+    assert back.vectors.dtype == np.float16 and back.codes is not None
+    assert [h[0] for h in back.search(vecs[77], 3)][0] == "dp77"
@@ -0,0 +1,147 @@
+# api/server/tiering.py
+# Model tiering: answer on the cheap/fast tier by default, escalate to the top tier only
+# when the question needs it and the top tier can still meet the latency SLO.
+#
+# The planner decides the domain; DOMAIN_REGISTRY used to decide the model as well, so
+# "What's the hotel cap?" in finance paid gemini-2.5-pro latency. Here the model and
+# max_output_tokens come from:
+#   - query complexity   (length, analytical cues, multi-part / conditional questions)
+#   - retrieval          (how clearly the best chunk answers it, how many documents are involved)
+#   - the planner        (a route that already asked for the top model nudges the score up)
+#   - live health        (per-model p95 and recent error rate from resilience.py vs. TIER_SLO_MS)
+# The decision and its inputs are returned in the response's `route.tier`.
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+import resilience
+
+TIERING = os.getenv("TIERING", "1") == "1"
+TIER_BASE_MODEL = os.getenv("TIER_BASE_MODEL", "gemini-2.5-flash")
+TIER_TOP_MODEL = os.getenv("TIER_TOP_MODEL", "gemini-2.5-pro")
+TIER_ESCALATE = float(os.getenv("TIER_ESCALATE", "0.5"))          # score at which the top tier is used
+TIER_SLO_MS = float(os.getenv("TIER_SLO_MS", "8000"))             # generation p95 a tier must stay under
+TIER_MAX_ERROR_RATE = float(os.getenv("TIER_MAX_ERROR_RATE", "0.2"))
+TIER_PLANNER_PRIOR = float(os.getenv("TIER_PLANNER_PRIOR", "0.15"))
+# Output budgets; packing.context_budget scales the context with these too
+TIER_BRIEF_TOKENS = int(os.getenv("TIER_BRIEF_TOKENS", "512"))    # simple, well-grounded lookups
+TIER_BASE_TOKENS = int(os.getenv("TIER_BASE_TOKENS", "1024"))
+TIER_TOP_TOKENS = int(os.getenv("TIER_TOP_TOKENS", "1536"))
+
+# Score weights (they sum to 1 before the planner prior)
+W_COMPLEXITY, W_RETRIEVAL, W_SPREAD = 0.6, 0.25, 0.15
+
+tier_stats = {"base": 0, "brief": 0, "escalated": 0, "held_slo": 0, "held_errors": 0, "base_unhealthy": 0}
+
+# ---- Query complexity ----
+_CUES = ("compare", "comparison", "difference", "differ", "versus", " vs", "why", "explain", "analy",
+         "impact", "implication", "trade-off", "tradeoff", "pros and cons", "calculate", "estimate",
+         "scenario", "reconcile", "evaluate", "conflict", "exception", "justify", "recommend",
+         "step by step", "step-by-step", "what happens if", "how should")
+_CONDITIONS = re.compile(r"\b(if|unless|when|whether|but|except|both|either)\b")
+_NUMBERS = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def complexity(q: str) -> float:
+    """0 (one-line lookup) .. 1 (multi-part analytical question)."""
+    ql = " " + " ".join(q.lower().split())
+    words = len(ql.split())
+    score = 0.35 * min(1.0, max(0, words - 6) / 30)          # long questions carry more constraints
+    score += min(0.5, 0.25 * sum(1 for c in _CUES if c in ql))
+    score += min(0.2, 0.1 * len(_CONDITIONS.findall(ql)))
+    score += 0.15 * min(1, max(0, ql.count("?") - 1) + max(0, ql.count(" and ") - 1))
+    if len(_NUMBERS.findall(ql)) >= 2:                         # arithmetic over figures
+        score += 0.1
+    return min(1.0, score)
+
+
+# ---- Retrieval confidence ----
+def _similarity(chunk: Dict[str, Any]) -> Optional[float]:
+    # rerank = exact cosine; distance = DOT_PRODUCT score of the (normalized) ANN vectors
+    s = chunk.get("rerank", chunk.get("distance"))
+    return float(s) if isinstance(s, (int, float)) else None
+
+
+def retrieval_confidence(chunks: List[Dict[str, Any]]) -> Optional[float]:
+    """
+    How clearly the best chunk answers the question: its similarity, discounted when the
+    runner-up is about as good (the answer is spread over chunks). None without scores
+    (BM25-only hits) or without chunks.
+    """
+    sims = sorted((s for s in map(_similarity, chunks) if s is not None), reverse=True)
+    if not sims:
+        return None
+    top = max(0.0, min(1.0, sims[0]))
+    gap = sims[0] - sims[1] if len(sims) > 1 else 1.0
+    return top * (0.7 + 0.3 * min(1.0, gap / 0.1))
+
+
+def _spread(chunks: List[Dict[str, Any]]) -> float:
+    # Three or more distinct documents in the top chunks means synthesis, not lookup
+    docs = {c.get("doc_id") for c in chunks[:4] if c.get("doc_id")}
+    return min(1.0, max(0, len(docs) - 1) / 2)
+
+
+# ---- Live health ----
+def _health(model_id: str) -> Dict[str, Any]:
+    dep = resilience.generate(model_id)
+    return {"p95_ms": dep.p95_ms(), "error_rate": dep.error_rate(), "available": dep.available()}
+
+
+def _meets_slo(h: Dict[str, Any]) -> bool:
+    return h["p95_ms"] is None or h["p95_ms"] <= TIER_SLO_MS
+
+
+def _healthy(h: Dict[str, Any]) -> bool:
+    return h["available"] and h["error_rate"] <= TIER_MAX_ERROR_RATE
+
+
+def _unhealthy_reason(model_id: str, h: Dict[str, Any]) -> str:
+    return f"{model_id} breaker open" if not h["available"] else f"{model_id} error rate {h['error_rate']:.0%}"
+
+
+def choose(route: Dict[str, Any], q: str, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    The planner's `route` with model_id / max_output_tokens set by tier, plus a `tier`
+    entry explaining the decision. Off (TIERING=0) the registry route is returned as-is.
+    """
+    if not TIERING or not route:
+        return route
+    cx = complexity(q)
+    conf = retrieval_confidence(chunks)
+    spread = _spread(chunks)
+    # Nothing retrieved: the bigger model has nothing more to reason over
+    unsure = 0.0 if not chunks else (0.5 if conf is None else 1.0 - conf)
+    score = W_COMPLEXITY * cx + W_RETRIEVAL * unsure + W_SPREAD * spread
+    if route.get("model_id") == TIER_TOP_MODEL:
+        score += TIER_PLANNER_PRIOR
+    score = round(min(1.0, score), 3)
+
+    base, top = _health(TIER_BASE_MODEL), _health(TIER_TOP_MODEL)
+    escalate, reason = score >= TIER_ESCALATE, ""
+    if escalate and not _meets_slo(top):
+        escalate, reason = False, f"{TIER_TOP_MODEL} p95 {top['p95_ms']:.0f} ms over SLO"
+        tier_stats["held_slo"] += 1
+    elif escalate and not _healthy(top):
+        escalate, reason = False, _unhealthy_reason(TIER_TOP_MODEL, top)
+        tier_stats["held_errors"] += 1
+    elif not escalate and not _healthy(base) and _healthy(top) and _meets_slo(top):
+        escalate, reason = True, _unhealthy_reason(TIER_BASE_MODEL, base)
+        tier_stats["base_unhealthy"] += 1
+
+    if escalate:
+        model_id, max_tokens, name = TIER_TOP_MODEL, TIER_TOP_TOKENS, "top"
+        tier_stats["escalated"] += 1
+    elif score < TIER_ESCALATE / 2 and conf is not None and conf >= 0.5:
+        model_id, max_tokens, name = TIER_BASE_MODEL, TIER_BRIEF_TOKENS, "brief"
+        tier_stats["brief"] += 1
+    else:
+        model_id, max_tokens, name = TIER_BASE_MODEL, TIER_BASE_TOKENS, "base"
+        tier_stats["base"] += 1
+    if not reason:
+        reason = "escalated: complex or weakly grounded" if name == "top" else "base tier suffices"
+
+    return {**route, "model_id": model_id, "max_output_tokens": max_tokens,
+            "tier": {"name": name, "score": score, "complexity": round(cx, 3),
+                     "confidence": round(conf, 3) if conf is not None else None,
+                     "planned_model": route.get("model_id"), "reason": reason}}
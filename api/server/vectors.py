@@ -0,0 +1,90 @@
+# api/server/vectors.py
+# Compact embedding storage shared by the retriever, caches, rerank and ingestion.
+#
+# A text-embedding-004 vector as a Python list is 768 boxed floats (~25 KB). As a float32
+# array('f') it is one 3 KB buffer, 1.5 KB as float16 bytes, 768 B as int8 codes + a scale.
+# array('f') exposes the buffer protocol, so np.asarray(v) is a zero-copy view and batched
+# distance math runs in NumPy without per-element conversion; the hot path itself never
+# imports NumPy (only the local index, rerank and quantization below do, lazily).
+import os
+import sys
+import json
+import struct
+from array import array
+from typing import Any, Iterable, Tuple
+
+# Wire / disk format for vectors leaving the process (shared caches, local index files)
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")  # float32 | float16
+
+Vector = array  # array('f'): float32, contiguous
+
+_LITTLE = sys.byteorder == "little"
+
+
+def pack(values: Iterable[float]) -> Vector:
+    """float32 array('f') from a list, proto repeated field, ndarray or another array."""
+    if isinstance(values, array) and values.typecode == "f":
+        return values
+    if hasattr(values, "dtype") and hasattr(values, "astype"):  # ndarray: one buffer copy
+        out = array("f")
+        out.frombytes(values.astype("<f4", copy=False).tobytes())
+        return out
+    return array("f", values)
+
+
+def to_bytes(vec: Iterable[float], dtype: str = VECTOR_DTYPE) -> bytes:
+    """1-byte format tag + little-endian payload; float16 halves it again (~3 significant digits)."""
+    v = pack(vec)
+    if dtype == "float16":
+        return b"e" + struct.pack(f"<{len(v)}e", *v)
+    if not _LITTLE:
+        v = array("f", v)
+        v.byteswap()
+    return b"f" + v.tobytes()
+
+
+def from_bytes(blob: bytes) -> Vector:
+    tag, body = blob[:1], blob[1:]
+    if tag == b"e":
+        return array("f", struct.unpack(f"<{len(body) // 2}e", body))
+    if tag == b"f":
+        out = array("f")
+        out.frombytes(body)
+        if not _LITTLE:
+            out.byteswap()
+        return out
+    # Entries written before the compact format (JSON lists) still load
+    return pack(json.loads(blob))
+
+
+def to_json(vec: Iterable[float]) -> list:
+    """JSON-ready list for REST payloads; 8 significant digits are all a float32 carries."""
+    return [float(f"{x:.8g}") for x in vec]
+
+
+# ---- int8 quantization (NumPy) ----
+def quantize_int8(mat) -> Tuple[Any, Any]:
+    """Symmetric per-row int8: (codes int8 [N, D], scales float32 [N]) with row ~= codes * scale."""
+    import numpy as np
+    m = np.asarray(mat, dtype=np.float32)
+    scales = np.abs(m).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(m / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def int8_scores(q, codes, scales, rows=None, block: int = 1024):
+    """
+    Approximate dot products of q against int8 rows (optionally a subset `rows`). Upcasts in
+    small blocks: each 3 MB float32 block stays in cache, whereas upcasting the whole matrix
+    (or big blocks) is bound by memory bandwidth and ends up slower than a float32 scan.
+    """
+    import numpy as np
+    q = np.asarray(q, dtype=np.float32)
+    n = len(codes) if rows is None else len(rows)
+    out = np.empty(n, dtype=np.float32)
+    for start in range(0, n, block):
+        sel = slice(start, min(start + block, n))
+        part = codes[sel] if rows is None else codes[rows[sel]]
+        out[sel] = part.astype(np.float32) @ q
+    return out * (scales if rows is None else scales[rows])
@@ -15,13 +15,25 @@ export default function Console() {
   const [answer, setAnswer] = useState("")
   const [citations, setCitations] = useState<any[]>([])
   const [history, setHistory] = useState<{ q: string; a: string }[]>([])
+  const [timings, setTimings] = useState<{ name: string; dur: number }[]>([])
 
   // Replace with your backend base URL
   const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || "https://rag-api-589329822647.us-central1.run.app"
 
+  // "retrieve;dur=41.2, plan;dur=0.1, generate;dur=812.5, total;dur=860.3" → [{ name, dur }]
+  function parseServerTiming(header: string | null) {
+    if (!header) return []
+    return header.split(",").map((entry) => {
+      const [name, ...params] = entry.trim().split(";")
+      const dur = params.find((p) => p.trim().startsWith("dur="))
+      return { name, dur: dur ? Number(dur.trim().slice(4)) : 0 }
+    }).filter((t) => t.name)
+  }
+
   async function ask() {
     setAnswer("")
     setCitations([])
+    setTimings([])
     try {
       const res = await fetch(`${API_BASE_URL}/query`, {
         method: "POST",
@@ -40,6 +52,7 @@ export default function Console() {
       const data = await res.json()
       setAnswer(data.answer || "No answer returned.")
       setCitations(data.citations ?? [])
+      setTimings(parseServerTiming(res.headers.get("Server-Timing")))
       setHistory([{ q: query, a: data.answer || "" }, ...history])
     } catch (e: any) {
       setAnswer("Error: " + e.message)
@@ -138,6 +151,28 @@ export default function Console() {
                       <h3 className="font-medium text-emerald-300">Answer</h3>
                       <p className="mt-3 text-lg leading-relaxed text-gray-200">{answer}</p>
                     </div>
+                    {timings.length > 0 && (
+                      <div className="p-6 bg-gray-800/50 border border-emerald-700 rounded-xl">
+                        <h4 className="text-sm font-semibold text-emerald-400 mb-3">Latency breakdown</h4>
+                        <div className="space-y-2">
+                          {timings.map((t) => {
+                            const total = timings.find((x) => x.name === "total")?.dur || Math.max(...timings.map((x) => x.dur), 1)
+                            return (
+                              <div key={t.name} className="flex items-center gap-3 text-xs text-gray-300">
+                                <span className="w-24 shrink-0 font-mono">{t.name}</span>
+                                <div className="flex-grow h-2 bg-black/40 rounded">
+                                  <div
+                                    className="h-2 rounded bg-gradient-to-r from-emerald-500 to-teal-400"
+                                    style={{ width: `${Math.min(100, (t.dur / total) * 100)}%` }}
+                                  />
+                                </div>
+                                <span className="w-20 shrink-0 text-right font-mono">{t.dur.toFixed(1)} ms</span>
+                              </div>
+                            )
+                          })}
+                        </div>
+                      </div>
+                    )}
                     {citations.length > 0 && (
                       <div className="p-6 bg-gray-800/50 border border-emerald-700 rounded-xl">
                         <h4 className="text-sm font-semibold text-emerald-400 mb-2">Citations</h4>